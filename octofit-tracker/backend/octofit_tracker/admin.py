@@ -1,5 +1,8 @@
 from django.contrib import admin
-from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
+from octofit_tracker.aggregates import record_activity_changes, user_team
+from octofit_tracker.models import (
+    Job, User, Team, Activity, ActivityRollup, Leaderboard, UserActivityStats, UserScore, Workout
+)
 
 
 @admin.register(User)
@@ -17,15 +20,54 @@ class TeamAdmin(admin.ModelAdmin):
 
 @admin.register(Activity)
 class ActivityAdmin(admin.ModelAdmin):
-    list_display = ('activity_type', 'user_id', 'duration', 'calories', 'created_at')
+    """Edits go through the change recorder like the API's, keeping the aggregates in step."""
+    list_display = ('activity_type', 'user_id', 'team_id', 'duration', 'calories', 'created_at')
     search_fields = ('activity_type', 'user_id')
     list_filter = ('activity_type',)
+    # Tagged with the user's team on save, as by the API
+    readonly_fields = ('team_id',)
+
+    def save_model(self, request, obj, form, change):
+        previous = [Activity.objects.get(pk=obj.pk)] if change else []
+        obj.team_id = user_team(obj.user_id)
+        super().save_model(request, obj, form, change)
+        record_activity_changes(removed=previous, added=[obj])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        record_activity_changes(removed=[obj])
+
+    def delete_queryset(self, request, queryset):
+        activities = list(queryset)
+        super().delete_queryset(request, queryset)
+        record_activity_changes(removed=activities)
 
 
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
-    list_display = ('team_id', 'rank', 'total_calories', 'total_activities', 'updated_at')
-    ordering = ('rank',)
+    list_display = ('team_id', 'total_calories', 'total_activities', 'updated_at')
+    ordering = ('-total_calories',)
+
+
+@admin.register(ActivityRollup)
+class ActivityRollupAdmin(admin.ModelAdmin):
+    list_display = ('scope', 'owner_id', 'day', 'total_calories', 'total_activities')
+    list_filter = ('scope',)
+    ordering = ('-day',)
+
+
+@admin.register(UserActivityStats)
+class UserActivityStatsAdmin(admin.ModelAdmin):
+    list_display = ('user_id', 'activity_type', 'total_activities', 'total_minutes', 'total_calories', 'total_distance')
+    search_fields = ('user_id',)
+    list_filter = ('activity_type',)
+
+
+@admin.register(UserScore)
+class UserScoreAdmin(admin.ModelAdmin):
+    list_display = ('user_id', 'total_calories', 'total_activities')
+    search_fields = ('user_id',)
+    ordering = ('-total_calories',)
 
 
 @admin.register(Workout)
@@ -33,3 +75,10 @@ class WorkoutAdmin(admin.ModelAdmin):
     list_display = ('name', 'difficulty', 'duration', 'calories_estimate', 'category', 'created_at')
     search_fields = ('name', 'category')
     list_filter = ('difficulty', 'category')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'arguments', 'status', 'attempts', 'progress_done', 'progress_total', 'run_after', 'worker')
+    list_filter = ('status', 'name')
+    ordering = ('-created_at',)
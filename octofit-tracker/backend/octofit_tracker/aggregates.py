@@ -0,0 +1,132 @@
+"""Keeps the maintained aggregates in step with Activity writes.
+
+Every code path that writes activities reports what it removed and what it
+added through :func:`record_activity_changes`, so the aggregates never need a
+full rescan of the activities collection.
+"""
+from collections import defaultdict
+
+from octofit_tracker import jobs, leaderboard, live, rollups, user_ranking, user_stats, versioning
+from octofit_tracker.models import Activity, ActivityRollup, User
+
+
+class ActivityChanges:
+    """Accumulates the aggregate deltas of a batch of activity writes.
+
+    Collect removed and added activities as the batch is processed, then call
+    :meth:`apply` once so each aggregate row is touched once per batch.
+    """
+
+    def __init__(self):
+        self.team_deltas = defaultdict(lambda: [0, 0])
+        self.rollup_deltas = defaultdict(lambda: [0, 0])
+        self.stats_deltas = defaultdict(lambda: [0, 0, 0, 0])
+        self.user_deltas = defaultdict(lambda: [0, 0])
+
+    def removed(self, activities):
+        self._collect(activities, -1)
+
+    def added(self, activities):
+        self._collect(activities, 1)
+
+    def _collect(self, activities, sign):
+        for activity in activities:
+            day = rollups.activity_day(activity)
+            deltas = [
+                self.user_deltas[str(activity.user_id)],
+                self.rollup_deltas[(ActivityRollup.USER, str(activity.user_id), day)],
+            ]
+            # Credited to the team the activity is tagged with, so removing it
+            # takes it from the same team that was credited when it was added.
+            team_id = activity.team_id
+            if team_id:
+                deltas += [self.team_deltas[team_id], self.rollup_deltas[(ActivityRollup.TEAM, team_id, day)]]
+            for delta in deltas:
+                delta[0] += sign * activity.calories
+                delta[1] += sign
+            stats = self.stats_deltas[(str(activity.user_id), activity.activity_type)]
+            for position, value in enumerate(user_stats.activity_counters(activity)):
+                stats[position] += sign * value
+
+    def apply(self):
+        changed = ['activities'] if self.stats_deltas else []
+        if self.team_deltas or any(scope == ActivityRollup.TEAM for scope, _, _ in self.rollup_deltas):
+            changed.append('leaderboard')
+        leaderboard.apply_team_deltas(self.team_deltas)
+        rollups.apply_deltas(self.rollup_deltas)
+        user_stats.apply_deltas(self.stats_deltas)
+        user_ranking.apply_deltas(self.user_deltas)
+        self.team_deltas.clear()
+        self.rollup_deltas.clear()
+        self.stats_deltas.clear()
+        self.user_deltas.clear()
+        versioning.bump(*changed)
+        if 'leaderboard' in changed:
+            live.leaderboard_changed()
+
+
+def record_activity_changes(removed=(), added=()):
+    """Apply the effect of removing ``removed`` and adding ``added`` activities.
+
+    An update is reported as the old version removed and the new one added.
+    """
+    changes = ActivityChanges()
+    changes.removed(removed)
+    changes.added(added)
+    changes.apply()
+
+
+def assign_teams(activities):
+    """Tag unsaved activities with their users' current teams; returns them as a list."""
+    activities = list(activities)
+    teams = user_teams(activity.user_id for activity in activities)
+    for activity in activities:
+        activity.team_id = teams.get(str(activity.user_id))
+    return activities
+
+
+def user_team(user_id):
+    return user_teams([user_id]).get(str(user_id))
+
+
+def retag_activities(user_id, batch_size=1000):
+    """Move a user's activities to their current team, with the aggregates.
+
+    Queued as a job when a user changes team. Activities already tagged
+    with the current team are left alone, so running it again is harmless.
+    """
+    user_id = str(user_id)
+    team_id = user_team(user_id)
+    activities = Activity.objects.filter(user_id=user_id).order_by('id')
+    last_pk, done = None, 0
+    while True:
+        batch = activities if last_pk is None else activities.filter(id__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        done += len(batch)
+        jobs.progress(done)
+        stale = [activity for activity in batch if activity.team_id != team_id]
+        if not stale:
+            continue
+        changes = ActivityChanges()
+        changes.removed(stale)
+        Activity.objects.filter(id__in=[activity.pk for activity in stale]).update(team_id=team_id)
+        for activity in stale:
+            activity.team_id = team_id
+        changes.added(stale)
+        changes.apply()
+
+
+def user_teams(user_ids):
+    """Map each user id (as stored on ``Activity.user_id``) to its team id."""
+    ids = {str(user_id) for user_id in user_ids}
+    lookup = [user_id for user_id in ids if user_id.isdigit()]
+    if not lookup:
+        return {}
+    return {
+        str(pk): team_id
+        for pk, team_id in User.objects.filter(id__in=lookup).values_list('id', 'team_id')
+        if team_id
+    }
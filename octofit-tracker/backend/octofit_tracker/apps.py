@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class OctofitTrackerConfig(AppConfig):
+    name = 'octofit_tracker'
+
+    def ready(self):
+        from pymongo import monitoring
+        from octofit_tracker import signals  # noqa: F401
+        from octofit_tracker.metrics import MongoCommandListener
+
+        # Must be registered before djongo creates its MongoClient
+        monitoring.register(MongoCommandListener())
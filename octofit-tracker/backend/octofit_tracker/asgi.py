@@ -9,8 +9,55 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
+# Serve the read endpoints from coroutines, see octofit_tracker.async_reads
+os.environ.setdefault('OCTOFIT_ASYNC_READS', '1')
 
-application = get_asgi_application()
+
+class StreamingASGIHandler(ASGIHandler):
+    """Django's handler, producing streaming bodies off the event loop.
+
+    Django 4.1 iterates a streaming response on the event loop, where the
+    queries of a lazy body such as the activity export are refused. Each
+    part is pulled on the request's thread instead, one at a time, so the
+    body still goes out as it is read.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [
+            (header.encode('ascii') if isinstance(header, str) else header,
+             value.encode('latin1') if isinstance(value, str) else value)
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip()) for cookie in response.cookies.values()
+        )
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while (part := await next_part(parts, None)) is not None:
+            for chunk, _ in self.chunk_bytes(part):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+# What django.core.asgi.get_asgi_application() does, with the handler above
+django.setup(set_prefix=False)
+django_application = StreamingASGIHandler()
+
+from octofit_tracker import live  # noqa: E402  (needs the apps loaded above)
+
+
+async def application(scope, receive, send):
+    # The live leaderboard is streamed outside Django's request cycle, so an
+    # open stream holds no worker thread; see octofit_tracker.live.
+    if scope['type'] == 'http' and scope['path'] == live.LIVE_PATH:
+        return await live.leaderboard_events(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,77 @@
+"""Serves read routes from coroutines when running under ASGI.
+
+The DRF viewsets stay synchronous. Under ASGI their list routes are wrapped
+in coroutines that run the whole view (queries, serialization and rendering)
+of a read request on a bounded thread pool. The event loop then only holds the connections, so
+thousands of slow clients cost sockets rather than threads, while at most
+``OCTOFIT_ASYNC_READ_THREADS`` requests hit the database at once.
+
+Django would otherwise run every sync view on the single thread it reserves
+for thread-sensitive code, serializing all requests of the worker.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.permissions import SAFE_METHODS
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    # Created on first use, so WSGI workers and forked processes never start it.
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.OCTOFIT_ASYNC_READ_THREADS, thread_name_prefix='octofit-read'
+            )
+        return _executor
+
+
+def async_read(view):
+    """Wrap a sync view in a coroutine that runs it on the read pool.
+
+    Only reads are offloaded. Writes to the same route run where Django runs
+    any sync view, on its thread for thread-sensitive code.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return await sync_to_async(view)(request, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        # run_in_executor does not carry context variables over (unlike
+        # sync_to_async), so pass them explicitly for the request metrics.
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            get_executor(), partial(context.run, _run_view, view, request, args, kwargs)
+        )
+
+    return wrapper
+
+
+def _run_view(view, request, args, kwargs):
+    # Pool threads outlive requests, so apply the per-request connection
+    # lifecycle Django's handlers give their own thread.
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def offload(patterns, names):
+    """Wrap the views of the URL patterns named in ``names``; returns ``patterns``."""
+    for pattern in patterns:
+        if getattr(pattern, 'name', None) in names:
+            pattern.callback = async_read(pattern.callback)
+    return patterns
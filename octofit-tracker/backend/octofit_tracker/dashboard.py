@@ -0,0 +1,144 @@
+"""The data behind the web app's pages in one response, ``GET /api/dashboard/``.
+
+Each section is the first ``limit`` items of the matching list endpoint, in
+that endpoint's order and representation. The sections are fetched
+concurrently, one per thread of a small pool, then rendered through the
+serializers' field plans with lookups shared between them: team names are
+resolved once for every section, taking the names already read by the teams
+section, and returned as ``team_names`` so clients need not fetch the teams
+just to label users.
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.exceptions import ValidationError
+
+from octofit_tracker import leaderboard
+from octofit_tracker.fastpath import field_plan
+from octofit_tracker.models import Activity, Leaderboard, Team, User, Workout
+from octofit_tracker.pagination import ActivityCursorPagination, UserCursorPagination
+from octofit_tracker.serializers import (
+    ActivitySerializer,
+    LeaderboardSerializer,
+    TeamSerializer,
+    UserSerializer,
+    WorkoutSerializer,
+    members_counts,
+)
+from octofit_tracker.team_names import get_team_names
+
+# name -> (queryset in the list endpoint's order, serializer class)
+SECTIONS = {
+    'users': (User.objects.order_by(*UserCursorPagination.ordering), UserSerializer),
+    'teams': (Team.objects.order_by('id'), TeamSerializer),
+    'activities': (Activity.objects.order_by(*ActivityCursorPagination.ordering), ActivitySerializer),
+    'leaderboard': (Leaderboard.objects.order_by(*leaderboard.ORDERING), LeaderboardSerializer),
+    'workouts': (Workout.objects.order_by('id'), WorkoutSerializer),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    # A pool of its own: the dashboard view may itself run on the read pool
+    # of async_reads, and waiting there on tasks queued behind it could
+    # exhaust that pool.
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.OCTOFIT_DASHBOARD_THREADS, thread_name_prefix='octofit-dashboard'
+            )
+        return _executor
+
+
+def requested_sections(params):
+    """The sections named by ``?include=`` in response order, every section by default."""
+    value = params.get('include')
+    if not value:
+        return list(SECTIONS)
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = names.difference(SECTIONS)
+    if unknown:
+        raise ValidationError({
+            'include': [f"Unknown section(s): {', '.join(sorted(unknown))}. Choose from: {', '.join(SECTIONS)}."]
+        })
+    return [name for name in SECTIONS if name in names]
+
+
+def requested_limit(params):
+    value = params.get('limit')
+    if not value:
+        return settings.OCTOFIT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= settings.OCTOFIT_MAX_PAGE_SIZE:
+        raise ValidationError({'limit': [f'Must be a whole number from 1 to {settings.OCTOFIT_MAX_PAGE_SIZE}.']})
+    return limit
+
+
+def build(sections, limit):
+    """Return the dashboard data of ``sections``, at most ``limit`` items each."""
+    fetched = dict(zip(sections, run_concurrently([partial(fetch, name, limit) for name in sections])))
+    team_names = shared_team_names(fetched)
+    data = {}
+    for name, (rows, context) in fetched.items():
+        data[name] = field_plan(SECTIONS[name][1]).render(rows, {**context, 'team_names': team_names})
+    data['team_names'] = team_names
+    return data
+
+
+def fetch(name, limit):
+    """Read one section's rows, and the lookups only it needs, as ``(rows, context)``."""
+    queryset, serializer_class = SECTIONS[name]
+    rows = list(queryset.values(*field_plan(serializer_class).columns)[:limit])
+    if name == 'teams':
+        # Counted here, on the section's own thread, rather than while rendering
+        return rows, {'members_counts': members_counts(row['id'] for row in rows)}
+    return rows, {}
+
+
+def shared_team_names(fetched):
+    """``{team_id: name}`` for every team the sections show or refer to, in at most one lookup."""
+    rows, _ = fetched.get('teams', ([], None))
+    names = {str(row['id']): row['name'] for row in rows}
+    referenced = {
+        str(row['team_id'])
+        for name in ('users', 'activities', 'leaderboard') if name in fetched
+        for row in fetched[name][0] if row.get('team_id')
+    }
+    missing = referenced.difference(names)
+    if missing:
+        names.update(get_team_names(missing))
+    return names
+
+
+def run_concurrently(calls):
+    """Call each zero-argument function on the dashboard pool; returns the results in order.
+
+    With ``OCTOFIT_DASHBOARD_THREADS`` at 0 they run one after another in
+    the calling thread instead, which keeps the test suite inside its
+    transaction.
+    """
+    if not settings.OCTOFIT_DASHBOARD_THREADS:
+        return [call() for call in calls]
+    executor = get_executor()
+    # Each task gets its own copy of the context so the request metrics count its queries.
+    futures = [executor.submit(contextvars.copy_context().run, _run_task, call) for call in calls]
+    return [future.result() for future in futures]
+
+
+def _run_task(call):
+    # Pool threads outlive requests, see async_reads._run_view
+    close_old_connections()
+    try:
+        return call()
+    finally:
+        close_old_connections()
@@ -0,0 +1,54 @@
+"""Streaming exports that keep memory flat regardless of the number of rows.
+
+Rows are read from a server-side cursor in chunks and encoded into chunked
+response bodies, so neither the queryset nor the output is ever held in full.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+# team_id last, so the columns of earlier exports keep their positions
+ACTIVITY_FIELDS = (
+    'id', 'user_id', 'activity_type', 'duration', 'calories', 'distance', 'notes', 'created_at', 'team_id',
+)
+CHUNK_SIZE = 2000
+
+
+def activity_rows(queryset):
+    rows = queryset.order_by('created_at', 'id').values_list(*ACTIVITY_FIELDS)
+    return rows.iterator(chunk_size=CHUNK_SIZE)
+
+
+def csv_stream(rows, header=ACTIVITY_FIELDS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(_plain(value) for value in row)
+        if count % CHUNK_SIZE == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def ndjson_stream(rows, header=ACTIVITY_FIELDS):
+    buffer = io.StringIO()
+    for count, row in enumerate(rows, start=1):
+        buffer.write(json.dumps({name: _plain(value) for name, value in zip(header, row)}))
+        buffer.write('\n')
+        if count % CHUNK_SIZE == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _drain(buffer):
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk.encode()
@@ -0,0 +1,69 @@
+"""Read-only list serialization without the per-field ModelSerializer machinery.
+
+A ``FieldPlan`` is compiled once per serializer class. It lists the database
+columns the serializer needs and the few conversions the values require
+(date and time formatting), so list GETs can fetch plain ``values()``
+rows and turn them into the exact output of the serializer at a fraction of
+the CPU cost.
+
+A plan may be restricted to a subset of the serializer's fields (the
+``?fields=`` sparse fieldsets); its columns then shrink to what those fields
+need, so the projection reaches the database as well.
+"""
+from functools import lru_cache
+
+from rest_framework import serializers
+
+
+class FieldPlan:
+    # DRF fields whose representation differs from the value read from the database
+    CONVERTED = (serializers.DateTimeField, serializers.DateField, serializers.TimeField, serializers.DecimalField)
+
+    def __init__(self, serializer_class, fields=None):
+        self.serializer_class = serializer_class
+        self.fields = []  # (output name, column), in serializer order; column is None for method fields
+        self.columns = []  # database columns to fetch
+        self.converters = []  # (output name, function) for values that need conversion
+        self.method_fields = []
+        method_field_columns = getattr(serializer_class, 'method_field_columns', {})
+        for name, field in serializer_class().fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                self.fields.append((name, None))
+                self.method_fields.append(name)
+                self.columns.extend(method_field_columns.get(name, ()))
+                continue
+            self.fields.append((name, field.source))
+            self.columns.append(field.source)
+            if isinstance(field, self.CONVERTED):
+                self.converters.append((name, field.to_representation))
+        self.columns = list(dict.fromkeys(self.columns))
+
+    def render(self, rows, context=None):
+        """Convert ``values(*plan.columns)`` rows to the serializer's representation.
+
+        Rows may carry extra columns (such as a pagination ordering key); only
+        the plan's fields are rendered. ``context`` may hand the method fields
+        lookups made in advance, such as ``team_names``.
+        """
+        fields, converters = self.fields, self.converters
+        if self.method_fields:
+            rows = list(rows)
+            items = [{name: row[column] if column else None for name, column in fields} for row in rows]
+        else:
+            items = [{name: row[column] for name, column in fields} for row in rows]
+        for item in items:
+            for name, convert in converters:
+                value = item[name]
+                if value is not None:
+                    item[name] = convert(value)
+        if self.method_fields:
+            self.serializer_class.fill_method_fields(rows, items, context or {})
+        return items
+
+
+@lru_cache(maxsize=None)
+def field_plan(serializer_class, fields=None):
+    """Return the cached plan of ``serializer_class``, restricted to the ``fields`` frozenset if given."""
+    return FieldPlan(serializer_class, fields)
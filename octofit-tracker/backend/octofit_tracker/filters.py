@@ -0,0 +1,103 @@
+"""Server-side filtering and ordering of activities, limited to indexed queries.
+
+Each filter maps onto one of the indexes declared on ``Activity``:
+
+* ``user_id``: ``activities_user_created_idx``
+* ``team_id`` (the team the activity is tagged with): ``activities_team_created_idx``
+* ``activity_type``: ``activities_type_created_idx``
+* ``from`` / ``to`` (``created_at`` range): ``activities_created_idx``
+
+``user_id``, ``team_id`` and ``activity_type`` take comma-separated lists. The
+``min_``/``max_`` bounds on ``calories`` and ``duration`` have no index; they
+are applied to the documents an indexed filter selected and are rejected on
+their own, as they would scan the whole collection.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+RESIDUAL_FILTERS = ('min_calories', 'max_calories', 'min_duration', 'max_duration')
+
+
+def filter_activities(queryset, params):
+    """Apply the activity filters in ``params`` to ``queryset``."""
+    indexed = False
+    for name in ('user_id', 'team_id'):
+        values = _list(params, name)
+        if values:
+            queryset = queryset.filter(**{f'{name}__in': values})
+            indexed = True
+    activity_types = _list(params, 'activity_type')
+    if activity_types:
+        queryset = queryset.filter(activity_type__in=activity_types)
+        indexed = True
+    if params.get('from'):
+        queryset = queryset.filter(created_at__gte=_parse_bound('from', params['from']))
+        indexed = True
+    if params.get('to'):
+        value = params['to']
+        bound = _parse_bound('to', value)
+        if parse_date(value) is not None:
+            # A bare date includes the whole day
+            queryset = queryset.filter(created_at__lt=bound + timedelta(days=1))
+        else:
+            queryset = queryset.filter(created_at__lte=bound)
+        indexed = True
+
+    residual = {name: _parse_int(name, params[name]) for name in RESIDUAL_FILTERS if params.get(name)}
+    if residual and not indexed:
+        raise ValidationError({
+            name: ['Combine with user_id, team_id, activity_type, from or to; it cannot use an index on its own.']
+            for name in residual
+        })
+    for name, value in residual.items():
+        bound, field = name.split('_', 1)
+        queryset = queryset.filter(**{f"{field}__{'gte' if bound == 'min' else 'lte'}": value})
+    return queryset
+
+
+def _list(params, name):
+    return [value.strip() for value in params.get(name, '').split(',') if value.strip()]
+
+
+def _parse_int(name, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: ['A whole number is required.']})
+
+
+def _parse_bound(name, value):
+    # parse_datetime() also accepts bare dates, so try those first
+    day = parse_date(value)
+    parsed = datetime.combine(day, time.min) if day is not None else parse_datetime(value)
+    if parsed is None:
+        raise ValidationError({name: ['Expected an ISO 8601 date or datetime.']})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class ActivityFilter(BaseFilterBackend):
+    """Filters the activities list by the query parameters described in this module."""
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_activities(queryset, request.query_params)
+
+
+class IndexedOrderingFilter(OrderingFilter):
+    """
+    ``?ordering=`` limited to ``ordering_fields``, the fields an index sorts
+    by. ``id`` is appended in the same direction, so the cursor paginator
+    always has a unique ordering.
+    """
+    ordering_fields = ['created_at']
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        if ordering and ordering[-1].lstrip('-') != 'id':
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return ordering
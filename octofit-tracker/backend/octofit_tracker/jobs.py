@@ -0,0 +1,206 @@
+"""A job queue kept in the database, worked off by ``manage.py run_workers``.
+
+:func:`enqueue` stores a call of one of the :data:`TASKS` as a ``Job`` row,
+in the caller's transaction, so the job exists exactly when the write that
+asked for it does. An identical job still pending absorbs the new one. Every
+task must be idempotent: a job whose worker dies is run again.
+
+Workers claim the oldest due job with a compare-and-set on its status, so
+any number of processes can share the queue. A failing job is retried after
+``OCTOFIT_JOB_RETRY_DELAY`` seconds, doubled on each attempt, until
+``max_attempts`` runs failed. Tasks report progress with :func:`progress`,
+while a thread of the worker refreshes the job's heartbeat every quarter of
+``OCTOFIT_JOB_TIMEOUT``. A running job whose heartbeat is older than that,
+as its worker died, is handed to another worker by the next sweep, which
+each worker runs every ``OCTOFIT_JOB_REQUEUE_INTERVAL`` seconds.
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from octofit_tracker import pipelines, versioning
+from octofit_tracker.models import Job
+
+logger = logging.getLogger(__name__)
+
+# Task name -> (dotted path of the function a job of that name calls,
+# collections whose cached responses it invalidates once done). The
+# rebuilds write their tables directly, without bumping versions.
+TASKS = {
+    'rebuild_leaderboard': ('octofit_tracker.leaderboard.rebuild', ('leaderboard',)),
+    'rebuild_rollups': ('octofit_tracker.rollups.rebuild', ('leaderboard',)),
+    'rebuild_user_ranking': ('octofit_tracker.user_ranking.rebuild', ('activities',)),
+    'rebuild_user_stats': ('octofit_tracker.user_stats.rebuild', ('users',)),
+    'retag_activities': ('octofit_tracker.aggregates.retag_activities', ()),
+}
+
+# Seconds between two progress writes of one job
+PROGRESS_INTERVAL = 1.0
+
+_current = ContextVar('octofit_job', default=None)
+
+
+def enqueue(name, *args):
+    """Queue ``name(*args)``; returns the new job, or the identical one already pending."""
+    if name not in TASKS:
+        raise ValueError(f'Unknown task {name!r}')
+    arguments = json.dumps(args)
+    dedupe_key = hashlib.sha1(f'{name}:{arguments}'.encode()).hexdigest()
+    # Best effort: two writers enqueueing at the same instant may both
+    # create the job, which then merely runs twice.
+    job = Job.objects.filter(dedupe_key=dedupe_key, status=Job.PENDING).first()
+    if job is not None:
+        return job
+    return Job.objects.create(
+        name=name, arguments=arguments, dedupe_key=dedupe_key, max_attempts=settings.OCTOFIT_JOB_MAX_ATTEMPTS
+    )
+
+
+def claim(worker):
+    """Mark the oldest due pending job as run by ``worker`` and return it, or None."""
+    if pipelines.native():
+        return _claim_native(worker)
+    due = Job.objects.filter(status=Job.PENDING, run_after__lte=timezone.now()).order_by('run_after', 'id')
+    while (job := due.first()) is not None:
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job.pk, status=Job.PENDING).update(
+            status=Job.RUNNING, worker=worker, attempts=F('attempts') + 1, started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            job.status, job.worker, job.started_at, job.heartbeat_at = Job.RUNNING, worker, now, now
+            job.attempts += 1
+            return job
+        # Another worker claimed it first
+    return None
+
+
+def _claim_native(worker):
+    # djongo cannot translate the attempts increment; find_one_and_update
+    # picks the oldest due job and claims it in one atomic step instead.
+    now = timezone.now()
+    claimed = pipelines.collection(Job).find_one_and_update(
+        {'status': Job.PENDING, 'run_after': {'$lte': now}},
+        {
+            '$inc': {'attempts': 1},
+            '$set': {'status': Job.RUNNING, 'worker': worker, 'started_at': now, 'heartbeat_at': now},
+        },
+        sort=[('run_after', 1), ('id', 1)],
+        projection={'id': True},
+    )
+    return None if claimed is None else Job.objects.get(pk=claimed['id'])
+
+
+def run(job):
+    """Run a claimed job and record the outcome; returns whether it succeeded."""
+    path, collections = TASKS[job.name]
+    job._progress_reported = 0.0
+    token = _current.set(job)
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_beat, args=(job, stop), name=f'octofit-heartbeat-{job.pk}', daemon=True)
+    heartbeat.start()
+    try:
+        import_string(path)(*json.loads(job.arguments))
+    except Exception as error:
+        logger.exception('Job %s (%s) failed', job.pk, job.name)
+        _failed(job, f'{type(error).__name__}: {error}')
+        return False
+    finally:
+        stop.set()
+        heartbeat.join()
+        _current.reset(token)
+    versioning.bump(*collections)
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished_at=timezone.now(), error='')
+    return True
+
+
+def _beat(job, stop):
+    # Keeps the job of a live worker from being handed to another one, also
+    # while its task goes long between progress reports
+    try:
+        while not stop.wait(settings.OCTOFIT_JOB_TIMEOUT / 4):
+            Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker).update(heartbeat_at=timezone.now())
+    finally:
+        # This thread's own connection
+        connections.close_all()
+
+
+def _failed(job, error):
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        delay = timedelta(seconds=settings.OCTOFIT_JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+        Job.objects.filter(pk=job.pk).update(status=Job.PENDING, run_after=now + delay, worker='', error=error)
+    else:
+        Job.objects.filter(pk=job.pk).update(status=Job.FAILED, finished_at=now, error=error)
+
+
+def progress(done, total=None):
+    """Report that the running job did ``done`` of ``total`` units; a no-op outside a job.
+
+    Writes are throttled to one per ``PROGRESS_INTERVAL`` seconds, so tasks
+    may call this once per batch of any size.
+    """
+    job = _current.get()
+    if job is None:
+        return
+    now = time.monotonic()
+    if now - job._progress_reported < PROGRESS_INTERVAL and (total is None or done < total):
+        return
+    job._progress_reported = now
+    Job.objects.filter(pk=job.pk).update(progress_done=done, progress_total=total, heartbeat_at=timezone.now())
+
+
+def requeue_stale():
+    """Hand running jobs whose worker went silent to the next worker, or fail them when out of attempts."""
+    cutoff = timezone.now() - timedelta(seconds=settings.OCTOFIT_JOB_TIMEOUT)
+    for job in Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff):
+        # Guarded on the heartbeat, in case the worker reported in meanwhile
+        rows = Job.objects.filter(pk=job.pk, status=Job.RUNNING, heartbeat_at=job.heartbeat_at)
+        if job.attempts < job.max_attempts:
+            rows.update(status=Job.PENDING, worker='', error='The worker stopped responding')
+        else:
+            rows.update(status=Job.FAILED, finished_at=timezone.now(), error='The worker stopped responding')
+
+
+def worker_name(number):
+    return f'{socket.gethostname()}:{os.getpid()}:{number}'
+
+
+def work(worker, burst=False, report=None):
+    """Run jobs until interrupted, or until none is due when ``burst``; returns how many ran.
+
+    ``report`` is called with a line of text as each job finishes.
+    """
+    count = 0
+    next_requeue = time.monotonic()
+    while True:
+        # Workers are long-lived; give them the per-request connection lifecycle
+        close_old_connections()
+        # On a timer, so stale jobs are taken over even while every worker is busy
+        if time.monotonic() >= next_requeue:
+            requeue_stale()
+            next_requeue = time.monotonic() + settings.OCTOFIT_JOB_REQUEUE_INTERVAL
+        job = claim(worker)
+        if job is None:
+            if burst:
+                return count
+            time.sleep(settings.OCTOFIT_JOB_POLL_INTERVAL)
+            continue
+        started = time.perf_counter()
+        succeeded = run(job)
+        count += 1
+        if report is not None:
+            outcome = 'done' if succeeded else f'failed (attempt {job.attempts} of {job.max_attempts})'
+            report(f'{worker}: job {job.pk} {job.name}{job.arguments} {outcome} '
+                   f'in {time.perf_counter() - started:.1f}s')
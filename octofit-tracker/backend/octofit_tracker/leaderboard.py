@@ -0,0 +1,49 @@
+"""Maintenance of the team leaderboard.
+
+Each entry holds a team's all-time totals, updated with an atomic increment
+per activity write. Ranks are not stored: a team's rank is one plus the
+number of teams with strictly more calories (standard competition ranking),
+derived when the leaderboard is read, so concurrent writes to different
+teams can never leave them inconsistent. ``leaderboard_calories_idx``
+serves both the ordering and the count.
+"""
+from octofit_tracker import jobs, pipelines
+from octofit_tracker.models import Leaderboard
+from octofit_tracker.rollups import increment_or_create
+
+# Rank order, ties by entry id; leaderboard_calories_idx read backwards
+ORDERING = ('-total_calories', 'id')
+
+
+def apply_team_deltas(deltas):
+    """Apply ``{team_id: (calories_delta, activities_delta)}`` to the leaderboard."""
+    for team_id, (calories, activities) in deltas.items():
+        if calories or activities:
+            increment_or_create(
+                Leaderboard, {'team_id': str(team_id)}, {'total_calories': calories, 'total_activities': activities}
+            )
+
+
+def ranks(totals):
+    """Competition ranks of the entries with ``totals`` calories, read in :data:`ORDERING` from the top."""
+    ranked = []
+    for position, total in enumerate(totals):
+        ranked.append(ranked[-1] if position and total == totals[position - 1] else position + 1)
+    return ranked
+
+
+def rebuild():
+    """Recompute every leaderboard row from the activities collection.
+
+    Only needed for seeding and repair; regular writes go through
+    :func:`apply_team_deltas`.
+    """
+    entries = ranked_entries(pipelines.team_totals())
+    # Merged rather than replaced, as activity writes may go on meanwhile
+    pipelines.merge_rows(Leaderboard, ['team_id'], entries, report=jobs.progress)
+    return entries
+
+
+def ranked_entries(totals):
+    """Build unsaved, ranked entries from ``{team_id: (calories, activities)}``."""
+    return [Leaderboard(**row) for row in pipelines.rank(totals)]
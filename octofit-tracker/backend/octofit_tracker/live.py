@@ -0,0 +1,245 @@
+"""Live leaderboard updates pushed over Server-Sent Events.
+
+``GET /api/leaderboard/live/`` is served by :func:`leaderboard_events`, a
+plain ASGI app that ``asgi.py`` mounts ahead of Django, so an open stream
+costs a coroutine and a small queue rather than a worker thread. A stream
+opens with a ``snapshot`` event holding the leaderboard as
+``/api/leaderboard/`` renders it, followed by ``diff`` events listing the
+entries that changed (``updated``) and the ids of those that left
+(``removed``).
+
+Activity writes that move team totals call :func:`leaderboard_changed`,
+which publishes a notification through the configured backend once the
+transaction commits. Each process's :class:`Broker` coalesces these: the
+first notification schedules a single read of the leaderboard
+``OCTOFIT_LIVE_INTERVAL`` seconds later and the ones arriving meanwhile
+ride along, so a burst of writes costs one read and one broadcast per
+interval, however many clients listen.
+
+The backend (``OCTOFIT_LIVE_BACKEND``) carries notifications between
+processes. :class:`LocalBackend` reaches the current process only, which
+covers a single ASGI worker and the tests; with several workers, plug in a
+backend with the same two methods over a shared bus such as Redis pub/sub.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from octofit_tracker import leaderboard
+from octofit_tracker.fastpath import field_plan
+from octofit_tracker.models import Leaderboard
+from octofit_tracker.renderers import dumps
+from octofit_tracker.serializers import LeaderboardSerializer
+
+LEADERBOARD = 'leaderboard'
+LIVE_PATH = '/api/leaderboard/live/'
+KEEPALIVE = b': keepalive\n\n'
+
+
+class LocalBackend:
+    """Delivers notifications to the subscribers of the publishing process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = defaultdict(list)
+
+    def subscribe(self, channel, callback):
+        """Call ``callback()`` on every notification of ``channel``, from any thread."""
+        with self._lock:
+            self._callbacks[channel].append(callback)
+
+    def publish(self, channel):
+        with self._lock:
+            callbacks = list(self._callbacks[channel])
+        for callback in callbacks:
+            callback()
+
+
+class Subscription:
+    """The events waiting to be sent to one client."""
+
+    def __init__(self, size):
+        self.queue = asyncio.Queue(size)
+        self.lagging = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client reads slower than the leaderboard changes; the
+            # stream replaces its backlog with a fresh snapshot.
+            self.lagging = True
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.lagging = False
+
+
+class Broker:
+    """Fans leaderboard changes out to the open streams of this process.
+
+    Lives on the event loop of the ASGI server; only :meth:`notify` may be
+    called from other threads.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.loop = None
+        self.subscriptions = set()
+        self.entries = None  # entry id -> entry, as last sent
+        self.sequence = 0
+        self._flush_scheduled = False
+        backend.subscribe(LEADERBOARD, self.notify)
+
+    async def subscribe(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # First stream on this event loop; each test runs its own loop
+            self.loop, self.entries, self._flush_scheduled = loop, None, False
+            self.subscriptions.clear()
+        if self.entries is None:
+            self.entries = await read_entries()
+        subscription = Subscription(settings.OCTOFIT_LIVE_QUEUE_SIZE)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+        if not self.subscriptions:
+            # Nobody is told about changes now, so the entries go stale
+            self.entries = None
+
+    def snapshot_event(self):
+        return format_event('snapshot', list(self.entries.values()), self.sequence)
+
+    def notify(self):
+        """Note that the leaderboard changed; safe to call from any thread."""
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._schedule_flush)
+        except RuntimeError:  # the loop was closed
+            pass
+
+    def _schedule_flush(self):
+        if self._flush_scheduled or not self.subscriptions:
+            return
+        self._flush_scheduled = True
+        self.loop.call_later(settings.OCTOFIT_LIVE_INTERVAL, lambda: self.loop.create_task(self.flush()))
+
+    async def flush(self):
+        """Read the leaderboard and send what changed since the last event to every stream."""
+        # Cleared first, so changes during the read schedule the next flush
+        self._flush_scheduled = False
+        if not self.subscriptions:
+            return
+        entries = await read_entries()
+        if self.entries is None:
+            # Every stream closed during the read
+            return
+        changes = diff(self.entries, entries)
+        self.entries = entries
+        if changes is None:
+            return
+        self.sequence += 1
+        event = format_event('diff', changes, self.sequence)
+        for subscription in self.subscriptions:
+            subscription.put(event)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = Broker(import_string(settings.OCTOFIT_LIVE_BACKEND)())
+        return _broker
+
+
+def leaderboard_changed():
+    """Tell the live streams the leaderboard changed, once the current transaction commits."""
+    transaction.on_commit(lambda: get_broker().backend.publish(LEADERBOARD))
+
+
+def leaderboard_entries():
+    """The leaderboard as ``/api/leaderboard/`` renders it, keyed by entry id."""
+    plan = field_plan(LeaderboardSerializer)
+    rows = Leaderboard.objects.order_by(*leaderboard.ORDERING).values(*plan.columns)
+    return {entry['id']: entry for entry in plan.render(rows)}
+
+
+# Thread-sensitive like Django's own sync views, so reads made while serving
+# a test client land on the thread holding the test transaction.
+read_entries = sync_to_async(leaderboard_entries)
+
+
+def diff(old, new):
+    """``{'updated': [entries], 'removed': [ids]}`` turning ``old`` into ``new``, or None if equal."""
+    updated = [entry for entry_id, entry in new.items() if old.get(entry_id) != entry]
+    removed = [entry_id for entry_id in old if entry_id not in new]
+    if not updated and not removed:
+        return None
+    return {'updated': updated, 'removed': removed}
+
+
+def format_event(name, data, sequence):
+    return b'id: %d\nevent: %s\ndata: %s\n\n' % (sequence, name.encode(), dumps(data))
+
+
+async def leaderboard_events(scope, receive, send):
+    """ASGI app streaming the leaderboard as Server-Sent Events."""
+    if scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    broker = get_broker()
+    subscription = await broker.subscribe()
+    headers = [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        # Stops nginx from buffering the stream
+        (b'x-accel-buffering', b'no'),
+    ]
+    if settings.CORS_ALLOW_ALL_ORIGINS:
+        headers.append((b'access-control-allow-origin', b'*'))
+    disconnected = asyncio.ensure_future(_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        body = broker.snapshot_event()
+        while body is not None:
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            body = await _next_event(broker, subscription, disconnected)
+    finally:
+        disconnected.cancel()
+        broker.unsubscribe(subscription)
+
+
+async def _next_event(broker, subscription, disconnected):
+    """The next chunk to send: an event, a keep-alive comment, or None once the client left."""
+    event = asyncio.ensure_future(subscription.queue.get())
+    done, _ = await asyncio.wait(
+        {event, disconnected}, timeout=settings.OCTOFIT_LIVE_KEEPALIVE, return_when=asyncio.FIRST_COMPLETED
+    )
+    if event not in done:
+        event.cancel()
+        return None if disconnected in done else KEEPALIVE
+    if subscription.lagging:
+        subscription.drain()
+        return broker.snapshot_event()
+    return event.result()
+
+
+async def _disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Load running WSGI and ASGI servers with many concurrent keep-alive connections and compare them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', help='Base URL of the WSGI server, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--asgi', help='Base URL of the ASGI server, e.g. http://127.0.0.1:8002')
+        parser.add_argument('--path', default='/api/leaderboard/', help='Endpoint to request (default: /api/leaderboard/)')
+        parser.add_argument('--connections', type=int, default=200, help='Concurrent connections (default: 200)')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run per server (default: 10)')
+        parser.add_argument(
+            '--read-delay', type=float, default=0,
+            help='Seconds each client waits before reading a response, to model slow clients (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        targets = [(name, options[name]) for name in ('wsgi', 'asgi') if options[name]]
+        if not targets:
+            raise CommandError('Give --wsgi and/or --asgi base URLs of running servers')
+
+        self.stdout.write(
+            f"{'server':<8}{'conns':>7}{'requests':>10}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+        )
+        for name, base_url in targets:
+            url = urlsplit(base_url)
+            if url.scheme != 'http' or not url.hostname:
+                raise CommandError(f'Only http:// base URLs are supported: {base_url}')
+            latencies, errors = asyncio.run(run_load(
+                url.hostname, url.port or 80, options['path'],
+                options['connections'], options['duration'], options['read_delay'],
+            ))
+            self.stdout.write(
+                f"{name:<8}{options['connections']:>7}{len(latencies):>10}{len(latencies) / options['duration']:>10.1f}"
+                f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}{percentile(latencies, 99):>9.1f}"
+                f'{errors:>8}'
+            )
+
+
+async def run_load(host, port, path, connections, duration, read_delay):
+    """Run ``connections`` clients against the server for ``duration`` seconds.
+
+    Returns the latencies in milliseconds of the successful requests and the
+    number of failed ones.
+    """
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], [0]
+    await asyncio.gather(*(
+        client(host, port, path, deadline, read_delay, latencies, errors) for _ in range(connections)
+    ))
+    return latencies, errors[0]
+
+
+async def client(host, port, path, deadline, read_delay, latencies, errors):
+    request = f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: application/json\r\n\r\n'.encode()
+    writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            if read_delay:
+                await asyncio.sleep(read_delay)
+            status, keep_alive = await read_response(reader)
+            if status == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors[0] += 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors[0] += 1
+            if writer is not None:
+                writer.close()
+                writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns ``(status, keep_alive)``."""
+    status_line = await reader.readuntil(b'\r\n')
+    status = int(status_line.split()[1])
+    headers = {}
+    while (line := await reader.readuntil(b'\r\n')) != b'\r\n':
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if headers.get('transfer-encoding') == 'chunked':
+        while size := int((await reader.readuntil(b'\r\n')).split(b';')[0], 16):
+            await reader.readexactly(size + 2)
+        while await reader.readuntil(b'\r\n') != b'\r\n':  # trailers
+            pass
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection') != 'close'
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import leaderboard
+from octofit_tracker.fastpath import field_plan
+from octofit_tracker.serializers import (
+    UserSerializer,
+    TeamSerializer,
+    ActivitySerializer,
+    LeaderboardSerializer,
+    WorkoutSerializer
+)
+
+SERIALIZERS = [UserSerializer, TeamSerializer, ActivitySerializer, LeaderboardSerializer, WorkoutSerializer]
+
+# Leaderboard entries are read in rank order, so both paths rank them from
+# their totals in one pass rather than with a count per entry.
+ORDERINGS = {LeaderboardSerializer: leaderboard.ORDERING}
+
+
+class Command(BaseCommand):
+    help = 'Compare list serialization throughput of the ModelSerializer path and the fast FieldPlan path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Rows serialized per model (default: 10000)')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path; the best is reported (default: 3)')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        self.stdout.write(f"{'model':<14}{'rows':>8}{'serializer rows/s':>20}{'fast path rows/s':>20}{'speedup':>10}")
+        for serializer_class in SERIALIZERS:
+            ordering = ORDERINGS.get(serializer_class, ('id',))
+            queryset = serializer_class.Meta.model.objects.order_by(*ordering)[:rows]
+            plan = field_plan(serializer_class)
+
+            def serializer_path():
+                # Ranks are counted per entry only when not precomputed
+                entries = list(queryset.all())
+                if serializer_class is LeaderboardSerializer:
+                    for entry, rank in zip(entries, leaderboard.ranks([entry.total_calories for entry in entries])):
+                        entry.rank = rank
+                return serializer_class(entries, many=True).data
+
+            def fast_path():
+                return plan.render(queryset.values(*plan.columns))
+
+            count = len(fast_path())
+            if not count:
+                self.stdout.write(f'{serializer_class.Meta.model.__name__:<14}{0:>8}  (no rows, run populate_db first)')
+                continue
+            slow = best_time(serializer_path, repeat)
+            fast = best_time(fast_path, repeat)
+            self.stdout.write(
+                f'{serializer_class.Meta.model.__name__:<14}{count:>8}'
+                f'{count / slow:>20,.0f}{count / fast:>20,.0f}{slow / fast:>9.1f}x'
+            )
+
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from octofit_tracker import leaderboard, user_ranking
+from octofit_tracker.pagination import ActivityCursorPagination
+
+
+def sort_spec(ordering):
+    """The pymongo sort for a Django ``ordering``."""
+    return [(field.lstrip('-'), -1 if field.startswith('-') else 1) for field in ordering]
+
+
+ACTIVITIES_SORT = sort_spec(ActivityCursorPagination.ordering)
+SINCE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# (name, collection, filter, sort) for the queries the API runs on every
+# request, filtered and sorted as the views do; each must be answered from
+# an index. List filters are $in queries, as djongo translates them.
+HOT_QUERIES = [
+    ('activities page', 'activities', {}, ACTIVITIES_SORT),
+    ('activities of a user', 'activities', {'user_id': {'$in': ['1']}}, ACTIVITIES_SORT),
+    ('activities of a team', 'activities', {'team_id': {'$in': ['1']}}, ACTIVITIES_SORT),
+    ('activities of a user above a calorie bound', 'activities',
+     {'user_id': {'$in': ['1']}, 'calories': {'$gte': 300}}, ACTIVITIES_SORT),
+    ('activities of a type since', 'activities',
+     {'activity_type': {'$in': ['Running']}, 'created_at': {'$gte': SINCE}}, ACTIVITIES_SORT),
+    ('activities since', 'activities', {'created_at': {'$gte': SINCE}}, ACTIVITIES_SORT),
+    ('members of a team', 'users', {'team_id': '1'}, None),
+    ('leaderboard in rank order', 'leaderboard', {}, sort_spec(leaderboard.ORDERING)),
+    ('leaderboard entry of a team', 'leaderboard', {'team_id': '1'}, None),
+    ('rank of a leaderboard entry', 'leaderboard', {'total_calories': {'$gt': 500}}, None),
+    ('user ranking page', 'user_scores', {'total_calories': {'$lt': 500}}, sort_spec(user_ranking.ORDERING)),
+    ('user score of a user', 'user_scores', {'user_id': '1'}, None),
+    ('team buckets of a window', 'activity_rollups', {'scope': 'team', 'day': {'$gte': SINCE}}, None),
+]
+
+
+class Command(BaseCommand):
+    help = 'Explain the hot API queries and fail if any of them falls back to a collection scan'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'djongo':
+            raise CommandError('check_query_plans explains MongoDB queries and needs the djongo database backend')
+        connection.ensure_connection()
+        db = connection.connection
+
+        failures = []
+        for name, collection, query, sort in HOT_QUERIES:
+            cursor = db[collection].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            stages = plan_stages(cursor.explain()['queryPlanner']['winningPlan'])
+            summary = f"{name}: {' <- '.join(stages)}"
+            if 'COLLSCAN' in stages:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(summary))
+            else:
+                self.stdout.write(self.style.SUCCESS(summary))
+
+        if failures:
+            raise CommandError(f"Collection scan in: {', '.join(failures)}")
+
+
+def plan_stages(plan):
+    """Flatten an explain() plan tree into its stage names, outermost first."""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
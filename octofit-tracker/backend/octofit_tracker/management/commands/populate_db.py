@@ -1,252 +1,153 @@
 from django.core.management.base import BaseCommand
-from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
-from datetime import datetime, timedelta
+from django.utils import timezone
+from octofit_tracker import jobs, leaderboard, rollups, team_names, user_ranking, user_stats, versioning
+from octofit_tracker.management.pool import process_pool
+from octofit_tracker.models import (
+    User, Team, Activity, ActivityRollup, Leaderboard, UserActivityStats, UserScore, UserScoreBucket, Workout
+)
+from datetime import timedelta
+from itertools import islice
 import random
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# The first two teams are always the heroes; any further teams and members
+# requested on the command line are generated.
+HERO_TEAMS = [
+    ('Team Marvel', 'Earth\'s Mightiest Heroes', [
+        ('Iron Man', 'tony.stark', 'tony.stark@marvel.com', 'arc_reactor_3000'),
+        ('Captain America', 'steve.rogers', 'steve.rogers@marvel.com', 'super_soldier_serum'),
+        ('Thor', 'thor.odinson', 'thor.odinson@marvel.com', 'mjolnir_worthy'),
+        ('Black Widow', 'natasha.romanoff', 'natasha.romanoff@marvel.com', 'red_room_graduate'),
+        ('Hulk', 'bruce.banner', 'bruce.banner@marvel.com', 'gamma_radiation'),
+    ]),
+    ('Team DC', 'Justice League United', [
+        ('Superman', 'clark.kent', 'clark.kent@dc.com', 'kryptonite_free'),
+        ('Batman', 'bruce.wayne', 'bruce.wayne@dc.com', 'dark_knight_rises'),
+        ('Wonder Woman', 'diana.prince', 'diana.prince@dc.com', 'lasso_of_truth'),
+        ('Flash', 'barry.allen', 'barry.allen@dc.com', 'speed_force'),
+        ('Aquaman', 'arthur.curry', 'arthur.curry@dc.com', 'king_of_atlantis'),
+    ]),
+]
+
+ACTIVITY_TYPES = ['Running', 'Swimming', 'Cycling', 'Weight Training', 'Yoga', 'Boxing', 'HIIT']
+DISTANCE_TYPES = {'Running', 'Swimming', 'Cycling'}
+
+WORKOUTS = [
+    ('Super Soldier Circuit', 'A high-intensity circuit training inspired by Captain America\'s training regimen',
+     'advanced', 45, 500, 'strength'),
+    ('Speed Force Sprints', 'Lightning-fast interval sprints to build speed and endurance',
+     'intermediate', 30, 400, 'cardio'),
+    ('Amazonian Warrior Yoga', 'Flexibility and strength training inspired by Wonder Woman',
+     'beginner', 40, 250, 'flexibility'),
+    ('Dark Knight Boxing', 'Advanced boxing and martial arts workout for ultimate fitness',
+     'advanced', 60, 650, 'cardio'),
+    ('Atlantean Swimming', 'Full-body swimming workout for strength and endurance',
+     'intermediate', 45, 450, 'cardio'),
+    ('Asgardian Hammer Swing', 'Functional strength training with weights and power movements',
+     'advanced', 50, 550, 'strength'),
+    ('Arc Reactor Core', 'Core strengthening exercises for stability and power',
+     'beginner', 25, 200, 'strength'),
+    ('Gamma Smash HIIT', 'High-intensity interval training for maximum calorie burn',
+     'intermediate', 35, 500, 'cardio'),
+]
+
+# Users handed to a worker process at a time
+USERS_PER_TASK = 1000
 
 
 class Command(BaseCommand):
     help = 'Populate the octofit_db database with test data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--teams', type=int, default=2, help='Number of teams (default: 2)')
+        parser.add_argument('--users-per-team', type=int, default=5, help='Members per team (default: 5)')
+        parser.add_argument(
+            '--activities-per-user', type=int, default=5,
+            help='Average activities per user; each user gets 60-140%% of it (default: 5)',
+        )
+        parser.add_argument('--days', type=int, default=30, help='Spread activities over the last N days (default: 30)')
+        parser.add_argument('--seed', type=int, help='Random seed, for reproducible datasets')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert (default: 1000)')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes generating activities (default: 1)')
+        parser.add_argument(
+            '--defer-aggregates', action='store_true',
+            help='Queue the leaderboard, rollup and statistics rebuilds for run_workers instead of running them',
+        )
+
     def handle(self, *args, **options):
+        started = time.perf_counter()
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        batch_size = options['batch_size']
+
         self.stdout.write('Clearing existing data...')
-        
-        # Delete all existing data
-        User.objects.all().delete()
-        Team.objects.all().delete()
-        Activity.objects.all().delete()
-        Leaderboard.objects.all().delete()
-        Workout.objects.all().delete()
-        
+
+        # Delete all existing data. _raw_delete skips the per-row signal
+        # handlers, which would otherwise load every row into memory first.
+        for model in (
+            User, Team, Activity, Leaderboard, ActivityRollup, UserActivityStats, UserScore, UserScoreBucket, Workout
+        ):
+            model.objects.all()._raw_delete(model.objects.db)
+        team_names.invalidate()
+
         self.stdout.write(self.style.SUCCESS('Existing data cleared'))
-        
-        # Create teams
+
         self.stdout.write('Creating teams...')
-        team_marvel = Team.objects.create(
-            name='Team Marvel',
-            description='Earth\'s Mightiest Heroes'
-        )
-        team_dc = Team.objects.create(
-            name='Team DC',
-            description='Justice League United'
-        )
-        self.stdout.write(self.style.SUCCESS(f'Created teams: {team_marvel.name}, {team_dc.name}'))
-        
-        # Create Marvel users
-        self.stdout.write('Creating Marvel heroes...')
-        marvel_users = [
-            User.objects.create(
-                name='Iron Man',
-                username='tony.stark',
-                email='tony.stark@marvel.com',
-                password='arc_reactor_3000',
-                team_id=str(team_marvel.id)
-            ),
-            User.objects.create(
-                name='Captain America',
-                username='steve.rogers',
-                email='steve.rogers@marvel.com',
-                password='super_soldier_serum',
-                team_id=str(team_marvel.id)
-            ),
-            User.objects.create(
-                name='Thor',
-                username='thor.odinson',
-                email='thor.odinson@marvel.com',
-                password='mjolnir_worthy',
-                team_id=str(team_marvel.id)
-            ),
-            User.objects.create(
-                name='Black Widow',
-                username='natasha.romanoff',
-                email='natasha.romanoff@marvel.com',
-                password='red_room_graduate',
-                team_id=str(team_marvel.id)
-            ),
-            User.objects.create(
-                name='Hulk',
-                username='bruce.banner',
-                email='bruce.banner@marvel.com',
-                password='gamma_radiation',
-                team_id=str(team_marvel.id)
-            ),
-        ]
-        
-        # Create DC users
-        self.stdout.write('Creating DC heroes...')
-        dc_users = [
-            User.objects.create(
-                name='Superman',
-                username='clark.kent',
-                email='clark.kent@dc.com',
-                password='kryptonite_free',
-                team_id=str(team_dc.id)
-            ),
-            User.objects.create(
-                name='Batman',
-                username='bruce.wayne',
-                email='bruce.wayne@dc.com',
-                password='dark_knight_rises',
-                team_id=str(team_dc.id)
-            ),
-            User.objects.create(
-                name='Wonder Woman',
-                username='diana.prince',
-                email='diana.prince@dc.com',
-                password='lasso_of_truth',
-                team_id=str(team_dc.id)
-            ),
-            User.objects.create(
-                name='Flash',
-                username='barry.allen',
-                email='barry.allen@dc.com',
-                password='speed_force',
-                team_id=str(team_dc.id)
-            ),
-            User.objects.create(
-                name='Aquaman',
-                username='arthur.curry',
-                email='arthur.curry@dc.com',
-                password='king_of_atlantis',
-                team_id=str(team_dc.id)
-            ),
-        ]
-        
-        all_users = marvel_users + dc_users
-        self.stdout.write(self.style.SUCCESS(f'Created {len(all_users)} users'))
-        
-        # Create activities for users
-        self.stdout.write('Creating activities...')
-        activity_types = ['Running', 'Swimming', 'Cycling', 'Weight Training', 'Yoga', 'Boxing', 'HIIT']
-        activity_count = 0
-        
-        for user in all_users:
-            # Create 3-7 random activities per user
-            num_activities = random.randint(3, 7)
-            for i in range(num_activities):
-                activity_type = random.choice(activity_types)
-                duration = random.randint(20, 120)
-                calories = duration * random.randint(5, 12)
-                distance = round(random.uniform(2, 15), 2) if activity_type in ['Running', 'Swimming', 'Cycling'] else None
-                
-                Activity.objects.create(
-                    user_id=str(user.id),
-                    activity_type=activity_type,
-                    duration=duration,
-                    calories=calories,
-                    distance=distance,
-                    notes=f'{user.name} completed {activity_type}',
-                    created_at=datetime.now() - timedelta(days=random.randint(0, 30))
-                )
-                activity_count += 1
-        
+        team_ids = self.create_teams(options['teams'])
+        self.stdout.write(self.style.SUCCESS(f'Created {len(team_ids)} teams'))
+
+        self.stdout.write('Creating users...')
+        members = self.create_users(team_ids, options['users_per_team'], seed, batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Created {len(members)} users'))
+
+        self.stdout.write(f'Creating activities (seed {seed})...')
+        activity_count = self.create_activities(members, seed, options)
         self.stdout.write(self.style.SUCCESS(f'Created {activity_count} activities'))
-        
+
         # Calculate and create leaderboard entries
-        self.stdout.write('Creating leaderboard entries...')
-        
-        # Calculate Marvel team stats
-        marvel_activities = Activity.objects.filter(user_id__in=[str(u.id) for u in marvel_users])
-        marvel_total_calories = sum(a.calories for a in marvel_activities)
-        marvel_total_activities = marvel_activities.count()
-        
-        # Calculate DC team stats
-        dc_activities = Activity.objects.filter(user_id__in=[str(u.id) for u in dc_users])
-        dc_total_calories = sum(a.calories for a in dc_activities)
-        dc_total_activities = dc_activities.count()
-        
-        # Determine ranks
-        if marvel_total_calories > dc_total_calories:
-            marvel_rank, dc_rank = 1, 2
+        if options['defer_aggregates']:
+            jobs.enqueue('rebuild_leaderboard')
+            jobs.enqueue('rebuild_rollups', options['batch_size'])
+            jobs.enqueue('rebuild_user_stats')
+            jobs.enqueue('rebuild_user_ranking', options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                'Queued the leaderboard, daily rollup, user statistics and user ranking rebuilds; '
+                'run manage.py run_workers'
+            ))
         else:
-            marvel_rank, dc_rank = 2, 1
-        
-        Leaderboard.objects.create(
-            team_id=str(team_marvel.id),
-            total_calories=marvel_total_calories,
-            total_activities=marvel_total_activities,
-            rank=marvel_rank
-        )
-        
-        Leaderboard.objects.create(
-            team_id=str(team_dc.id),
-            total_calories=dc_total_calories,
-            total_activities=dc_total_activities,
-            rank=dc_rank
-        )
-        
-        self.stdout.write(self.style.SUCCESS('Created leaderboard entries'))
-        
+            self.stdout.write('Creating leaderboard entries...')
+
+            leaderboard.rebuild()
+            rollups.rebuild(options['batch_size'])
+            user_stats.rebuild()
+            user_ranking.rebuild(options['batch_size'])
+
+            self.stdout.write(self.style.SUCCESS(
+                'Created leaderboard entries, daily rollups, user statistics and the user ranking'
+            ))
+
         # Create workout suggestions
         self.stdout.write('Creating workout suggestions...')
-        workouts = [
-            Workout.objects.create(
-                name='Super Soldier Circuit',
-                description='A high-intensity circuit training inspired by Captain America\'s training regimen',
-                difficulty='advanced',
-                duration=45,
-                calories_estimate=500,
-                category='strength'
-            ),
-            Workout.objects.create(
-                name='Speed Force Sprints',
-                description='Lightning-fast interval sprints to build speed and endurance',
-                difficulty='intermediate',
-                duration=30,
-                calories_estimate=400,
-                category='cardio'
-            ),
-            Workout.objects.create(
-                name='Amazonian Warrior Yoga',
-                description='Flexibility and strength training inspired by Wonder Woman',
-                difficulty='beginner',
-                duration=40,
-                calories_estimate=250,
-                category='flexibility'
-            ),
-            Workout.objects.create(
-                name='Dark Knight Boxing',
-                description='Advanced boxing and martial arts workout for ultimate fitness',
-                difficulty='advanced',
-                duration=60,
-                calories_estimate=650,
-                category='cardio'
-            ),
-            Workout.objects.create(
-                name='Atlantean Swimming',
-                description='Full-body swimming workout for strength and endurance',
-                difficulty='intermediate',
-                duration=45,
-                calories_estimate=450,
-                category='cardio'
-            ),
-            Workout.objects.create(
-                name='Asgardian Hammer Swing',
-                description='Functional strength training with weights and power movements',
-                difficulty='advanced',
-                duration=50,
-                calories_estimate=550,
-                category='strength'
-            ),
-            Workout.objects.create(
-                name='Arc Reactor Core',
-                description='Core strengthening exercises for stability and power',
-                difficulty='beginner',
-                duration=25,
-                calories_estimate=200,
-                category='strength'
-            ),
-            Workout.objects.create(
-                name='Gamma Smash HIIT',
-                description='High-intensity interval training for maximum calorie burn',
-                difficulty='intermediate',
-                duration=35,
-                calories_estimate=500,
-                category='cardio'
-            ),
-        ]
-        
+        workouts = Workout.objects.bulk_create([
+            Workout(
+                name=name,
+                description=description,
+                difficulty=difficulty,
+                duration=duration,
+                calories_estimate=calories_estimate,
+                category=category,
+            )
+            for name, description, difficulty, duration, calories_estimate, category in WORKOUTS
+        ])
+
         self.stdout.write(self.style.SUCCESS(f'Created {len(workouts)} workout suggestions'))
-        
+        versioning.bump(*versioning.COLLECTIONS)
+
         # Summary
         self.stdout.write(self.style.SUCCESS('\n=== Database Population Complete ==='))
         self.stdout.write(self.style.SUCCESS(f'Teams: {Team.objects.count()}'))
@@ -254,3 +155,109 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS(f'Activities: {Activity.objects.count()}'))
         self.stdout.write(self.style.SUCCESS(f'Leaderboard Entries: {Leaderboard.objects.count()}'))
         self.stdout.write(self.style.SUCCESS(f'Workouts: {Workout.objects.count()}'))
+        self.stdout.write(self.style.SUCCESS(f'Elapsed: {time.perf_counter() - started:.1f}s'))
+        peak = peak_memory_mb()
+        if peak is not None:
+            self.stdout.write(self.style.SUCCESS(f'Peak memory: {peak:.1f} MB'))
+
+    def create_teams(self, count):
+        teams = [Team(name=name, description=description) for name, description, _ in HERO_TEAMS[:count]]
+        teams += [
+            Team(name=f'Team {number}', description=f'Generated team {number}')
+            for number in range(len(teams) + 1, count + 1)
+        ]
+        Team.objects.bulk_create(teams)
+        # Some backends do not return primary keys from bulk_create, so read
+        # them back; the collection was just cleared and holds only ours.
+        return [str(pk) for pk in Team.objects.order_by('id').values_list('id', flat=True)]
+
+    def create_users(self, team_ids, users_per_team, seed, batch_size):
+        """Create every team's members and return ``(team_index, user_index, id, team_id, name)`` rows."""
+        def users():
+            for team_index, team_id in enumerate(team_ids):
+                heroes = HERO_TEAMS[team_index][2] if team_index < len(HERO_TEAMS) else []
+                for user_index in range(users_per_team):
+                    if user_index < len(heroes):
+                        name, username, email, password = heroes[user_index]
+                    else:
+                        name = f'Athlete {team_index + 1}-{user_index + 1}'
+                        username = f'athlete.{team_index + 1}.{user_index + 1}'
+                        email = f'{username}@octofit.test'
+                        password = random.Random(f'{seed}:{username}').randbytes(8).hex()
+                    yield User(name=name, username=username, email=email, password=password, team_id=team_id)
+
+        users = users()
+        while batch := list(islice(users, batch_size)):
+            User.objects.bulk_create(batch)
+
+        members = []
+        for team_index, team_id in enumerate(team_ids):
+            rows = User.objects.filter(team_id=team_id).order_by('id').values_list('id', 'name')
+            members.extend(
+                (team_index, user_index, str(pk), team_id, name)
+                for user_index, (pk, name) in enumerate(rows.iterator())
+            )
+        return members
+
+    def create_activities(self, members, seed, options):
+        average = options['activities_per_user']
+        config = {
+            'seed': seed,
+            'days': options['days'],
+            'low': max(1, round(average * 0.6)),
+            'high': max(1, round(average * 1.4)),
+            'batch_size': options['batch_size'],
+            'now': timezone.now(),
+        }
+        tasks = [
+            (members[start:start + USERS_PER_TASK], config)
+            for start in range(0, len(members), USERS_PER_TASK)
+        ]
+        if options['workers'] <= 1:
+            return sum(map(insert_activities, tasks))
+
+        with process_pool(options['workers']) as pool:
+            return sum(pool.imap_unordered(insert_activities, tasks))
+
+
+def insert_activities(task):
+    """Generate and bulk insert the activities of a chunk of users; returns the row count."""
+    members, config = task
+    activities = generate_activities(members, config)
+    count = 0
+    while batch := list(islice(activities, config['batch_size'])):
+        Activity.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def generate_activities(members, config):
+    span = config['days'] * 24 * 60 * 60
+    for team_index, user_index, user_id, team_id, name in members:
+        # Seeding per user keeps the dataset identical for any --workers value.
+        rng = random.Random(f"{config['seed']}:{team_index}:{user_index}")
+        for _ in range(rng.randint(config['low'], config['high'])):
+            activity_type = rng.choice(ACTIVITY_TYPES)
+            duration = rng.randint(20, 120)
+            yield Activity(
+                user_id=user_id,
+                team_id=team_id,
+                activity_type=activity_type,
+                duration=duration,
+                calories=duration * rng.randint(5, 12),
+                distance=round(rng.uniform(2, 15), 2) if activity_type in DISTANCE_TYPES else None,
+                notes=f'{name} completed {activity_type}',
+                created_at=config['now'] - timedelta(seconds=rng.randint(0, span)),
+            )
+
+
+def peak_memory_mb():
+    """Peak resident set size of this process and its workers, in MB."""
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
@@ -0,0 +1,255 @@
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import contextmanager
+from io import StringIO
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+from django.urls import reverse
+from django.utils import timezone
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from octofit_tracker.management.commands.bench_concurrency import percentile
+from octofit_tracker.management.commands.populate_db import peak_memory_mb
+from octofit_tracker.models import Activity, User
+from octofit_tracker.urls import router
+
+# Nominal activity count -> populate_db options. Each user gets 60-140% of
+# the average, so the real counts land close to the nominal ones.
+SCALES = {
+    '1k': {'teams': 2, 'users_per_team': 5, 'activities_per_user': 100},
+    '100k': {'teams': 10, 'users_per_team': 100, 'activities_per_user': 100},
+    '1m': {'teams': 20, 'users_per_team': 500, 'activities_per_user': 100},
+}
+
+# Query strings measured for a route instead of the bare URL; the export is
+# limited to one user so it stays comparable across scales.
+ROUTE_QUERIES = {
+    'leaderboard-list': ['', 'window=week'],
+    'activity-export': ['format=csv&user_id={user_id}', 'format=ndjson&user_id={user_id}'],
+}
+
+# p95 slowdowns below this are noise on fast endpoints, whatever the ratio
+ABSOLUTE_TOLERANCE_MS = 2.0
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed deterministic datasets into a throwaway test database and record p50/p95/p99 latency, '
+        'queries per request and peak RSS of the read endpoints and admin changelists'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', action='append', choices=list(SCALES),
+            help='Dataset size in activities; repeat for several (default: 1k)',
+        )
+        parser.add_argument('--requests', type=int, default=30, help='Timed requests per endpoint (default: 30)')
+        parser.add_argument('--seed', type=int, default=2024, help='populate_db seed (default: 2024)')
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Keep cached responses between requests instead of measuring the uncached path',
+        )
+        parser.add_argument('--output', help='Write the results to this JSON baseline file')
+        parser.add_argument('--compare', help='Compare with a JSON baseline file and fail on regressions')
+        parser.add_argument(
+            '--threshold', type=float, default=0.25,
+            help='Relative p95 slowdown reported as a regression (default: 0.25)',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'djongo' and not mongod_reachable():
+            self.rerun_on_sqlite()
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        results = {
+            'meta': {
+                'database': connection.vendor,
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'warm_cache': options['warm_cache'],
+                'python': platform.python_version(),
+                'created': timezone.now().isoformat(),
+            },
+            'scales': {},
+        }
+        with benchmark_database():
+            for scale in options['scale'] or ['1k']:
+                results['scales'][scale] = self.run_scale(scale, options)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['output']}"))
+
+        if baseline is not None:
+            regressions = compare(baseline, results, options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['compare']}")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
+
+    def rerun_on_sqlite(self):
+        # Settings are loaded once per process, so switching databases means
+        # starting over with OCTOFIT_DATABASE set.
+        if 'run_benchmarks' not in sys.argv:
+            raise CommandError('mongod is not reachable; run with OCTOFIT_DATABASE=sqlite to use the stand-in')
+        self.stderr.write('mongod is not reachable; re-running against the in-process SQLite stand-in')
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execve(sys.executable, [sys.executable] + sys.argv, {**os.environ, 'OCTOFIT_DATABASE': 'sqlite'})
+
+    def run_scale(self, scale, options):
+        self.stdout.write(f"Seeding {scale} activities (seed {options['seed']})...")
+        started = time.perf_counter()
+        call_command('populate_db', stdout=StringIO(), seed=options['seed'], **SCALES[scale])
+        seed_seconds = time.perf_counter() - started
+
+        client = Client()
+        client.force_login(get_user_model().objects.get_or_create(
+            username='benchmark', defaults={'is_staff': True, 'is_superuser': True},
+        )[0])
+
+        self.stdout.write(f"{'endpoint':<56}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+        endpoints = {}
+        for url in benchmark_urls():
+            result = endpoints[url] = measure(client, url, options['requests'], options['warm_cache'])
+            self.stdout.write(
+                f"{url:<56}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['queries']:>9}"
+            )
+
+        peak = peak_memory_mb()
+        return {
+            'activities': Activity.objects.count(),
+            'seed_seconds': round(seed_seconds, 2),
+            'peak_rss_mb': round(peak, 1) if peak is not None else None,
+            'endpoints': endpoints,
+        }
+
+
+@contextmanager
+def benchmark_database():
+    """Run inside a freshly created test database, never the configured one."""
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def mongod_reachable():
+    connection_settings = connection.settings_dict.get('CLIENT', {})
+    client = MongoClient(
+        connection_settings.get('host', 'localhost'), connection_settings.get('port', 27017),
+        serverSelectionTimeoutMS=1000,
+    )
+    try:
+        client.admin.command('ping')
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+def benchmark_urls():
+    """Every GET route of the API router, one detail per model, the dashboard, the user ranking and the admin changelists."""
+    urls = [reverse('api-root'), reverse('dashboard'), reverse('user-leaderboard')]
+    user_id = User.objects.order_by('pk').values_list('pk', flat=True).first()
+    if user_id is not None:
+        urls.append(f"{reverse('user-leaderboard')}?around={user_id}")
+    for _, viewset, basename in router.registry:
+        instance = viewset.queryset.model.objects.order_by('pk').first()
+        routes = [(f'{basename}-list', None)]
+        if instance is not None:
+            routes.append((f'{basename}-detail', instance.pk))
+        for extra_action in viewset.get_extra_actions():
+            if 'get' not in extra_action.mapping:
+                continue
+            name = f'{basename}-{extra_action.url_name}'
+            if extra_action.detail:
+                if instance is not None:
+                    routes.append((name, instance.pk))
+            else:
+                routes.append((name, None))
+        for name, pk in routes:
+            url = reverse(name, args=[pk] if pk is not None else [])
+            for query in ROUTE_QUERIES.get(name, ['']):
+                query = query.format(user_id=user_id)
+                urls.append(f'{url}?{query}' if query else url)
+
+    for model in admin.site._registry:
+        urls.append(reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist'))
+    return urls
+
+
+def measure(client, url, requests, warm_cache):
+    # One untimed request counts the queries and warms up code paths.
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+        _consume(response)
+    # Count now: the next request resets the connection's query log.
+    query_count = len(queries)
+    if response.status_code != 200:
+        raise CommandError(f'GET {url} returned {response.status_code}')
+
+    latencies = []
+    for _ in range(requests):
+        if not warm_cache:
+            cache.clear()
+        started = time.perf_counter()
+        _consume(client.get(url))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'queries': query_count,
+    }
+
+
+def _consume(response):
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+
+
+def compare(baseline, results, threshold):
+    """List the endpoints that got slower, or run more queries, than in ``baseline``."""
+    regressions = []
+    for scale, result in results['scales'].items():
+        previous_scale = baseline.get('scales', {}).get(scale)
+        if previous_scale is None:
+            continue
+        for url, current in result['endpoints'].items():
+            previous = previous_scale['endpoints'].get(url)
+            if previous is None:
+                continue
+            slowdown = current['p95_ms'] - previous['p95_ms']
+            if slowdown > ABSOLUTE_TOLERANCE_MS and current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+                regressions.append(
+                    f"{scale} {url}: p95 {previous['p95_ms']:.2f} ms -> {current['p95_ms']:.2f} ms"
+                )
+            if current['queries'] > previous['queries']:
+                regressions.append(f"{scale} {url}: queries {previous['queries']} -> {current['queries']}")
+    return regressions
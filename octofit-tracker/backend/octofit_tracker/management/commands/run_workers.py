@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker import jobs
+from octofit_tracker.management.pool import process_pool
+
+
+class Command(BaseCommand):
+    help = 'Run the jobs queued in the database, such as aggregate rebuilds and re-tagging activities'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Worker processes (default: 1)')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due instead of waiting for more')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency must be at least 1')
+        burst = options['burst']
+        try:
+            if concurrency == 1:
+                count = jobs.work(jobs.worker_name(1), burst, report=self.stdout.write)
+            else:
+                with process_pool(concurrency) as pool:
+                    count = sum(pool.imap_unordered(run_worker, [(number, burst) for number in range(1, concurrency + 1)]))
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f'Ran {count} jobs'))
+
+
+def run_worker(task):
+    number, burst = task
+    return jobs.work(jobs.worker_name(number), burst, report=lambda line: print(line, flush=True))
@@ -0,0 +1,17 @@
+"""Process pools for the management commands that fan work out over workers."""
+import multiprocessing
+
+from django.db import connections
+
+
+def process_pool(processes):
+    """A ``multiprocessing.Pool`` whose workers set Django up with their own connections."""
+    # Children open their own connections; never share sockets across a fork.
+    connections.close_all()
+    return multiprocessing.Pool(processes, initializer=_init_worker)
+
+
+def _init_worker():
+    import django
+    django.setup()
+    connections.close_all()
@@ -0,0 +1,182 @@
+"""Request and database metrics in the Prometheus text exposition format.
+
+``MetricsMiddleware`` times every request and the database round-trips it
+makes. Round-trips are counted where they happen: one per MongoDB command
+through a pymongo ``CommandListener`` on djongo, one per SQL statement
+through a connection ``execute_wrapper`` on other backends. ``GET /metrics``
+exposes the counters of the serving process.
+
+Each observation is a dictionary lookup and a few additions under one lock,
+cheap enough to stay on in production. Under a multi-process server every
+worker keeps its own registry, so scrape each worker or aggregate the series
+in Prometheus.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_lock = threading.Lock()
+_metrics = []
+
+
+class Counter:
+    def __init__(self, name, documentation, labels):
+        self.name, self.documentation, self.labels = name, documentation, labels
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for label_values, value in sorted(self.values.items()):
+            yield f'{self.name}{_labels(self.labels, label_values)} {_number(value)}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels, buckets):
+        self.name, self.documentation, self.labels, self.buckets = name, documentation, labels, buckets
+        self.series = {}  # label values -> [count per bucket (last is +Inf), sum]
+        _metrics.append(self)
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        bounds = [_number(bound) for bound in self.buckets] + ['+Inf']
+        for label_values, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(self.labels + ("le",), label_values + (bound,))} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labels, label_values)} {cumulative}'
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REQUESTS = Counter(
+    'octofit_http_requests_total', 'HTTP requests by view, method and status code.', ('view', 'method', 'status'),
+)
+REQUEST_DURATION = Histogram(
+    'octofit_http_request_duration_seconds', 'Time to produce the response, by view.', ('view', 'method'),
+    LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    'octofit_http_response_size_bytes', 'Response body size as sent, by view.', ('view',), SIZE_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'octofit_db_queries_per_request', 'Database round-trips per request, by view.', ('view',), COUNT_BUCKETS,
+)
+REQUEST_QUERY_DURATION = Histogram(
+    'octofit_db_time_per_request_seconds', 'Time spent in the database per request, by view.', ('view',),
+    LATENCY_BUCKETS,
+)
+QUERY_DURATION = Histogram(
+    'octofit_db_query_duration_seconds', 'Duration of single database round-trips, by backend and command.',
+    ('backend', 'command'), QUERY_BUCKETS,
+)
+
+
+class RequestQueries:
+    """Round-trips of the request being served."""
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# A context variable rather than a thread-local, so the count follows a
+# request through sync_to_async and the async read pool.
+_current = ContextVar('octofit_request_queries', default=None)
+
+
+def track_queries():
+    queries = RequestQueries()
+    _current.set(queries)
+    return queries
+
+
+def stop_tracking():
+    _current.set(None)
+
+
+def record_query(backend, command, duration):
+    QUERY_DURATION.observe((backend, command), duration)
+    queries = _current.get()
+    if queries is not None:
+        queries.count += 1
+        queries.duration += duration
+
+
+def observe_request(view, method, status, duration, queries):
+    REQUESTS.inc((view, method, str(status)))
+    REQUEST_DURATION.observe((view, method), duration)
+    REQUEST_QUERIES.observe((view,), queries.count)
+    REQUEST_QUERY_DURATION.observe((view,), queries.duration)
+
+
+def observe_response_size(view, size):
+    RESPONSE_SIZE.observe((view,), size)
+
+
+def exposition():
+    """Render every metric in the Prometheus text format."""
+    with _lock:
+        lines = [line for metric in _metrics for line in metric.expose()]
+    return '\n'.join(lines) + '\n'
+
+
+def sql_execute_wrapper(execute, sql, params, many, context):
+    """``connection.execute_wrapper`` timing each SQL statement."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        command = sql.split(None, 1)[0].upper() if sql else ''
+        record_query(context['connection'].vendor, command, time.perf_counter() - started)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times each MongoDB command; pymongo calls it on the thread that ran the command."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record_query('mongodb', event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        record_query('mongodb', event.command_name, event.duration_micros / 1e6)
@@ -0,0 +1,135 @@
+import time
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+from octofit_tracker import metrics
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Brotli's default quality (11) is meant for static assets; 5 compresses
+# better than gzip at a similar CPU cost for per-request JSON.
+BROTLI_QUALITY = 5
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses of at least ``OCTOFIT_COMPRESSION_MIN_SIZE`` bytes
+    with brotli or gzip, whichever the client prefers in Accept-Encoding.
+
+    Brotli is offered only when the ``brotli`` package is installed. Works
+    like Django's GZipMiddleware otherwise: streaming responses are
+    compressed chunk by chunk, the Vary header is set and strong ETags are
+    weakened.
+    """
+
+    def process_response(self, request, response):
+        # It's not worth attempting to compress short responses.
+        if not response.streaming and len(response.content) < settings.OCTOFIT_COMPRESSION_MIN_SIZE:
+            return response
+
+        # Avoid compressing twice.
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            # The compressed size is unknown until the stream is consumed.
+            compress = compress_sequence if encoding == 'gzip' else brotli_sequence
+            response.streaming_content = compress(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'gzip':
+                compressed_content = compress_string(response.content)
+            else:
+                compressed_content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            # Return the compressed content only if it's actually shorter.
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # A strong ETag promises byte-identical bodies, which no longer holds
+        # across encodings (RFC 7232 section 2.1).
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick ``'br'``, ``'gzip'`` or None from an Accept-Encoding header, honouring q-values."""
+    available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding] = quality
+    candidates = [
+        (weights.get(coding, weights.get('*', 0.0)), -position, coding)
+        for position, coding in enumerate(available)
+    ]
+    quality, _, coding = max(candidates)
+    return coding if quality > 0 else None
+
+
+def brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Record the latency, status, response size and database round-trips of
+    every request, labelled by URL pattern name, for ``GET /metrics``.
+
+    Goes first in MIDDLEWARE so it measures the whole stack and the body
+    size after compression.
+    """
+
+    def process_request(self, request):
+        request._metrics = (time.perf_counter(), metrics.track_queries())
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_metrics'):
+            return response
+        started, queries = request._metrics
+        metrics.stop_tracking()
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        metrics.observe_request(view, request.method, response.status_code, time.perf_counter() - started, queries)
+        if response.streaming:
+            response.streaming_content = _measure_stream(response.streaming_content, view)
+        else:
+            metrics.observe_response_size(view, len(response.content))
+        return response
+
+
+def _measure_stream(chunks, view):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    metrics.observe_response_size(view, size)
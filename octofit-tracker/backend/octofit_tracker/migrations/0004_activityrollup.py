@@ -0,0 +1,28 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0003_activity_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('team', 'Team'), ('user', 'User')], max_length=10)),
+                ('owner_id', models.CharField(max_length=100)),
+                ('day', models.DateField()),
+                ('total_calories', models.IntegerField(default=0)),
+                ('total_activities', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'activity_rollups',
+                'unique_together': {('scope', 'owner_id', 'day')},
+            },
+        ),
+    ]
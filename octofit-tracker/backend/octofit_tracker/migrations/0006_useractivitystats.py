@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0005_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivityStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100)),
+                ('activity_type', models.CharField(max_length=100)),
+                ('total_activities', models.IntegerField(default=0)),
+                ('total_minutes', models.IntegerField(default=0)),
+                ('total_calories', models.IntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0)),
+            ],
+            options={
+                'db_table': 'user_activity_stats',
+                'unique_together': {('user_id', 'activity_type')},
+            },
+        ),
+    ]
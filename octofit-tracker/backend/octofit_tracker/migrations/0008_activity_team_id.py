@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+
+def tag_activities(apps, schema_editor):
+    # One update per team member. Past activities are tagged with the
+    # author's current team, though the aggregates credited each to the team
+    # the author had when it was logged; 0014 queues the rebuilds that bring
+    # them in line with the tags.
+    User = apps.get_model('octofit_tracker', 'User')
+    Activity = apps.get_model('octofit_tracker', 'Activity')
+    members = User.objects.exclude(team_id=None).exclude(team_id='').values_list('id', 'team_id')
+    for user_id, team_id in members.iterator():
+        Activity.objects.filter(user_id=str(user_id)).update(team_id=team_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0007_collectionversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='team_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['team_id', 'created_at'], name='activities_team_created_idx'),
+        ),
+        migrations.RunPython(tag_activities, migrations.RunPython.noop),
+    ]
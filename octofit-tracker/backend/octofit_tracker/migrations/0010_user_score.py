@@ -0,0 +1,60 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:57
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    # Users who logged activities before this migration would otherwise be
+    # missing from the ranking, or enter it counting only later activities.
+    # A full rebuild is too slow to run inside migrate, so it is queued for
+    # run_workers, the way jobs.enqueue() would queue it.
+    Activity = apps.get_model('octofit_tracker', 'Activity')
+    Job = apps.get_model('octofit_tracker', 'Job')
+    if not Activity.objects.exists():
+        return
+    name = 'rebuild_user_ranking'
+    Job.objects.get_or_create(
+        dedupe_key=hashlib.sha1(f'{name}:[]'.encode()).hexdigest(), status='pending',
+        defaults={'name': name, 'arguments': '[]', 'max_attempts': settings.OCTOFIT_JOB_MAX_ATTEMPTS},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0009_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100, unique=True)),
+                ('total_calories', models.IntegerField(default=0)),
+                ('total_activities', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'user_scores',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserScoreBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node', models.IntegerField(unique=True)),
+                ('users', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'user_score_buckets',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='userscore',
+            index=models.Index(fields=['total_calories', 'user_id'], name='user_scores_rank_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+import hashlib
+
+from django.conf import settings
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    # The rollup and statistics tables were added empty (0004, 0006), so
+    # activities logged before them were missing from windowed leaderboards
+    # and user statistics. The rebuilds are queued for run_workers, the way
+    # jobs.enqueue() would queue them, rather than run inside migrate.
+    Activity = apps.get_model('octofit_tracker', 'Activity')
+    Job = apps.get_model('octofit_tracker', 'Job')
+    if not Activity.objects.exists():
+        return
+    for name in ('rebuild_rollups', 'rebuild_user_stats'):
+        Job.objects.get_or_create(
+            dedupe_key=hashlib.sha1(f'{name}:[]'.encode()).hexdigest(), status='pending',
+            defaults={'name': name, 'arguments': '[]', 'max_attempts': settings.OCTOFIT_JOB_MAX_ATTEMPTS},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0010_user_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
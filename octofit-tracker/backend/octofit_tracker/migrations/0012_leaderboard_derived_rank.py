@@ -0,0 +1,47 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+def merge_duplicate_entries(apps, schema_editor):
+    # Concurrent first writes to a team could each create an entry, and
+    # later deltas went to either one, so the team's totals are their sum.
+    Leaderboard = apps.get_model('octofit_tracker', 'Leaderboard')
+    entries = {}
+    for entry in Leaderboard.objects.order_by('id'):
+        kept = entries.setdefault(entry.team_id, entry)
+        if kept is not entry:
+            kept.total_calories += entry.total_calories
+            kept.total_activities += entry.total_activities
+            entry.delete()
+            Leaderboard.objects.filter(pk=kept.pk).update(
+                total_calories=kept.total_calories, total_activities=kept.total_activities
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0011_backfill_rollups_and_stats'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='leaderboard',
+            name='leaderboard_rank_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='leaderboard',
+            name='leaderboard_team_idx',
+        ),
+        migrations.RemoveField(
+            model_name='leaderboard',
+            name='rank',
+        ),
+        migrations.RunPython(merge_duplicate_entries, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='leaderboard',
+            name='team_id',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0012_leaderboard_derived_rank'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='activities_user_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='activities_type_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='activities_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='activity',
+            name='activities_team_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='leaderboard',
+            name='leaderboard_calories_idx',
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user_id', 'created_at', 'id'], name='activities_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['team_id', 'created_at', 'id'], name='activities_team_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['activity_type', 'created_at', 'id'], name='activities_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['created_at', 'id'], name='activities_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['total_calories', '-id'], name='leaderboard_calories_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+import hashlib
+
+from django.conf import settings
+from django.db import migrations
+
+
+def rebuild_team_aggregates(apps, schema_editor):
+    # 0008 tagged past activities with their authors' current teams, while
+    # the leaderboard and team rollups credited each activity to the team of
+    # its author when it was logged. Removing such an activity debits the
+    # tagged team, so both are rebuilt from the tags. Queued here, the way
+    # jobs.enqueue() would queue them, as the job table only exists since 0009.
+    Activity = apps.get_model('octofit_tracker', 'Activity')
+    Job = apps.get_model('octofit_tracker', 'Job')
+    if not Activity.objects.exists():
+        return
+    for name in ('rebuild_leaderboard', 'rebuild_rollups'):
+        Job.objects.get_or_create(
+            dedupe_key=hashlib.sha1(f'{name}:[]'.encode()).hexdigest(), status='pending',
+            defaults={'name': name, 'arguments': '[]', 'max_attempts': settings.OCTOFIT_JOB_MAX_ATTEMPTS},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('octofit_tracker', '0013_index_paginator_tie_breaker'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_team_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,121 @@
+import hashlib
+from calendar import timegm
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from octofit_tracker import versioning
+from octofit_tracker.fastpath import field_plan
+from octofit_tracker.serializers import requested_fields
+
+
+class ConditionalListMixin:
+    """
+    Answers list GETs with 304 Not Modified when none of the collections in
+    ``version_collections`` changed since the client's copy, without running
+    the queryset or the serializers.
+    """
+    version_collections = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalListMixin, self).list(request, *args, **kwargs)
+        )
+
+    def conditional_response(self, request, build, period_start=None):
+        """Return 304 if the client's copy is current, else the response from ``build()``.
+
+        ``period_start`` is given for responses covering a period that starts
+        anew without any write, e.g. the current day: a copy from an earlier
+        period is never current.
+        """
+        versions, last_modified = versioning.current(self.version_collections)
+        if period_start is not None and (last_modified is None or last_modified < period_start):
+            last_modified = period_start
+        # The absolute URI, as responses hold links built from the host and scheme
+        key = repr((
+            self.basename, request.build_absolute_uri(), request.accepted_renderer.format, versions, period_start,
+        ))
+        key = hashlib.md5(key.encode()).hexdigest()
+        etag = f'W/"{key}"'
+        timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = self.build_response(key, build)
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def build_response(self, key, build):
+        return build()
+
+
+class CachedResponseMixin(ConditionalListMixin):
+    """
+    Also serves list and detail GETs from the cache.
+
+    Entries are keyed by the same collection versions as the ETag, so the
+    signal-driven version bumps on every write retire them; stale entries are
+    never read again and simply expire.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def build_response(self, key, build):
+        cache_key = f'octofit:response:{key}'
+        data = cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+        response = build()
+        if isinstance(response, Response) and response.status_code == status.HTTP_200_OK:
+            cache.set(cache_key, response.data, settings.OCTOFIT_RESPONSE_CACHE_TIMEOUT)
+        return response
+
+
+class ProjectionMixin:
+    """
+    Fetches only the columns the serializer renders on read requests: the
+    ``?fields=`` subset if given, and never write-only columns such as
+    ``User.password``.
+    """
+
+    def get_field_plan(self):
+        serializer_class = self.get_serializer_class()
+        return field_plan(serializer_class, requested_fields(self.request, serializer_class))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            queryset = queryset.only(*self.get_field_plan().columns)
+        return queryset
+
+
+class FastListMixin(ProjectionMixin):
+    """
+    Serves list GETs from plain ``values()`` rows rendered by the serializer's
+    precompiled ``FieldPlan``, skipping per-instance ModelSerializer work.
+    """
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_field_plan()
+        # The cursor paginator reads its position from the ordering columns,
+        # so those are fetched even when they are not rendered.
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        columns = list(dict.fromkeys(plan.columns + [field.lstrip('-') for field in ordering]))
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(queryset))
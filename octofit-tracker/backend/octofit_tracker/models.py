@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class User(models.Model):
@@ -11,10 +12,21 @@ class User(models.Model):
 
     class Meta:
         db_table = 'users'
+        indexes = [
+            models.Index(fields=['team_id'], name='users_team_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a save can tell whether the team changed, see signals.py
+        if 'team_id' in field_names:
+            instance._loaded_team_id = values[field_names.index('team_id')]
+        return instance
+
 
 class Team(models.Model):
     name = models.CharField(max_length=200)
@@ -30,32 +42,62 @@ class Team(models.Model):
 
 class Activity(models.Model):
     user_id = models.CharField(max_length=100)
+    # The user's team when written; kept in step by aggregates.retag_activities
+    team_id = models.CharField(max_length=100, null=True, blank=True)
     activity_type = models.CharField(max_length=100)
     duration = models.IntegerField()  # in minutes
     calories = models.IntegerField()
     distance = models.FloatField(null=True, blank=True)  # in kilometers
     notes = models.TextField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         db_table = 'activities'
+        # Each ends with id, so it also serves the paginator's tie-breaker
+        indexes = [
+            models.Index(fields=['user_id', 'created_at', 'id'], name='activities_user_created_idx'),
+            models.Index(fields=['team_id', 'created_at', 'id'], name='activities_team_created_idx'),
+            models.Index(fields=['activity_type', 'created_at', 'id'], name='activities_type_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='activities_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.activity_type} - {self.duration} mins"
 
 
 class Leaderboard(models.Model):
-    team_id = models.CharField(max_length=100)
+    team_id = models.CharField(max_length=100, unique=True)
     total_calories = models.IntegerField(default=0)
     total_activities = models.IntegerField(default=0)
-    rank = models.IntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'leaderboard'
+        indexes = [
+            models.Index(fields=['total_calories', '-id'], name='leaderboard_calories_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        self._rank = None
+        super().__init__(*args, **kwargs)
+
+    @property
+    def rank(self):
+        """One plus the number of teams with more calories, unless given (windowed leaderboards).
+
+        Counting takes a query, so code handling many entries assigns their
+        ranks with ``leaderboard.ranks()`` instead.
+        """
+        if self._rank is not None:
+            return self._rank
+        return Leaderboard.objects.filter(total_calories__gt=self.total_calories).count() + 1
+
+    @rank.setter
+    def rank(self, value):
+        self._rank = value
 
     def __str__(self):
-        return f"Team {self.team_id} - Rank {self.rank}"
+        return f"Team {self.team_id} - {self.total_calories} calories"
 
 
 class Workout(models.Model):
@@ -72,3 +114,120 @@ class Workout(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class ActivityRollup(models.Model):
+    # Calories and activity count of one team or user on one day
+    TEAM = 'team'
+    USER = 'user'
+    SCOPE_CHOICES = [(TEAM, 'Team'), (USER, 'User')]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    owner_id = models.CharField(max_length=100)
+    day = models.DateField()
+    total_calories = models.IntegerField(default=0)
+    total_activities = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'activity_rollups'
+        unique_together = [('scope', 'owner_id', 'day')]
+        indexes = [
+            models.Index(fields=['scope', 'day'], name='rollups_scope_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.owner_id} on {self.day}"
+
+
+class UserActivityStats(models.Model):
+    # Running totals of one user's activities of one type
+    user_id = models.CharField(max_length=100)
+    activity_type = models.CharField(max_length=100)
+    total_activities = models.IntegerField(default=0)
+    total_minutes = models.IntegerField(default=0)
+    total_calories = models.IntegerField(default=0)
+    total_distance = models.FloatField(default=0)  # in kilometers
+
+    class Meta:
+        db_table = 'user_activity_stats'
+        unique_together = [('user_id', 'activity_type')]
+
+    def __str__(self):
+        return f"User {self.user_id} - {self.activity_type}"
+
+
+class UserScore(models.Model):
+    # All-time calories and activity count of one user, ranked by user_ranking.py
+    user_id = models.CharField(max_length=100, unique=True)
+    total_calories = models.IntegerField(default=0)
+    total_activities = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'user_scores'
+        indexes = [
+            # Walked backwards for the ranking order, most calories first
+            models.Index(fields=['total_calories', 'user_id'], name='user_scores_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"User {self.user_id} - {self.total_calories} calories"
+
+
+class UserScoreBucket(models.Model):
+    # One node of the Fenwick tree counting users per calorie bucket
+    node = models.IntegerField(unique=True)
+    users = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'user_score_buckets'
+
+    def __str__(self):
+        return f"Node {self.node} - {self.users} users"
+
+
+class CollectionVersion(models.Model):
+    # Write counter of one collection, bumped on every change to it
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'collection_versions'
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class Job(models.Model):
+    # A queued call of one of jobs.TASKS, run by manage.py run_workers
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    arguments = models.TextField(default='[]')  # JSON list
+    dedupe_key = models.CharField(max_length=40)  # hash of name and arguments
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    progress_done = models.IntegerField(default=0)
+    progress_total = models.IntegerField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'jobs'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='jobs_status_run_after_idx'),
+            models.Index(fields=['dedupe_key', 'status'], name='jobs_dedupe_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
@@ -0,0 +1,22 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class OctofitCursorPagination(CursorPagination):
+    """Keyset pagination: every page is a range scan starting at the cursor.
+
+    Clients may ask for a different page size with ``?page_size=``, capped at
+    ``OCTOFIT_MAX_PAGE_SIZE`` so a single request cannot pull a whole
+    collection into worker memory.
+    """
+    page_size = settings.OCTOFIT_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.OCTOFIT_MAX_PAGE_SIZE
+
+
+class ActivityCursorPagination(OctofitCursorPagination):
+    ordering = ('-created_at', '-id')
+
+
+class UserCursorPagination(OctofitCursorPagination):
+    ordering = ('id',)
@@ -0,0 +1,29 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """Parses newline-delimited JSON lazily, one object per line.
+
+    Returns a generator, so the body is read from the stream as the view
+    consumes it instead of being loaded into memory up front. A line that is
+    not valid JSON is yielded as a ``ParseError`` instance, so callers can
+    report it for that row and carry on with the rest.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        return self._rows(stream or [], encoding)
+
+    def _rows(self, stream, encoding):
+        for line in stream:
+            line = line.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                yield ParseError(f'JSON parse error - {exc}')
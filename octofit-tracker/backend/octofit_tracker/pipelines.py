@@ -0,0 +1,335 @@
+"""Analytics aggregates as native MongoDB aggregation pipelines.
+
+djongo translates ORM queries to MongoDB through SQL, which is slow and
+has no reliable translation for grouped aggregates. On djongo the functions
+below send ``$match``/``$group``/``$sort``/``$setWindowFields`` pipelines
+straight to pymongo instead, so only the aggregated rows cross the wire.
+
+Each function has an ORM implementation with identical results, used on
+other database backends (SQLite in the test suite) and checked against the
+pipelines by the parity tests. ``$setWindowFields`` needs MongoDB 5.0.
+"""
+from datetime import date, datetime, time, timezone as dt_timezone
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from octofit_tracker.models import Activity, ActivityRollup, Leaderboard, Team, UserActivityStats
+
+STATS_COUNTERS = ('total_activities', 'total_minutes', 'total_calories', 'total_distance')
+
+
+def native():
+    """Whether the pipelines can run, i.e. the database is MongoDB."""
+    return connection.vendor == 'djongo'
+
+
+def collection(model):
+    connection.ensure_connection()
+    return connection.connection[model._meta.db_table]
+
+
+def increment(model, lookup, deltas, **values):
+    """Add ``deltas`` to counters of the rows matching ``lookup`` and set ``values``; returns the rows matched.
+
+    ``lookup`` holds exact matches on fields, or ``field__in`` lists of
+    values. djongo cannot translate ``SET counter = counter + n``, so on
+    MongoDB this is a ``$inc`` instead.
+    """
+    if native():
+        update = {}
+        if deltas:
+            update['$inc'] = {_column(model, name): delta for name, delta in deltas.items()}
+        if values:
+            update['$set'] = {_column(model, name): _bson(value) for name, value in values.items()}
+        query = {}
+        for name, value in lookup.items():
+            if name.endswith('__in'):
+                query[_column(model, name[:-len('__in')])] = {'$in': [_bson(item) for item in value]}
+            else:
+                query[_column(model, name)] = _bson(value)
+        return collection(model).update_many(query, update).matched_count
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    return model.objects.filter(**lookup).update(**changes, **values)
+
+
+def merge_rows(model, key_fields, rows, batch_size=1000, report=None):
+    """Write the unsaved ``rows`` over the stored rows with the same ``key_fields``; returns how many were written.
+
+    For rebuilds that run alongside live writes: stored rows are updated in
+    place and missing ones inserted, batch by batch, so a row a live write
+    creates meanwhile is overwritten rather than inserted twice. Rows that
+    were stored before the call and whose key is not among ``rows`` are
+    deleted at the end. ``report`` is called with the running count after
+    each batch.
+    """
+    last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    keys = set()
+    written = 0
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        if native():
+            _merge_native(model, key_fields, fields, batch)
+        else:
+            model.objects.bulk_create(
+                batch, update_conflicts=True, unique_fields=key_fields,
+                update_fields=[field.name for field in fields if field.name not in key_fields],
+            )
+        keys.update(tuple(getattr(row, name) for name in key_fields) for row in batch)
+        written += len(batch)
+        if report is not None:
+            report(written)
+
+    if last_pk is not None:
+        stored = model.objects.filter(pk__lte=last_pk).values_list('pk', *key_fields)
+        stale = [pk for pk, *key in stored.iterator() if tuple(key) not in keys]
+        for start in range(0, len(stale), batch_size):
+            model.objects.filter(pk__in=stale[start:start + batch_size]).delete()
+    return written
+
+
+def _merge_native(model, key_fields, fields, batch):
+    # No upserts: they would store documents without djongo's id. Update the
+    # stored rows in one round trip, then insert the rest through the ORM.
+    values = [
+        {field.name: field.pre_save(row, True) for field in fields if field.name not in key_fields} for row in batch
+    ]
+    lookups = [{name: getattr(row, name) for name in key_fields} for row in batch]
+    queries = [{_column(model, name): _bson(value) for name, value in lookup.items()} for lookup in lookups]
+    table = collection(model)
+    table.bulk_write([
+        UpdateOne(query, {'$set': {_column(model, name): _bson(value) for name, value in update.items()}})
+        for query, update in zip(queries, values)
+    ], ordered=False)
+    columns = [_column(model, name) for name in key_fields]
+    stored = {
+        tuple(document[column] for column in columns)
+        for document in table.find({'$or': queries}, {column: True for column in columns})
+    }
+    missing = [
+        (row, lookup, update) for row, lookup, update, query in zip(batch, lookups, values, queries)
+        if tuple(query.values()) not in stored
+    ]
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create([row for row, _, _ in missing])
+    except IntegrityError:
+        # A live write created some of them first
+        for row, lookup, update in missing:
+            if not increment(model, lookup, {}, **update):
+                model.objects.create(**lookup, **update)
+
+
+def _column(model, name):
+    return model._meta.pk.column if name == 'pk' else model._meta.get_field(name).column
+
+
+def _bson(value):
+    # BSON has no date type; djongo stores dates as midnight datetimes
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, time.min)
+    return value
+
+
+def team_totals():
+    """All-time ``{team_id: [calories, activities]}``, with every team present.
+
+    Grouped on the team each activity is tagged with, in one pass.
+    """
+    totals = {str(team_id): [0, 0] for team_id in _team_ids()}
+    for team_id, calories, activities in _tagged_team_totals():
+        if team_id:
+            totals[team_id] = [calories, activities]
+    return totals
+
+
+def _team_ids():
+    if native():
+        return collection(Team).distinct('id')
+    return Team.objects.values_list('id', flat=True)
+
+
+def _tagged_team_totals():
+    """``(team_id, calories, activities)`` per team tagged on activities."""
+    if native():
+        rows = collection(Activity).aggregate([
+            {'$match': {'team_id': {'$nin': [None, '']}}},
+            {'$group': {'_id': '$team_id', 'calories': {'$sum': '$calories'}, 'activities': {'$sum': 1}}},
+        ])
+        return [(row['_id'], row['calories'], row['activities']) for row in rows]
+    rows = (
+        Activity.objects.exclude(team_id=None).exclude(team_id='')
+        .values('team_id').annotate(calories=Sum('calories'), activities=Count('id'))
+    )
+    return [(row['team_id'], row['calories'] or 0, row['activities']) for row in rows]
+
+
+def window_team_ranking(start):
+    """Rank teams by the calories of their day buckets since ``start`` (a date).
+
+    Returns ``{team_id, total_calories, total_activities, rank}`` dicts in
+    rank order, ties by team id, with competition ranking (1, 1, 3). Teams on
+    the all-time leaderboard without activity in the window rank at zero.
+    """
+    if native():
+        return list(collection(ActivityRollup).aggregate([
+            {'$match': {'scope': ActivityRollup.TEAM, 'day': {'$gte': datetime.combine(start, time.min)}}},
+            {'$project': {'team_id': '$owner_id', 'calories': '$total_calories', 'activities': '$total_activities'}},
+            {'$unionWith': {'coll': Leaderboard._meta.db_table, 'pipeline': [
+                {'$project': {'team_id': 1, 'calories': {'$literal': 0}, 'activities': {'$literal': 0}}},
+            ]}},
+            {'$group': {'_id': '$team_id', 'calories': {'$sum': '$calories'}, 'activities': {'$sum': '$activities'}}},
+            {'$setWindowFields': {'sortBy': {'calories': -1}, 'output': {'rank': {'$rank': {}}}}},
+            {'$sort': {'rank': 1, '_id': 1}},
+            {'$project': {
+                '_id': 0, 'team_id': '$_id', 'total_calories': '$calories',
+                'total_activities': '$activities', 'rank': 1,
+            }},
+        ]))
+
+    totals = dict.fromkeys(Leaderboard.objects.values_list('team_id', flat=True), (0, 0))
+    buckets = (
+        ActivityRollup.objects
+        .filter(scope=ActivityRollup.TEAM, day__gte=start)
+        .values('owner_id')
+        .annotate(calories=Sum('total_calories'), activities=Sum('total_activities'))
+    )
+    for row in buckets:
+        totals[row['owner_id']] = (row['calories'] or 0, row['activities'] or 0)
+    return rank(totals)
+
+
+def rank(totals):
+    """Competition-rank ``{team_id: (calories, activities)}`` like ``$rank`` does."""
+    ordered = sorted(totals.items(), key=lambda item: (-item[1][0], item[0]))
+    ranked = []
+    for position, (team_id, (calories, activities)) in enumerate(ordered):
+        if ranked and calories == ranked[-1]['total_calories']:
+            position_rank = ranked[-1]['rank']
+        else:
+            position_rank = position + 1
+        ranked.append({
+            'team_id': team_id, 'total_calories': calories, 'total_activities': activities, 'rank': position_rank,
+        })
+    return ranked
+
+
+def user_totals():
+    """All-time ``(user_id, calories, activities)`` for every user with activity."""
+    if native():
+        rows = collection(Activity).aggregate([
+            {'$group': {'_id': '$user_id', 'calories': {'$sum': '$calories'}, 'activities': {'$sum': 1}}},
+        ], allowDiskUse=True)
+        return ((row['_id'], row['calories'], row['activities']) for row in rows)
+    rows = Activity.objects.values('user_id').annotate(calories=Sum('calories'), activities=Count('id'))
+    return ((row['user_id'], row['calories'] or 0, row['activities']) for row in rows.iterator())
+
+
+def user_day_totals():
+    """``(user_id, day, calories, activities)`` for every user and local day with activity."""
+    return _day_totals('user_id')
+
+
+def team_day_totals():
+    """``(team_id, day, calories, activities)`` for every tagged team and local day with activity."""
+    return _day_totals('team_id')
+
+
+def _day_totals(owner):
+    if native():
+        rows = collection(Activity).aggregate([
+            {'$match': {owner: {'$nin': [None, '']}}},
+            {'$group': {
+                '_id': {
+                    'owner': f'${owner}',
+                    'day': {'$dateTrunc': {'date': '$created_at', 'unit': 'day', 'timezone': settings.TIME_ZONE}},
+                },
+                'calories': {'$sum': '$calories'},
+                'activities': {'$sum': 1},
+            }},
+        ], allowDiskUse=True)
+        return (
+            (row['_id']['owner'], _local_date(row['_id']['day']), row['calories'], row['activities'])
+            for row in rows
+        )
+    rows = (
+        Activity.objects.exclude(**{owner: None}).exclude(**{owner: ''})
+        .annotate(day=TruncDate('created_at'))
+        .values(owner, 'day')
+        .annotate(calories=Sum('calories'), activities=Count('id'))
+    )
+    return ((row[owner], row['day'], row['calories'] or 0, row['activities']) for row in rows.iterator())
+
+
+def _local_date(value):
+    # pymongo returns naive UTC datetimes; $dateTrunc gives local midnight as such
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return timezone.localdate(value)
+
+
+def user_type_totals():
+    """Activities, minutes, calories and distance per user and activity type."""
+    if native():
+        rows = collection(Activity).aggregate([
+            {'$group': {
+                '_id': {'user_id': '$user_id', 'activity_type': '$activity_type'},
+                'activities': {'$sum': 1},
+                'minutes': {'$sum': '$duration'},
+                'calories': {'$sum': '$calories'},
+                'distance': {'$sum': {'$ifNull': ['$distance', 0]}},
+            }},
+        ], allowDiskUse=True)
+        return (
+            {**row['_id'], **{key: row[key] for key in ('activities', 'minutes', 'calories', 'distance')}}
+            for row in rows
+        )
+    rows = Activity.objects.values('user_id', 'activity_type').annotate(
+        activities=Count('id'),
+        minutes=Sum('duration'),
+        calories=Sum('calories'),
+        distance=Sum('distance'),
+    )
+    return (
+        {**row, 'minutes': row['minutes'] or 0, 'calories': row['calories'] or 0, 'distance': row['distance'] or 0}
+        for row in rows.iterator()
+    )
+
+
+def user_stats_totals(user_id):
+    """A user's totals and the per-type rows they sum, from ``UserActivityStats``.
+
+    Returns ``(totals, rows)``; rows are ordered by activity type and only
+    types with activity are included.
+    """
+    if native():
+        result = list(collection(UserActivityStats).aggregate([
+            {'$match': {'user_id': str(user_id), 'total_activities': {'$gt': 0}}},
+            {'$sort': {'activity_type': 1}},
+            {'$group': {
+                '_id': None,
+                **{counter: {'$sum': f'${counter}'} for counter in STATS_COUNTERS},
+                'rows': {'$push': {'activity_type': '$activity_type', **{
+                    counter: f'${counter}' for counter in STATS_COUNTERS
+                }}},
+            }},
+        ]))
+        if not result:
+            return dict.fromkeys(STATS_COUNTERS, 0), []
+        rows = result[0].pop('rows')
+        return {counter: result[0][counter] for counter in STATS_COUNTERS}, rows
+
+    rows = list(
+        UserActivityStats.objects.filter(user_id=str(user_id), total_activities__gt=0)
+        .order_by('activity_type')
+        .values('activity_type', *STATS_COUNTERS)
+    )
+    totals = {counter: sum(row[counter] for row in rows) for counter in STATS_COUNTERS}
+    return totals, rows
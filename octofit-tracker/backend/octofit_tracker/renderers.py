@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+
+from bson import ObjectId
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+
+class OctofitJSONEncoder(JSONEncoder):
+    """DRF's encoder, extended with the ``bson`` types djongo hands back."""
+
+    def default(self, obj):
+        if isinstance(obj, ObjectId):
+            return str(obj)
+        return super().default(obj)
+
+
+_encoder = OctofitJSONEncoder()
+
+
+def dumps(data):
+    """Encode ``data`` as compact UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        # OPT_UTC_Z writes UTC datetimes with a "Z" suffix, like DRF's encoder
+        return orjson.dumps(data, default=_encoder.default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=OctofitJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer backed by orjson, which encodes dicts, strings, datetimes
+    and UUIDs natively; only the rare other types (ObjectId, Decimal) call
+    back into ``OctofitJSONEncoder.default``.
+
+    Indented output (``application/json; indent=4`` and the browsable API)
+    and installs without orjson use the stdlib encoder.
+    """
+    encoder_class = OctofitJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Selects CSV output for streaming views, which write their own body.
+
+    DRF only renders through it for error responses, which come out as
+    ``field,message`` rows.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        items = data.items() if isinstance(data, dict) else [('detail', data)]
+        for field, messages in items:
+            for message in messages if isinstance(messages, list) else [messages]:
+                writer.writerow([field, message])
+        return buffer.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Selects newline-delimited JSON output for streaming views, which write
+    their own body; error responses render as a single JSON line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data) + b'\n'
@@ -0,0 +1,80 @@
+"""Per-day calorie/activity buckets for teams and users.
+
+Time-windowed leaderboards sum a handful of day buckets instead of scanning
+``Activity.created_at`` ranges. Buckets are kept current by the activity write
+hooks in ``aggregates.py``.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from octofit_tracker import jobs, pipelines
+from octofit_tracker.models import ActivityRollup, Leaderboard
+
+WINDOWS = ('day', 'week', 'month')
+
+
+def activity_day(activity):
+    return timezone.localdate(activity.created_at)
+
+
+def apply_deltas(deltas):
+    """Apply ``{(scope, owner_id, day): (calories_delta, activities_delta)}``."""
+    for (scope, owner_id, day), (calories, activities) in deltas.items():
+        if calories or activities:
+            increment_or_create(
+                ActivityRollup,
+                {'scope': scope, 'owner_id': str(owner_id), 'day': day},
+                {'total_calories': calories, 'total_activities': activities},
+            )
+
+
+def increment_or_create(model, lookup, deltas):
+    """Add ``deltas`` to the counters of the row matching ``lookup``, creating it if needed."""
+    if pipelines.increment(model, lookup, deltas):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Another writer created the row first
+        pipelines.increment(model, lookup, deltas)
+
+
+def window_start(window, today=None):
+    today = today or timezone.localdate()
+    if window == 'day':
+        return today
+    if window == 'week':
+        return today - timedelta(days=today.weekday())
+    if window == 'month':
+        return today.replace(day=1)
+    raise ValueError(f'Unknown window {window!r}')
+
+
+def window_leaderboard(window, today=None):
+    """Rank teams by the calories they logged in the current day, week or month.
+
+    Returns unsaved ``Leaderboard`` instances so the regular serializer can
+    render them. Teams on the all-time leaderboard without activity in the
+    window are listed with zero totals.
+    """
+    return [Leaderboard(**row) for row in pipelines.window_team_ranking(window_start(window, today))]
+
+
+def rebuild(batch_size=1000):
+    """Recompute every bucket from the activities collection.
+
+    Both scopes come grouped per owner and day from the pipelines, the team
+    buckets on the team each activity is tagged with, and are merged into
+    the stored buckets in batches without being held in memory, so activity
+    writes may go on meanwhile.
+    """
+    scopes = ((ActivityRollup.USER, pipelines.user_day_totals), (ActivityRollup.TEAM, pipelines.team_day_totals))
+    pending = (
+        ActivityRollup(scope=scope, owner_id=owner_id, day=day, total_calories=calories, total_activities=activities)
+        for scope, totals in scopes
+        for owner_id, day, calories, activities in totals()
+    )
+    pipelines.merge_rows(ActivityRollup, ['scope', 'owner_id', 'day'], pending, batch_size, report=jobs.progress)
@@ -1,87 +1,159 @@
+from django.db.models import Count
 from rest_framework import serializers
-from bson import ObjectId
+from rest_framework.permissions import SAFE_METHODS
+from octofit_tracker import leaderboard
+from octofit_tracker.fastpath import field_plan
 from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
-
-
-class UserSerializer(serializers.ModelSerializer):
+from octofit_tracker.team_names import get_team_names
+
+
+def requested_fields(request, serializer_class):
+    """Return the ``?fields=`` of a read request as a frozenset, or None for every field."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    fields = frozenset(name.strip() for name in value.split(',') if name.strip())
+    readable = [name for name, _ in field_plan(serializer_class).fields]
+    unknown = fields.difference(readable)
+    if unknown:
+        raise serializers.ValidationError({
+            'fields': [f"Unknown field(s): {', '.join(sorted(unknown))}. Choose from: {', '.join(readable)}."]
+        })
+    return fields
+
+
+class SparseFieldsMixin:
+    """Drops the fields a read request left out of ``?fields=``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'), type(self))
+        if fields is not None:
+            for name in list(self.fields):
+                if name not in fields:
+                    self.fields.pop(name)
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'name', 'username', 'email', 'password', 'team_id', 'created_at']
         extra_kwargs = {'password': {'write_only': True}}
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        if '_id' in representation and isinstance(representation['_id'], ObjectId):
-            representation['_id'] = str(representation['_id'])
-        if representation.get('id') and isinstance(representation['id'], ObjectId):
-            representation['id'] = str(representation['id'])
-        return representation
 
+def members_counts(team_ids):
+    """Return ``{team_id: member count}`` for the given teams."""
+    team_ids = [str(team_id) for team_id in team_ids]
+    counts = dict.fromkeys(team_ids, 0)
+    if team_ids:
+        rows = User.objects.filter(team_id__in=team_ids).values('team_id').annotate(count=Count('id'))
+        counts.update((row['team_id'], row['count']) for row in rows)
+    return counts
+
+
+class TeamListSerializer(serializers.ListSerializer):
+    """Counts the members of every listed team in one grouped query."""
 
-class TeamSerializer(serializers.ModelSerializer):
+    def to_representation(self, data):
+        teams = list(data.all() if hasattr(data, 'all') else data)
+        if 'members_count' in self.child.fields:
+            self._context['members_counts'] = members_counts(team.id for team in teams)
+        return super().to_representation(teams)
+
+
+class TeamSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     members_count = serializers.SerializerMethodField()
+    # Columns the method fields read, fetched even when not themselves requested
+    method_field_columns = {'members_count': ('id',)}
 
     class Meta:
         model = Team
         fields = ['id', 'name', 'description', 'members_count', 'created_at']
+        list_serializer_class = TeamListSerializer
 
     def get_members_count(self, obj):
+        counts = self.context.get('members_counts')
+        if counts is not None and str(obj.id) in counts:
+            return counts[str(obj.id)]
         return User.objects.filter(team_id=str(obj.id)).count()
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        if '_id' in representation and isinstance(representation['_id'], ObjectId):
-            representation['_id'] = str(representation['_id'])
-        if representation.get('id') and isinstance(representation['id'], ObjectId):
-            representation['id'] = str(representation['id'])
-        return representation
+    @classmethod
+    def fill_method_fields(cls, rows, items, context):
+        """Fill ``members_count`` on the items rendered from plain dict rows, see ``fastpath.FieldPlan``."""
+        counts = context.get('members_counts')
+        if counts is None:
+            counts = members_counts(row['id'] for row in rows)
+        for row, item in zip(rows, items):
+            item['members_count'] = counts[str(row['id'])]
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Activity
-        fields = ['id', 'user_id', 'activity_type', 'duration', 'calories', 'distance', 'notes', 'created_at']
+        fields = ['id', 'user_id', 'team_id', 'activity_type', 'duration', 'calories', 'distance', 'notes', 'created_at']
+        read_only_fields = ['team_id', 'created_at']
+
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        if '_id' in representation and isinstance(representation['_id'], ObjectId):
-            representation['_id'] = str(representation['_id'])
-        if representation.get('id') and isinstance(representation['id'], ObjectId):
-            representation['id'] = str(representation['id'])
-        return representation
+class LeaderboardListSerializer(serializers.ListSerializer):
+    """Resolves the team names of every listed entry in one lookup.
 
+    Entries without a given rank must be the top of the leaderboard in
+    ``leaderboard.ORDERING``; they are ranked from their totals, rather than
+    with one count per entry.
+    """
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+    def to_representation(self, data):
+        entries = list(data.all() if hasattr(data, 'all') else data)
+        if 'team_name' in self.child.fields:
+            self._context['team_names'] = get_team_names(entry.team_id for entry in entries)
+        if 'rank' in self.child.fields and any(entry._rank is None for entry in entries):
+            for entry, rank in zip(entries, leaderboard.ranks([entry.total_calories for entry in entries])):
+                entry.rank = rank
+        return super().to_representation(entries)
+
+
+class LeaderboardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     team_name = serializers.SerializerMethodField()
+    rank = serializers.SerializerMethodField()
+    # Columns the method fields read, fetched even when not themselves requested
+    method_field_columns = {'team_name': ('team_id',), 'rank': ('total_calories',)}
 
     class Meta:
         model = Leaderboard
         fields = ['id', 'team_id', 'team_name', 'total_calories', 'total_activities', 'rank', 'updated_at']
+        list_serializer_class = LeaderboardListSerializer
 
     def get_team_name(self, obj):
-        try:
-            return Team.objects.get(id=obj.team_id).name
-        except (Team.DoesNotExist, ValueError):
-            return obj.team_id
-
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        if '_id' in representation and isinstance(representation['_id'], ObjectId):
-            representation['_id'] = str(representation['_id'])
-        if representation.get('id') and isinstance(representation['id'], ObjectId):
-            representation['id'] = str(representation['id'])
-        return representation
-
-
-class WorkoutSerializer(serializers.ModelSerializer):
+        names = self.context.get('team_names')
+        if names is None:
+            names = get_team_names([obj.team_id])
+        return names.get(str(obj.team_id), obj.team_id)
+
+    def get_rank(self, obj):
+        return obj.rank
+
+    @classmethod
+    def fill_method_fields(cls, rows, items, context):
+        """Fill the method fields of items rendered from plain dict rows, see ``fastpath.FieldPlan``.
+
+        The rows must be the top of the leaderboard in ``leaderboard.ORDERING``.
+        """
+        if not items:
+            return
+        if 'team_name' in items[0]:
+            names = context.get('team_names')
+            if names is None:
+                names = get_team_names(row['team_id'] for row in rows)
+            for row, item in zip(rows, items):
+                item['team_name'] = names.get(str(row['team_id']), row['team_id'])
+        if 'rank' in items[0]:
+            for item, rank in zip(items, leaderboard.ranks([row['total_calories'] for row in rows])):
+                item['rank'] = rank
+
+
+class WorkoutSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Workout
         fields = ['id', 'name', 'description', 'difficulty', 'duration', 'calories_estimate', 'category', 'created_at']
-
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        if '_id' in representation and isinstance(representation['_id'], ObjectId):
-            representation['_id'] = str(representation['_id'])
-        if representation.get('id') and isinstance(representation['id'], ObjectId):
-            representation['id'] = str(representation['id'])
-        return representation
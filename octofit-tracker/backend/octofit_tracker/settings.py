@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,7 +52,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'octofit_tracker.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'octofit_tracker.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,6 +100,48 @@ DATABASES = {
     }
 }
 
+# OCTOFIT_DATABASE=sqlite swaps MongoDB for an in-process SQLite stand-in;
+# run_benchmarks uses it when no mongod is reachable. Its file lives in the
+# temporary directory unless OCTOFIT_SQLITE_PATH says otherwise, so it never
+# lands in the working tree.
+if os.environ.get('OCTOFIT_DATABASE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('OCTOFIT_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'octofit_db.sqlite3')),
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# OCTOFIT_CACHE_URL picks the backend: unset for per-process local memory,
+# file:///some/dir for a directory shared by the workers of one host, or
+# redis://host:port/db for Redis (requires the redis package).
+
+CACHE_URL = os.environ.get('OCTOFIT_CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith('file://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_URL[len('file://'):],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'octofit',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -160,3 +205,64 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'octofit_tracker.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# OctoFit settings
+# Seconds a team name stays in the process-local cache used by the leaderboard
+OCTOFIT_TEAM_NAME_TTL = 60
+
+# Seconds a cached API response is kept; writes retire entries earlier
+OCTOFIT_RESPONSE_CACHE_TIMEOUT = 300
+
+# Default and maximum page size of the cursor-paginated endpoints
+OCTOFIT_PAGE_SIZE = 50
+OCTOFIT_MAX_PAGE_SIZE = 500
+
+# Rows validated and inserted per batch by POST /api/activities/bulk/
+OCTOFIT_BULK_CHUNK_SIZE = 500
+
+# Responses smaller than this many bytes are sent uncompressed
+OCTOFIT_COMPRESSION_MIN_SIZE = 1024
+
+# asgi.py sets OCTOFIT_ASYNC_READS=1 so the list reads run as coroutines
+# backed by a pool of this many threads (the cap on concurrent DB reads)
+OCTOFIT_ASYNC_READS = os.environ.get('OCTOFIT_ASYNC_READS') == '1'
+OCTOFIT_ASYNC_READ_THREADS = 32
+
+# Per-user ranking (see octofit_tracker.user_ranking): calories per rank
+# bucket and the number of buckets; scores past the last bucket share it.
+# Changing either needs a rebuild_user_ranking job.
+OCTOFIT_USER_RANK_BUCKET_WIDTH = 100
+OCTOFIT_USER_RANK_BUCKETS = 16384
+
+# Job queue worked off by manage.py run_workers (see octofit_tracker.jobs):
+# runs per job before it fails for good, seconds before the first retry
+# (doubled on each further one), seconds a running job's heartbeat may age
+# (its worker refreshes it every quarter of that) before another worker
+# takes the job over, seconds an idle worker waits between looks at the
+# queue, and seconds between a worker's sweeps for such silent jobs
+OCTOFIT_JOB_MAX_ATTEMPTS = 3
+OCTOFIT_JOB_RETRY_DELAY = 10
+OCTOFIT_JOB_TIMEOUT = 600
+OCTOFIT_JOB_POLL_INTERVAL = 1.0
+OCTOFIT_JOB_REQUEUE_INTERVAL = 60
+
+# Threads fetching the sections of GET /api/dashboard/ concurrently; 0
+# fetches them one after another in the request thread
+OCTOFIT_DASHBOARD_THREADS = 5
+
+# GET /api/leaderboard/live/ (ASGI only, see octofit_tracker.live): seconds
+# over which leaderboard changes are coalesced into one broadcast, events
+# queued per client before it is resent a snapshot instead, seconds between
+# keep-alive comments, and the backend carrying change notifications
+# between processes
+OCTOFIT_LIVE_INTERVAL = 1.0
+OCTOFIT_LIVE_QUEUE_SIZE = 16
+OCTOFIT_LIVE_KEEPALIVE = 15
+OCTOFIT_LIVE_BACKEND = 'octofit_tracker.live.LocalBackend'
@@ -0,0 +1,45 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from octofit_tracker import jobs, metrics, team_names, versioning
+from octofit_tracker.models import Leaderboard, Team, User, Workout
+
+
+@receiver([post_save, post_delete], sender=Team)
+def invalidate_team_name(sender, instance, **kwargs):
+    team_names.invalidate(instance.pk)
+
+
+# Activities are versioned by aggregates.ActivityChanges instead: every
+# activity write goes through it, and a receiver here would turn bulk deletes
+# of the largest collection into row-by-row deletes.
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Team)
+@receiver([post_save, post_delete], sender=Leaderboard)
+@receiver([post_save, post_delete], sender=Workout)
+def bump_collection_version(sender, instance, **kwargs):
+    versioning.bump(sender._meta.db_table)
+
+
+@receiver(post_save, sender=User)
+def retag_activities_on_team_change(sender, instance, created, update_fields=None, **kwargs):
+    # Changes through QuerySet.update() bypass this; enqueue
+    # retag_activities for the affected users afterwards.
+    if created or (update_fields is not None and 'team_id' not in update_fields):
+        return
+    # Instances not loaded from the database have no _loaded_team_id and are
+    # always re-tagged, which is a no-op when the team did not change.
+    if (getattr(instance, '_loaded_team_id', object()) or None) == (instance.team_id or None):
+        return
+    instance._loaded_team_id = instance.team_id
+    # Queued in the same transaction as the change, see octofit_tracker.jobs
+    jobs.enqueue('retag_activities', instance.pk)
+
+
+@receiver(connection_created)
+def time_sql_statements(sender, connection, **kwargs):
+    # djongo round-trips are timed by metrics.MongoCommandListener instead;
+    # wrapping its SQL as well would count them twice.
+    if connection.vendor != 'djongo':
+        connection.execute_wrappers.append(metrics.sql_execute_wrapper)
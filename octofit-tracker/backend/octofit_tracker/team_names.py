@@ -0,0 +1,57 @@
+"""Process-local cache of team names.
+
+The leaderboard is polled far more often than teams change, so names are kept
+in memory for ``OCTOFIT_TEAM_NAME_TTL`` seconds. Saving or deleting a Team
+drops its entry in this process (see ``signals.py``); the TTL bounds how long
+other worker processes can serve a stale name.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from octofit_tracker.models import Team
+
+_lock = threading.Lock()
+_names = {}  # team_id -> (name or None, expires_at)
+_generation = 0
+
+
+def get_team_names(team_ids):
+    """Return ``{team_id: name}`` for every given id that names an existing team."""
+    now = time.monotonic()
+    names, missing = {}, []
+    with _lock:
+        generation = _generation
+        for team_id in {str(team_id) for team_id in team_ids}:
+            cached = _names.get(team_id)
+            if cached and cached[1] > now:
+                names[team_id] = cached[0]
+            else:
+                missing.append(team_id)
+
+    if missing:
+        lookup = [team_id for team_id in missing if team_id.isdigit()]
+        fetched = dict.fromkeys(missing)
+        if lookup:
+            fetched.update((str(pk), name) for pk, name in Team.objects.filter(id__in=lookup).values_list('id', 'name'))
+        expires_at = now + settings.OCTOFIT_TEAM_NAME_TTL
+        with _lock:
+            # Skip storing if a team changed while we were reading, the rows
+            # we fetched may predate that change.
+            if generation == _generation:
+                _names.update((team_id, (name, expires_at)) for team_id, name in fetched.items())
+        names.update(fetched)
+
+    return {team_id: name for team_id, name in names.items() if name is not None}
+
+
+def invalidate(team_id=None):
+    """Forget one team's cached name, or every name when ``team_id`` is None."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if team_id is None:
+            _names.clear()
+        else:
+            _names.pop(str(team_id), None)
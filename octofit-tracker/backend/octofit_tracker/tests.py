@@ -1,9 +1,67 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipIf
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.apps import apps
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.models.sql.subqueries import UpdateQuery
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from bson import ObjectId
+from djongo.base import DatabaseWrapper as DjongoDatabaseWrapper
+from djongo.exceptions import SQLDecodeError
+from djongo.sql2mongo.query import Query as DjongoQuery
+from rest_framework.decorators import api_view
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 from rest_framework.test import APITestCase
 from rest_framework import status
-from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
+from octofit_tracker import (
+    aggregates, dashboard, exports, jobs, leaderboard, live, metrics, pipelines, renderers, rollups, team_names,
+    user_ranking, user_stats, versioning,
+)
+from octofit_tracker.aggregates import record_activity_changes
+from octofit_tracker.async_reads import async_read, offload
+from octofit_tracker.models import (
+    CollectionVersion, Job, User, Team, Activity, ActivityRollup, Leaderboard, UserActivityStats, UserScore,
+    UserScoreBucket, Workout
+)
+from octofit_tracker.fastpath import field_plan
+from octofit_tracker.management.commands.bench_concurrency import read_response
+from octofit_tracker.management.commands.check_query_plans import HOT_QUERIES, plan_stages, sort_spec
+from octofit_tracker.management.commands import run_benchmarks
+from octofit_tracker.middleware import negotiate_encoding
+from octofit_tracker.pagination import ActivityCursorPagination
+from octofit_tracker.serializers import (
+    ActivitySerializer, LeaderboardSerializer, TeamSerializer, UserSerializer, WorkoutSerializer
+)
+
+
 
+class OctofitAPITestCase(APITestCase):
+    def tearDown(self):
+        # Cached responses are keyed by collection versions, which roll back
+        # with each test's data and would otherwise collide across tests.
+        cache.clear()
+        super().tearDown()
 
 class UserModelTest(TestCase):
     def setUp(self):
@@ -54,7 +112,17 @@ class LeaderboardModelTest(TestCase):
         )
 
     def test_leaderboard_str(self):
-        self.assertIn('Rank 1', str(self.entry))
+        with self.assertNumQueries(0):
+            self.assertEqual(str(self.entry), f'Team {self.entry.team_id} - 1500 calories')
+
+    def test_serializing_many_entries_ranks_them_without_counting(self):
+        for team_id, calories in (('2', 1500), ('3', 900), ('4', 2000)):
+            Leaderboard.objects.create(team_id=team_id, total_calories=calories)
+        entries = Leaderboard.objects.order_by(*leaderboard.ORDERING)
+        with CaptureQueriesContext(connection) as queries:
+            data = LeaderboardSerializer(entries, many=True).data
+        self.assertEqual([(entry['team_id'], entry['rank']) for entry in data], [('4', 1), ('1', 2), ('2', 2), ('3', 4)])
+        self.assertFalse([query for query in queries if 'COUNT' in query['sql'].upper()])
 
 
 class WorkoutModelTest(TestCase):
@@ -72,7 +140,7 @@ class WorkoutModelTest(TestCase):
         self.assertEqual(str(self.workout), 'Morning Run')
 
 
-class UserAPITest(APITestCase):
+class UserAPITest(OctofitAPITestCase):
     def setUp(self):
         self.user = User.objects.create(
             name='API User',
@@ -92,7 +160,7 @@ class UserAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
 
-class TeamAPITest(APITestCase):
+class TeamAPITest(OctofitAPITestCase):
     def setUp(self):
         self.team = Team.objects.create(name='Test Team', description='Desc')
 
@@ -102,7 +170,7 @@ class TeamAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
-class ActivityAPITest(APITestCase):
+class ActivityAPITest(OctofitAPITestCase):
     def setUp(self):
         self.activity = Activity.objects.create(
             user_id='1', activity_type='Cycling', duration=45, calories=400
@@ -114,7 +182,7 @@ class ActivityAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
-class LeaderboardAPITest(APITestCase):
+class LeaderboardAPITest(OctofitAPITestCase):
     def setUp(self):
         self.entry = Leaderboard.objects.create(
             team_id='1', total_calories=2000, total_activities=15, rank=1
@@ -126,7 +194,7 @@ class LeaderboardAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
-class WorkoutAPITest(APITestCase):
+class WorkoutAPITest(OctofitAPITestCase):
     def setUp(self):
         self.workout = Workout.objects.create(
             name='Yoga', description='Relaxing yoga session',
@@ -140,7 +208,1530 @@ class WorkoutAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
-class APIRootTest(APITestCase):
+class APIRootTest(OctofitAPITestCase):
     def test_api_root(self):
         response = self.client.get('/api/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class LeaderboardIncrementalTest(OctofitAPITestCase):
+    def setUp(self):
+        self.alpha = Team.objects.create(name='Alpha')
+        self.beta = Team.objects.create(name='Beta')
+        self.alpha_user = User.objects.create(
+            name='A', email='a@example.com', password='x', team_id=str(self.alpha.id)
+        )
+        self.beta_user = User.objects.create(
+            name='B', email='b@example.com', password='x', team_id=str(self.beta.id)
+        )
+
+    def post_activity(self, user, calories):
+        data = {'user_id': str(user.id), 'activity_type': 'Running', 'duration': 30, 'calories': calories}
+        response = self.client.post(reverse('activity-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def entry(self, team):
+        return Leaderboard.objects.get(team_id=str(team.id))
+
+    def test_create_applies_delta_and_reranks(self):
+        self.post_activity(self.alpha_user, 300)
+        self.post_activity(self.beta_user, 500)
+        self.assertEqual(self.entry(self.beta).rank, 1)
+        self.assertEqual(self.entry(self.alpha).rank, 2)
+
+        self.post_activity(self.alpha_user, 400)
+        alpha = self.entry(self.alpha)
+        self.assertEqual((alpha.total_calories, alpha.total_activities, alpha.rank), (700, 2, 1))
+        self.assertEqual(self.entry(self.beta).rank, 2)
+
+    def test_update_and_delete_move_totals(self):
+        activity_id = self.post_activity(self.alpha_user, 300)
+        self.post_activity(self.beta_user, 200)
+        url = reverse('activity-detail', args=[activity_id])
+
+        response = self.client.patch(url, {'calories': 100}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.entry(self.alpha).total_calories, 100)
+        self.assertEqual(self.entry(self.beta).rank, 1)
+
+        self.client.delete(url)
+        alpha = self.entry(self.alpha)
+        self.assertEqual((alpha.total_calories, alpha.total_activities, alpha.rank), (0, 0, 2))
+
+    def test_ties_share_a_rank(self):
+        self.post_activity(self.alpha_user, 300)
+        self.post_activity(self.beta_user, 300)
+        self.assertEqual(self.entry(self.alpha).rank, 1)
+        self.assertEqual(self.entry(self.beta).rank, 1)
+
+    def test_interleaved_deltas_keep_ranks_derived(self):
+        # Deltas landing in any order leave no stored rank to go stale
+        leaderboard.apply_team_deltas({str(self.alpha.id): (300, 1)})
+        leaderboard.apply_team_deltas({str(self.beta.id): (500, 1)})
+        leaderboard.apply_team_deltas({str(self.alpha.id): (400, 1), str(self.beta.id): (-100, 0)})
+        self.assertEqual((self.entry(self.alpha).rank, self.entry(self.beta).rank), (1, 2))
+
+    def test_one_entry_per_team(self):
+        self.post_activity(self.alpha_user, 300)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Leaderboard.objects.create(team_id=str(self.alpha.id))
+        self.post_activity(self.alpha_user, 200)
+        self.assertEqual(self.entry(self.alpha).total_calories, 500)
+
+    def test_rebuild_matches_incremental(self):
+        self.post_activity(self.alpha_user, 300)
+        self.post_activity(self.beta_user, 500)
+        self.post_activity(self.alpha_user, 250)
+        expected = {(e.team_id, e.total_calories, e.total_activities, e.rank) for e in Leaderboard.objects.all()}
+        leaderboard.rebuild()
+        rebuilt = {(e.team_id, e.total_calories, e.total_activities, e.rank) for e in Leaderboard.objects.all()}
+        self.assertEqual(rebuilt, expected)
+
+
+class ActivityAdminTest(OctofitAPITestCase):
+    def setUp(self):
+        self.admin = admin.site._registry[Activity]
+        self.request = RequestFactory().post('/admin/')
+        self.alpha = Team.objects.create(name='Alpha')
+        self.beta = Team.objects.create(name='Beta')
+        self.alpha_user = User.objects.create(name='A', email='a@example.com', password='x', team_id=str(self.alpha.id))
+        self.beta_user = User.objects.create(name='B', email='b@example.com', password='x', team_id=str(self.beta.id))
+
+    def save(self, activity, change):
+        self.admin.save_model(self.request, activity, None, change)
+
+    def add(self, user, calories):
+        self.save(Activity(user_id=str(user.id), activity_type='Running', duration=30, calories=calories), False)
+
+    def totals(self, team):
+        entry = Leaderboard.objects.get(team_id=str(team.id))
+        return entry.total_calories, entry.total_activities
+
+    def test_edits_keep_the_aggregates_in_step(self):
+        activity = Activity(user_id=str(self.alpha_user.id), activity_type='Running', duration=30, calories=300)
+        self.save(activity, change=False)
+        self.assertEqual(activity.team_id, str(self.alpha.id))
+        self.assertEqual(self.totals(self.alpha), (300, 1))
+
+        activity.user_id, activity.calories = str(self.beta_user.id), 200
+        self.save(activity, change=True)
+        self.assertEqual((self.totals(self.alpha), self.totals(self.beta)), ((0, 0), (200, 1)))
+        self.assertEqual(UserScore.objects.get(user_id=str(self.beta_user.id)).total_calories, 200)
+
+        self.admin.delete_model(self.request, activity)
+        self.assertEqual(self.totals(self.beta), (0, 0))
+
+    def test_bulk_delete_keeps_the_aggregates_in_step(self):
+        for calories in (100, 200):
+            self.add(self.alpha_user, calories)
+        self.add(self.beta_user, 50)
+        self.admin.delete_queryset(self.request, Activity.objects.filter(user_id=str(self.alpha_user.id)))
+        self.assertEqual((self.totals(self.alpha), self.totals(self.beta)), ((0, 0), (50, 1)))
+
+
+class TeamMembersCountTest(OctofitAPITestCase):
+    def create_teams(self, count):
+        for _ in range(count):
+            team = Team.objects.create(name=f'Team {Team.objects.count()}')
+            for member in range(2):
+                User.objects.create(
+                    name='Member', email=f'{team.id}-{member}@example.com', password='x', team_id=str(team.id)
+                )
+
+    def list_query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('team-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_members_count(self):
+        self.create_teams(2)
+        Team.objects.create(name='Empty')
+        response = self.client.get(reverse('team-list'))
+        counts = {team['name']: team['members_count'] for team in response.data}
+        self.assertEqual(counts, {'Team 0': 2, 'Team 1': 2, 'Empty': 0})
+
+    def test_query_count_constant_in_number_of_teams(self):
+        self.create_teams(2)
+        small = self.list_query_count()
+        self.create_teams(8)
+        self.assertEqual(self.list_query_count(), small)
+
+
+class LeaderboardTeamNamesTest(OctofitAPITestCase):
+    def setUp(self):
+        team_names.invalidate()
+        self.teams = [Team.objects.create(name=f'Team {n}') for n in range(5)]
+        for rank, team in enumerate(self.teams, start=1):
+            Leaderboard.objects.create(team_id=str(team.id), rank=rank)
+        Leaderboard.objects.create(team_id='unknown', rank=6)
+
+    def get_names(self):
+        response = self.client.get(reverse('leaderboard-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [entry['team_name'] for entry in response.data]
+
+    def test_names_resolved_in_one_lookup_then_cached(self):
+        with CaptureQueriesContext(connection) as queries:
+            names = self.get_names()
+        self.assertEqual(names, [f'Team {n}' for n in range(5)] + ['unknown'])
+        # Collection versions, leaderboard rows, team names
+        self.assertEqual(len(queries), 3)
+
+        # A different query string misses the response cache but not the name cache
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('leaderboard-list'), {'window': 'all'})
+        self.assertEqual(response.data[0]['team_name'], 'Team 0')
+        self.assertEqual(len(queries), 2)
+
+    def test_team_save_invalidates_cached_name(self):
+        self.get_names()
+        team = self.teams[0]
+        team.name = 'Renamed'
+        team.save()
+        self.assertEqual(self.get_names()[0], 'Renamed')
+
+
+class CursorPaginationTest(OctofitAPITestCase):
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 3)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_activities_paged_newest_first(self):
+        activities = [
+            Activity.objects.create(user_id='1', activity_type='Yoga', duration=10, calories=50)
+            for _ in range(7)
+        ]
+        ids = self.collect(reverse('activity-list') + '?page_size=3')
+        self.assertEqual(ids, [activity.id for activity in reversed(activities)])
+
+    def test_users_paged_by_id(self):
+        users = [
+            User.objects.create(name=f'U{n}', email=f'u{n}@example.com', password='x')
+            for n in range(5)
+        ]
+        ids = self.collect(reverse('user-list') + '?page_size=3')
+        self.assertEqual(ids, [user.id for user in users])
+
+    def test_page_size_is_capped(self):
+        for _ in range(3):
+            Activity.objects.create(user_id='1', activity_type='Yoga', duration=10, calories=50)
+        with mock.patch.object(ActivityCursorPagination, 'max_page_size', 2):
+            response = self.client.get(reverse('activity-list') + '?page_size=1000000')
+        self.assertEqual(len(response.data['results']), 2)
+
+
+@override_settings(OCTOFIT_BULK_CHUNK_SIZE=2)
+class ActivityBulkTest(OctofitAPITestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name='Bulk')
+        self.user = User.objects.create(name='B', email='bulk@example.com', password='x', team_id=str(self.team.id))
+        self.url = reverse('activity-bulk')
+
+    def row(self, calories):
+        return {'user_id': str(self.user.id), 'activity_type': 'Running', 'duration': 20, 'calories': calories}
+
+    def test_json_array_reports_row_errors(self):
+        rows = [self.row(100), {'activity_type': 'Running'}, self.row(200), self.row(300)]
+        with mock.patch.object(leaderboard, 'apply_team_deltas', wraps=leaderboard.apply_team_deltas) as apply:
+            response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(apply.call_count, 1)
+        entry = Leaderboard.objects.get(team_id=str(self.team.id))
+        self.assertEqual((entry.total_calories, entry.total_activities), (600, 3))
+
+    def test_ndjson_stream(self):
+        body = '\n'.join([json.dumps(self.row(100)), '{not json', '', json.dumps(self.row(50))]) + '\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertEqual(Activity.objects.count(), 2)
+
+    def test_rejects_object_body(self):
+        response = self.client.post(self.url, self.row(100), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rejects_scalar_null_and_string_bodies(self):
+        for body in ('5', 'null', '"ab"'):
+            with self.subTest(body):
+                response = self.client.post(self.url, body, content_type='application/json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(response.data['detail'], 'Expected a list of activities.')
+        self.assertEqual(Activity.objects.count(), 0)
+
+
+class PopulateDbCommandTest(TestCase):
+    def populate(self, **options):
+        call_command('populate_db', stdout=StringIO(), **options)
+        return sorted(Activity.objects.values_list('calories', 'activity_type', 'duration'))
+
+    def test_generates_requested_scale(self):
+        self.populate(teams=3, users_per_team=7, activities_per_user=5, days=10, seed=1, batch_size=4)
+        self.assertEqual(Team.objects.count(), 3)
+        self.assertEqual(User.objects.count(), 21)
+        self.assertTrue(User.objects.filter(name='Iron Man').exists())
+        self.assertTrue(3 * 21 <= Activity.objects.count() <= 7 * 21)
+        self.assertEqual(Leaderboard.objects.count(), 3)
+        oldest = Activity.objects.order_by('created_at').first().created_at
+        self.assertGreater(oldest, timezone.now() - timedelta(days=10, minutes=1))
+
+    def test_seed_is_reproducible(self):
+        self.assertEqual(self.populate(seed=42), self.populate(seed=42))
+
+
+class WindowedLeaderboardTest(OctofitAPITestCase):
+    def setUp(self):
+        team_names.invalidate()
+        self.alpha = Team.objects.create(name='Alpha')
+        self.beta = Team.objects.create(name='Beta')
+        self.alpha_user = User.objects.create(name='A', email='a@example.com', password='x', team_id=str(self.alpha.id))
+        self.beta_user = User.objects.create(name='B', email='b@example.com', password='x', team_id=str(self.beta.id))
+
+    def add_activity(self, user, calories, days_ago=0):
+        activity = Activity.objects.create(
+            user_id=str(user.id), team_id=user.team_id, activity_type='Running', duration=30, calories=calories,
+            created_at=timezone.now() - timedelta(days=days_ago),
+        )
+        record_activity_changes(added=[activity])
+        return activity
+
+    def get_window(self, window):
+        response = self.client.get(reverse('leaderboard-list'), {'window': window})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(entry['team_name'], entry['total_calories'], entry['rank']) for entry in response.data]
+
+    def test_window_sums_only_recent_buckets(self):
+        self.add_activity(self.alpha_user, 300)
+        self.add_activity(self.beta_user, 200)
+        self.add_activity(self.beta_user, 5000, days_ago=40)
+        self.assertEqual(self.get_window('day'), [('Alpha', 300, 1), ('Beta', 200, 2)])
+        self.assertEqual(self.get_window('all')[0][:2], ('Beta', 5200))
+
+    def test_delete_removes_from_bucket(self):
+        self.add_activity(self.alpha_user, 300)
+        activity = self.add_activity(self.alpha_user, 100)
+        activity.delete()
+        record_activity_changes(removed=[activity])
+        bucket = ActivityRollup.objects.get(scope=ActivityRollup.USER, owner_id=str(self.alpha_user.id))
+        self.assertEqual((bucket.total_calories, bucket.total_activities), (300, 1))
+
+    def test_rebuild_matches_incremental(self):
+        self.add_activity(self.alpha_user, 300, days_ago=3)
+        self.add_activity(self.alpha_user, 150)
+        self.add_activity(self.beta_user, 200, days_ago=10)
+        fields = ('scope', 'owner_id', 'day', 'total_calories', 'total_activities')
+        expected = set(ActivityRollup.objects.values_list(*fields))
+        rollups.rebuild(batch_size=2)
+        self.assertEqual(set(ActivityRollup.objects.values_list(*fields)), expected)
+
+    def test_rebuild_merges_with_live_writes(self):
+        self.add_activity(self.alpha_user, 300)
+        ActivityRollup.objects.create(
+            scope=ActivityRollup.TEAM, owner_id='gone', day=timezone.localdate(), total_calories=10, total_activities=1
+        )
+        team_day_totals = pipelines.team_day_totals
+
+        def totals_after_live_write():
+            # Logged while the rebuild runs, once the user buckets were read
+            self.add_activity(self.beta_user, 200)
+            yield from team_day_totals()
+
+        with mock.patch.object(pipelines, 'team_day_totals', totals_after_live_write):
+            rollups.rebuild(batch_size=1)
+        buckets = {
+            (scope, owner_id): (calories, activities)
+            for scope, owner_id, calories, activities in ActivityRollup.objects.values_list(
+                'scope', 'owner_id', 'total_calories', 'total_activities'
+            )
+        }
+        self.assertEqual(buckets, {
+            (ActivityRollup.USER, str(self.alpha_user.id)): (300, 1),
+            (ActivityRollup.USER, str(self.beta_user.id)): (200, 1),
+            (ActivityRollup.TEAM, str(self.alpha.id)): (300, 1),
+            (ActivityRollup.TEAM, str(self.beta.id)): (200, 1),
+        })
+
+    def test_unknown_window(self):
+        response = self.client.get(reverse('leaderboard-list'), {'window': 'decade'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CheckQueryPlansTest(TestCase):
+    def test_plan_stages_flattens_nested_plans(self):
+        plan = {
+            'stage': 'FETCH',
+            'inputStage': {'stage': 'OR', 'inputStages': [{'stage': 'IXSCAN'}, {'stage': 'COLLSCAN'}]},
+        }
+        self.assertEqual(plan_stages(plan), ['FETCH', 'OR', 'IXSCAN', 'COLLSCAN'])
+
+    def test_sorted_hot_queries_walk_an_index(self):
+        # MongoDB sorts from an index only if it holds the equality fields,
+        # then the sort keys, all in the sort's direction or all reversed
+        indexes = defaultdict(list)
+        for model in apps.get_models():
+            for index in model._meta.indexes:
+                indexes[model._meta.db_table].append(sort_spec(index.fields))
+        for name, collection, query, sort in HOT_QUERIES:
+            if not sort:
+                continue
+            equalities = [
+                (field, 1) for field, value in query.items()
+                if not isinstance(value, dict) or list(value) == ['$in']
+            ]
+            keys = [field for field, _ in equalities] + [field for field, _ in sort]
+            directions = [direction for _, direction in sort]
+            with self.subTest(name):
+                self.assertTrue(any(
+                    [field for field, _ in spec] == keys
+                    and [direction for _, direction in spec[len(equalities):]] in (
+                        directions, [-direction for direction in directions]
+                    )
+                    for spec in indexes[collection]
+                ))
+
+    def test_activity_queries_sort_like_the_paginator(self):
+        for name, collection, query, sort in HOT_QUERIES:
+            if collection == 'activities':
+                self.assertEqual(sort, sort_spec(ActivityCursorPagination.ordering), name)
+
+    @skipIf(connection.vendor == 'djongo', 'only meaningful on non-Mongo backends')
+    def test_requires_mongo_backend(self):
+        with self.assertRaises(CommandError):
+            call_command('check_query_plans', stdout=StringIO())
+
+
+class UserStatsTest(OctofitAPITestCase):
+    def setUp(self):
+        self.user = User.objects.create(name='S', email='stats@example.com', password='x')
+        self.url = reverse('user-stats', args=[self.user.id])
+
+    def post_activity(self, activity_type, duration, calories, distance=None):
+        data = {
+            'user_id': str(self.user.id), 'activity_type': activity_type,
+            'duration': duration, 'calories': calories, 'distance': distance,
+        }
+        response = self.client.post(reverse('activity-list'), data, format='json')
+        return response.data['id']
+
+    def test_stats_totals_and_breakdown(self):
+        self.post_activity('Running', 30, 300, 5.5)
+        self.post_activity('Running', 20, 200, 3.25)
+        activity_id = self.post_activity('Yoga', 60, 150)
+        self.client.patch(reverse('activity-detail', args=[activity_id]), {'duration': 45}, format='json')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            (response.data['total_activities'], response.data['total_minutes'],
+             response.data['total_calories'], response.data['total_distance']),
+            (3, 95, 650, 8.75),
+        )
+        self.assertEqual(response.data['by_activity_type']['Running']['total_minutes'], 50)
+        self.assertEqual(response.data['by_activity_type']['Yoga']['total_minutes'], 45)
+
+    def test_deleted_types_drop_out(self):
+        activity_id = self.post_activity('Boxing', 30, 300)
+        self.client.delete(reverse('activity-detail', args=[activity_id]))
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['by_activity_type'], {})
+        self.assertEqual(response.data['total_activities'], 0)
+
+    def test_rebuild_matches_incremental(self):
+        self.post_activity('Running', 30, 300, 5.5)
+        self.post_activity('Yoga', 60, 150)
+        expected = self.client.get(self.url).data
+        user_stats.rebuild()
+        self.assertEqual(self.client.get(self.url).data, expected)
+
+    def test_unknown_user(self):
+        response = self.client.get(reverse('user-stats', args=[self.user.id + 1]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetTest(OctofitAPITestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name='Versioned')
+        self.user = User.objects.create(name='V', email='v@example.com', password='x', team_id=str(self.team.id))
+
+    def get(self, name, **headers):
+        return self.client.get(reverse(f'{name}-list'), **headers)
+
+    def test_unchanged_list_is_not_modified(self):
+        first = self.get('leaderboard')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', first)
+        with self.assertNumQueries(1):
+            second = self.get('leaderboard', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        since = self.get('leaderboard', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_activity_write_changes_leaderboard_and_activities(self):
+        leaderboard_etag = self.get('leaderboard')['ETag']
+        activities_etag = self.get('activity')['ETag']
+        workouts_etag = self.get('workout')['ETag']
+        data = {'user_id': str(self.user.id), 'activity_type': 'Running', 'duration': 30, 'calories': 300}
+        self.client.post(reverse('activity-list'), data, format='json')
+
+        self.assertEqual(self.get('leaderboard', HTTP_IF_NONE_MATCH=leaderboard_etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get('activity', HTTP_IF_NONE_MATCH=activities_etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get('workout', HTTP_IF_NONE_MATCH=workouts_etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_member_change_invalidates_teams(self):
+        etag = self.get('team')['ETag']
+        User.objects.create(name='W', email='w@example.com', password='x', team_id=str(self.team.id))
+        self.assertEqual(self.get('team', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_windowed_copy_expires_with_its_window(self):
+        url = reverse('leaderboard-list')
+        first = self.client.get(url, {'window': 'day'})
+        self.assertEqual(
+            self.client.get(url, {'window': 'day'}, HTTP_IF_NONE_MATCH=first['ETag']).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        # No write happens overnight, yet yesterday's copy is out of date
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.localdate', return_value=tomorrow):
+            for headers in ({'HTTP_IF_NONE_MATCH': first['ETag']}, {'HTTP_IF_MODIFIED_SINCE': first['Last-Modified']}):
+                response = self.client.get(url, {'window': 'day'}, **headers)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_etag_depends_on_query(self):
+        self.assertNotEqual(
+            self.client.get(reverse('leaderboard-list'), {'window': 'week'})['ETag'],
+            self.get('leaderboard')['ETag'],
+        )
+
+
+class CachedResponseTest(OctofitAPITestCase):
+    def setUp(self):
+        self.workout = Workout.objects.create(
+            name='Plank', description='Core', difficulty='beginner', duration=5, calories_estimate=30, category='strength'
+        )
+
+    def test_list_and_detail_served_from_cache_until_write(self):
+        for url in (reverse('workout-list'), reverse('workout-detail', args=[self.workout.id])):
+            self.client.get(url)
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        self.workout.name = 'Side Plank'
+        self.workout.save()
+        response = self.client.get(reverse('workout-detail', args=[self.workout.id]))
+        self.assertEqual(response.data['name'], 'Side Plank')
+        self.assertEqual(self.client.get(reverse('workout-list')).data[0]['name'], 'Side Plank')
+
+    def test_cached_links_match_the_request_host(self):
+        for calories in (100, 200):
+            Activity.objects.create(user_id='1', activity_type='Running', duration=30, calories=calories)
+        url = reverse('activity-list')
+        etags = set()
+        for host, secure in (('localhost', False), ('127.0.0.1', False), ('localhost', True)):
+            response = self.client.get(url, {'page_size': 1}, HTTP_HOST=host, secure=secure)
+            self.assertTrue(response.data['next'].startswith(f"{'https' if secure else 'http'}://{host}/"))
+            etags.add(response['ETag'])
+        self.assertEqual(len(etags), 3)
+
+
+class ActivityExportTest(OctofitAPITestCase):
+    def setUp(self):
+        now = timezone.now()
+        for user_id, days_ago in (('1', 10), ('1', 2), ('2', 1)):
+            Activity.objects.create(
+                user_id=user_id, team_id='7' if user_id == '1' else None, activity_type='Running', duration=30,
+                calories=300, notes='with, comma', created_at=now - timedelta(days=days_ago),
+            )
+        self.url = reverse('activity-export')
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.export(format='csv'))))
+        self.assertEqual(rows[0], [
+            'id', 'user_id', 'activity_type', 'duration', 'calories', 'distance', 'notes', 'created_at', 'team_id',
+        ])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][6], 'with, comma')
+        self.assertEqual([row[8] for row in rows[1:]], ['7', '7', ''])
+
+    def test_ndjson_with_filters(self):
+        since = (timezone.now() - timedelta(days=5)).date().isoformat()
+        lines = self.export(format='ndjson', user_id='1', **{'from': since}).splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['user_id'], '1')
+
+    def test_to_date_includes_whole_day(self):
+        today = timezone.localdate().isoformat()
+        self.assertEqual(len(self.export(format='ndjson', to=today).splitlines()), 3)
+
+    def test_invalid_bound(self):
+        response = self.client.get(self.url, {'format': 'csv', 'from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(response.content.startswith(b'from,Expected an ISO 8601'))
+
+
+# Committed rows, as Django serves each ASGI request from a thread of its own
+class ActivityExportASGITest(TransactionTestCase):
+    def setUp(self):
+        for calories in (100, 200, 300):
+            Activity.objects.create(user_id='1', activity_type='Running', duration=30, calories=calories)
+
+    @mock.patch.object(exports, 'CHUNK_SIZE', 2)
+    def test_streams_under_asgi(self):
+        from octofit_tracker.asgi import application
+
+        async def scenario():
+            communicator = ApplicationCommunicator(application, {
+                'type': 'http', 'method': 'GET', 'path': reverse('activity-export'), 'query_string': b'format=csv',
+                'headers': [(b'host', b'testserver')],
+            })
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(5)
+            body = []
+            while (message := await communicator.receive_output(5)).get('more_body'):
+                body.append(message['body'])
+            body.append(message.get('body', b''))
+            return start, b''.join(body), len(body)
+
+        start, body, messages = async_to_sync(scenario)()
+        self.assertEqual(start['status'], status.HTTP_200_OK)
+        rows = list(csv.reader(StringIO(body.decode())))
+        self.assertEqual((rows[0][0], len(rows)), ('id', 4))
+        # Sent as it was read, in chunks of two rows
+        self.assertGreater(messages, 2)
+
+
+class FastListParityTest(OctofitAPITestCase):
+    def setUp(self):
+        team_names.invalidate()
+        team = Team.objects.create(name='Parity', description=None)
+        Team.objects.create(name='Empty')
+        User.objects.create(name='P', email='p@example.com', password='secret', team_id=str(team.id))
+        Activity.objects.create(user_id='1', activity_type='Swimming', duration=40, calories=320, distance=1.5)
+        Activity.objects.create(user_id='1', activity_type='Yoga', duration=30, calories=90)
+        Leaderboard.objects.create(team_id=str(team.id), total_calories=10, rank=1)
+        Leaderboard.objects.create(team_id='missing', rank=2)
+        Workout.objects.create(
+            name='Row', description='Rowing', difficulty='beginner', duration=20, calories_estimate=150, category='cardio'
+        )
+
+    def test_plan_matches_model_serializer(self):
+        for serializer_class in (UserSerializer, TeamSerializer, ActivitySerializer, LeaderboardSerializer, WorkoutSerializer):
+            with self.subTest(serializer=serializer_class.__name__):
+                model = serializer_class.Meta.model
+                plan = field_plan(serializer_class)
+                expected = serializer_class(model.objects.order_by('id'), many=True).data
+                fast = plan.render(model.objects.order_by('id').values(*plan.columns))
+                self.assertEqual(json.dumps(fast), json.dumps(expected))
+
+    def test_write_only_fields_not_fetched(self):
+        self.assertNotIn('password', field_plan(UserSerializer).columns)
+        response = self.client.get(reverse('user-list'))
+        self.assertNotIn('password', response.data['results'][0])
+
+
+class SparseFieldsetTest(OctofitAPITestCase):
+    def setUp(self):
+        team_names.invalidate()
+        self.team = Team.objects.create(name='Sparse', description='Few fields')
+        self.user = User.objects.create(
+            name='S', username='s', email='s@example.com', password='secret', team_id=str(self.team.id)
+        )
+        for calories in (100, 200, 300):
+            Activity.objects.create(user_id=str(self.user.id), activity_type='Running', duration=30, calories=calories)
+        Leaderboard.objects.create(team_id=str(self.team.id), total_calories=600, total_activities=3, rank=1)
+
+    def test_list_is_trimmed(self):
+        response = self.client.get(reverse('leaderboard-list'), {'fields': 'id,team_name,total_calories'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{'id': response.data[0]['id'], 'team_name': 'Sparse', 'total_calories': 600}])
+
+    def test_detail_is_trimmed(self):
+        response = self.client.get(reverse('team-detail', args=[self.team.id]), {'fields': 'name,members_count'})
+        self.assertEqual(response.data, {'name': 'Sparse', 'members_count': 1})
+
+    def test_window_leaderboard_is_trimmed(self):
+        response = self.client.get(reverse('leaderboard-list'), {'window': 'week', 'fields': 'team_id,rank'})
+        self.assertEqual(response.data, [{'team_id': str(self.team.id), 'rank': 1}])
+
+    def test_projection_reaches_the_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user-list'), {'fields': 'name'})
+        self.assertEqual(response.data['results'], [{'name': 'S'}])
+        select = next(query['sql'] for query in queries if 'FROM "users"' in query['sql'])
+        self.assertNotIn('"email"', select)
+        self.assertNotIn('"password"', select)
+
+    def test_write_only_field_not_fetched_on_detail(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('user-detail', args=[self.user.id]))
+        select = next(query['sql'] for query in queries if 'FROM "users"' in query['sql'])
+        self.assertNotIn('"password"', select)
+
+    def test_cursor_pagination_with_unrendered_ordering_column(self):
+        url = reverse('activity-list')
+        response = self.client.get(url, {'fields': 'calories', 'page_size': 2})
+        self.assertEqual(response.data['results'], [{'calories': 300}, {'calories': 200}])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], [{'calories': 100}])
+
+    def test_members_count_skipped_when_not_requested(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('team-list'), {'fields': 'name'})
+        self.assertFalse(any('GROUP BY' in query['sql'] for query in queries))
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('user-list'), {'fields': 'name,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', str(response.data['fields'][0]))
+
+
+class FastJSONRendererTest(TestCase):
+    data = {
+        'id': ObjectId('64b7f0c2a1b2c3d4e5f60718'),
+        'created_at': datetime(2024, 5, 1, 12, 30, 15, 250000, tzinfo=dt_timezone.utc),
+        'name': 'Ünïcode',
+        'items': [1, 2.5, None, True],
+    }
+
+    def test_matches_drf_renderer(self):
+        expected = JSONRenderer().render({**self.data, 'id': str(self.data['id'])})
+        self.assertEqual(json.loads(renderers.FastJSONRenderer().render(self.data)), json.loads(expected))
+        self.assertIn(b'"2024-05-01T12:30:15.250000Z"', renderers.FastJSONRenderer().render(self.data))
+
+    def test_stdlib_fallback(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            rendered = renderers.FastJSONRenderer().render(self.data)
+        self.assertEqual(json.loads(rendered)['id'], '64b7f0c2a1b2c3d4e5f60718')
+        self.assertEqual(json.loads(rendered)['created_at'], '2024-05-01T12:30:15.250000Z')
+
+    def test_indent_uses_stdlib(self):
+        rendered = renderers.FastJSONRenderer().render(self.data, 'application/json; indent=2')
+        self.assertTrue(rendered.startswith(b'{\n  "id"'))
+
+
+class CompressionMiddlewareTest(OctofitAPITestCase):
+    def setUp(self):
+        Activity.objects.bulk_create([
+            Activity(user_id='1', activity_type='Running', duration=30, calories=300, notes=f'Run {number}')
+            for number in range(40)
+        ])
+
+    def test_large_response_is_gzipped(self):
+        response = self.client.get(reverse('activity-list'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 40)
+
+    def test_small_response_is_not_compressed(self):
+        response = self.client.get(reverse('activity-list'), {'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_not_compressed_without_accept_encoding(self):
+        response = self.client.get(reverse('activity-list'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_streaming_export_is_gzipped(self):
+        response = self.client.get(reverse('activity-export'), {'format': 'csv'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(rows), 41)
+
+    def test_negotiation(self):
+        self.assertEqual(negotiate_encoding('gzip;q=0.5, identity'), 'gzip')
+        self.assertIsNone(negotiate_encoding('gzip;q=0'))
+        self.assertIsNone(negotiate_encoding(''))
+        self.assertEqual(negotiate_encoding('*'), 'br' if negotiate_encoding('br') else 'gzip')
+
+
+class AsyncReadTest(TestCase):
+    def test_view_runs_on_read_pool(self):
+        @api_view(['GET'])
+        def view(request):
+            return Response({'thread': threading.current_thread().name})
+
+        wrapped = async_read(view)
+        self.assertTrue(asyncio.iscoroutinefunction(wrapped))
+        response = asyncio.run(wrapped(RequestFactory().get('/')))
+        self.assertTrue(response.is_rendered)
+        self.assertTrue(json.loads(response.content)['thread'].startswith('octofit-read'))
+
+    def test_writes_are_not_offloaded(self):
+        @api_view(['POST'])
+        def view(request):
+            return Response({'thread': threading.current_thread().name})
+
+        response = async_to_sync(async_read(view))(RequestFactory().post('/'))
+        response.render()
+        self.assertFalse(json.loads(response.content)['thread'].startswith('octofit-read'))
+
+    def test_offload_wraps_named_routes_only(self):
+        from octofit_tracker.urls import router
+        patterns = offload(router.get_urls(), {'leaderboard-list'})
+        callbacks = {pattern.name: pattern.callback for pattern in patterns}
+        self.assertTrue(asyncio.iscoroutinefunction(callbacks['leaderboard-list']))
+        self.assertFalse(asyncio.iscoroutinefunction(callbacks['leaderboard-detail']))
+        self.assertFalse(asyncio.iscoroutinefunction(callbacks['user-list']))
+
+    def test_bench_client_reads_responses(self):
+        async def parse(raw):
+            reader = asyncio.StreamReader()
+            reader.feed_data(raw)
+            reader.feed_eof()
+            return await read_response(reader), reader.at_eof()
+
+        fixed = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n[]'
+        chunked = b'HTTP/1.1 304 Not Modified\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n2\r\n[]\r\n0\r\n\r\n'
+        self.assertEqual(asyncio.run(parse(fixed)), ((200, True), True))
+        self.assertEqual(asyncio.run(parse(chunked)), ((304, False), True))
+
+
+class RunBenchmarksTest(TestCase):
+    @override_settings(OCTOFIT_DASHBOARD_THREADS=0)
+    def test_records_every_endpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'baseline.json')
+            # The test database already isolates the run
+            with mock.patch.object(run_benchmarks, 'benchmark_database', nullcontext):
+                call_command('run_benchmarks', requests=2, output=output, stdout=StringIO())
+            with open(output) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        scale = baseline['scales']['1k']
+        self.assertGreater(scale['activities'], 500)
+        endpoints = scale['endpoints']
+        for url in ('/api/', '/api/dashboard/', '/api/activities/', '/api/leaderboard/?window=week',
+                    '/admin/octofit_tracker/activity/'):
+            self.assertIn(url, endpoints)
+        self.assertTrue(any(url.startswith('/api/users/') and url.endswith('/stats/') for url in endpoints))
+        for result in endpoints.values():
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertGreater(endpoints['/api/activities/']['queries'], 0)
+
+    def test_compare_flags_regressions(self):
+        def results(p95, queries):
+            return {'scales': {'1k': {'endpoints': {'/api/teams/': {'p95_ms': p95, 'queries': queries}}}}}
+
+        self.assertEqual(run_benchmarks.compare(results(10, 3), results(11, 3), 0.25), [])
+        # Relative slowdown below the absolute noise floor is ignored
+        self.assertEqual(run_benchmarks.compare(results(1, 3), results(2.5, 3), 0.25), [])
+        self.assertEqual(len(run_benchmarks.compare(results(10, 3), results(20, 3), 0.25)), 1)
+        self.assertEqual(len(run_benchmarks.compare(results(10, 3), results(10, 4), 0.25)), 1)
+
+
+class MetricsTest(OctofitAPITestCase):
+    def setUp(self):
+        team = Team.objects.create(name='Metered')
+        User.objects.create(name='M', email='m@example.com', password='secret', team_id=str(team.id))
+
+    @staticmethod
+    def series(histogram, *labels):
+        counts, total = histogram.series.get(labels, [[0], 0])
+        return sum(counts), total
+
+    def test_request_is_recorded_with_its_queries(self):
+        requests_before, queries_before = self.series(metrics.REQUEST_QUERIES, 'team-list')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('team-list'))
+        requests_after, queries_after = self.series(metrics.REQUEST_QUERIES, 'team-list')
+        self.assertEqual(requests_after - requests_before, 1)
+        self.assertEqual(queries_after - queries_before, len(queries))
+        self.assertGreater(self.series(metrics.REQUEST_DURATION, 'team-list', 'GET')[0], 0)
+
+    def test_exposition(self):
+        self.client.get(reverse('workout-list'))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE octofit_http_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'octofit_http_requests_total\{view="workout-list",method="GET",status="200"\} \d+')
+        lines = body.splitlines()
+        inf = next(line for line in lines if line.startswith(
+            'octofit_http_response_size_bytes_bucket{view="workout-list",le="+Inf"}'))
+        count = next(line for line in lines if line.startswith('octofit_http_response_size_bytes_count{view="workout-list"}'))
+        self.assertEqual(inf.split()[-1], count.split()[-1])
+
+    def test_streamed_size_is_recorded(self):
+        before = self.series(metrics.RESPONSE_SIZE, 'activity-export')
+        response = self.client.get(reverse('activity-export'), {'format': 'csv'})
+        body = b''.join(response.streaming_content)
+        after = self.series(metrics.RESPONSE_SIZE, 'activity-export')
+        self.assertEqual((after[0] - before[0], after[1] - before[1]), (1, len(body)))
+
+    def test_mongo_commands_count_towards_the_request(self):
+        queries = metrics.track_queries()
+        try:
+            event = mock.Mock(command_name='find', duration_micros=1500)
+            metrics.MongoCommandListener().succeeded(event)
+        finally:
+            metrics.stop_tracking()
+        self.assertEqual((queries.count, queries.duration), (1, 0.0015))
+        self.assertGreater(self.series(metrics.QUERY_DURATION, 'mongodb', 'find')[0], 0)
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual(metrics._labels(('view',), ('a"b\\c',)), '{view="a\\"b\\\\c"}')
+
+
+class PipelineParityTest(TestCase):
+    """Each aggregate matches the same numbers computed in Python from plain ORM reads.
+
+    On djongo this checks the native pipelines, elsewhere the ORM fallbacks.
+    """
+
+    def setUp(self):
+        self.teams = [Team.objects.create(name=name) for name in ('Red', 'Blue', 'Idle')]
+        users = [
+            User.objects.create(name=f'U{index}', email=f'u{index}@example.com', password='x', team_id=team_id)
+            for index, team_id in enumerate([str(self.teams[0].id), str(self.teams[0].id), str(self.teams[1].id), None])
+        ]
+        now = timezone.now()
+        for index, user in enumerate(users):
+            for offset, (activity_type, calories) in enumerate([('Running', 300), ('Yoga', 90), ('Running', 150)]):
+                Activity.objects.create(
+                    user_id=str(user.id), team_id=user.team_id, activity_type=activity_type,
+                    duration=30 + index, calories=calories + index,
+                    distance=2.5 if activity_type == 'Running' else None,
+                    created_at=now - timedelta(days=offset * 3 + index),
+                )
+        leaderboard.rebuild()
+        rollups.rebuild()
+        user_stats.rebuild()
+        self.activities = list(Activity.objects.all())
+        self.user_teams = {str(user.id): user.team_id for user in users if user.team_id}
+
+    def test_team_totals(self):
+        expected = {str(team.id): [0, 0] for team in self.teams}
+        for activity in self.activities:
+            team_id = self.user_teams.get(activity.user_id)
+            if team_id:
+                expected[team_id][0] += activity.calories
+                expected[team_id][1] += 1
+        self.assertEqual(pipelines.team_totals(), expected)
+
+    def test_day_totals(self):
+        expected_users, expected_teams = {}, {}
+        for activity in self.activities:
+            day = timezone.localdate(activity.created_at)
+            owners = [(expected_users, activity.user_id)]
+            if activity.team_id:
+                owners.append((expected_teams, activity.team_id))
+            for expected, owner_id in owners:
+                bucket = expected.setdefault((owner_id, day), [0, 0])
+                bucket[0] += activity.calories
+                bucket[1] += 1
+        for totals, expected in ((pipelines.user_day_totals(), expected_users),
+                                 (pipelines.team_day_totals(), expected_teams)):
+            actual = {(owner_id, day): [calories, count] for owner_id, day, calories, count in totals}
+            self.assertEqual(actual, expected)
+
+    def test_user_type_totals(self):
+        expected = {}
+        for activity in self.activities:
+            row = expected.setdefault((activity.user_id, activity.activity_type), [0, 0, 0, 0])
+            for position, value in enumerate(user_stats.activity_counters(activity)):
+                row[position] += value
+        actual = {
+            (row['user_id'], row['activity_type']): [row['activities'], row['minutes'], row['calories'], row['distance']]
+            for row in pipelines.user_type_totals()
+        }
+        self.assertEqual(actual, expected)
+
+    def test_user_totals(self):
+        expected = {}
+        for activity in self.activities:
+            row = expected.setdefault(activity.user_id, [0, 0])
+            row[0] += activity.calories
+            row[1] += 1
+        actual = {user_id: [calories, count] for user_id, calories, count in pipelines.user_totals()}
+        self.assertEqual(actual, expected)
+
+    def test_window_team_ranking(self):
+        start = rollups.window_start('week')
+        totals = {str(team.id): (0, 0) for team in self.teams}
+        for activity in self.activities:
+            team_id = self.user_teams.get(activity.user_id)
+            if team_id and timezone.localdate(activity.created_at) >= start:
+                calories, count = totals[team_id]
+                totals[team_id] = (calories + activity.calories, count + 1)
+        self.assertEqual(pipelines.window_team_ranking(start), pipelines.rank(totals))
+
+    def test_rank_ties(self):
+        ranked = pipelines.rank({'b': (10, 1), 'a': (10, 2), 'c': (5, 1), 'd': (0, 0)})
+        self.assertEqual([(row['team_id'], row['rank']) for row in ranked], [('a', 1), ('b', 1), ('c', 3), ('d', 4)])
+
+    def test_user_stats_totals(self):
+        user_id = next(iter(self.user_teams))
+        mine = [activity for activity in self.activities if activity.user_id == user_id]
+        totals, rows = pipelines.user_stats_totals(user_id)
+        self.assertEqual(totals['total_activities'], len(mine))
+        self.assertEqual(totals['total_calories'], sum(activity.calories for activity in mine))
+        self.assertEqual([row['activity_type'] for row in rows], ['Running', 'Yoga'])
+        self.assertEqual(pipelines.user_stats_totals('nobody'), (dict.fromkeys(pipelines.STATS_COUNTERS, 0), []))
+
+
+class ActivityFilterTest(OctofitAPITestCase):
+    def setUp(self):
+        self.url = reverse('activity-list')
+        red, blue = Team.objects.create(name='Red'), Team.objects.create(name='Blue')
+        self.red_users = [
+            User.objects.create(name=f'R{index}', email=f'r{index}@example.com', password='x', team_id=str(red.id))
+            for index in range(2)
+        ]
+        self.blue_user = User.objects.create(name='B', email='b@example.com', password='x', team_id=str(blue.id))
+        self.red, self.blue = red, blue
+        now = timezone.now()
+        rows = [
+            (self.red_users[0], 'Running', 30, 300, 1),
+            (self.red_users[0], 'Yoga', 60, 120, 3),
+            (self.red_users[1], 'Running', 45, 450, 5),
+            (self.blue_user, 'Cycling', 90, 700, 10),
+        ]
+        for user, activity_type, duration, calories, days_ago in rows:
+            Activity.objects.create(
+                user_id=str(user.id), team_id=user.team_id, activity_type=activity_type, duration=duration,
+                calories=calories, created_at=now - timedelta(days=days_ago),
+            )
+
+    def calories(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [row['calories'] for row in response.data['results']]
+
+    def test_indexed_filters(self):
+        self.assertEqual(self.calories(user_id=self.red_users[0].id), [300, 120])
+        self.assertEqual(self.calories(user_id=f'{self.red_users[0].id},{self.blue_user.id}'), [300, 120, 700])
+        self.assertEqual(self.calories(team_id=self.red.id), [300, 120, 450])
+        self.assertEqual(self.calories(team_id=self.red.id, user_id=self.blue_user.id), [])
+        self.assertEqual(self.calories(activity_type='Running,Cycling'), [300, 450, 700])
+        self.assertEqual(self.calories(**{'from': (timezone.now() - timedelta(days=4)).isoformat()}), [300, 120])
+        self.assertEqual(self.calories(to=(timezone.localdate() - timedelta(days=5)).isoformat()), [450, 700])
+
+    def test_residual_filters_need_an_indexed_one(self):
+        self.assertEqual(self.calories(team_id=self.red.id, min_calories=200, max_duration=40), [300])
+        response = self.client.get(self.url, {'min_calories': 200})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('min_calories', response.data)
+        response = self.client.get(self.url, {'user_id': self.blue_user.id, 'max_duration': 'long'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ordering_whitelist(self):
+        self.assertEqual(self.calories(ordering='created_at'), [700, 450, 120, 300])
+        # Orderings no index serves are ignored
+        self.assertEqual(self.calories(ordering='calories'), [300, 120, 450, 700])
+
+    def test_ascending_cursor_pages(self):
+        response = self.client.get(self.url, {'ordering': 'created_at', 'page_size': 3})
+        self.assertEqual([row['calories'] for row in response.data['results']], [700, 450, 120])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['calories'] for row in response.data['results']], [300])
+
+    def test_export_uses_the_same_filters(self):
+        response = self.client.get(reverse('activity-export'), {'format': 'ndjson', 'team_id': self.blue.id})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['calories'] for row in rows], [700])
+
+
+class ActivityTeamTagTest(OctofitAPITestCase):
+    def setUp(self):
+        self.red, self.blue = Team.objects.create(name='Red'), Team.objects.create(name='Blue')
+        self.user = User.objects.create(name='T', email='t@example.com', password='x', team_id=str(self.red.id))
+
+    def post_activity(self, calories):
+        data = {'user_id': str(self.user.id), 'activity_type': 'Running', 'duration': 30, 'calories': calories}
+        response = self.client.post(reverse('activity-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def team_totals(self):
+        return {entry.team_id: (entry.total_calories, entry.total_activities) for entry in Leaderboard.objects.all()}
+
+    def test_tagged_at_write_time(self):
+        activity = self.post_activity(300)
+        self.assertEqual(activity['team_id'], str(self.red.id))
+        url = reverse('activity-detail', args=[activity['id']])
+        response = self.client.patch(url, {'team_id': str(self.blue.id), 'calories': 200}, format='json')
+        self.assertEqual(response.data['team_id'], str(self.red.id))
+
+    def test_team_change_queues_retagging(self):
+        self.post_activity(300)
+        self.post_activity(200)
+        url = reverse('user-detail', args=[self.user.id])
+        response = self.client.patch(url, {'team_id': str(self.blue.id)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.status), ('retag_activities', Job.PENDING))
+        self.assertEqual(set(Activity.objects.values_list('team_id', flat=True)), {str(self.red.id)})
+
+        call_command('run_workers', burst=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress_done), (Job.DONE, 2))
+        self.assertEqual(set(Activity.objects.values_list('team_id', flat=True)), {str(self.blue.id)})
+        expected = {str(self.red.id): (0, 0), str(self.blue.id): (500, 2)}
+        self.assertEqual(self.team_totals(), expected)
+        bucket = ActivityRollup.objects.get(scope=ActivityRollup.TEAM, owner_id=str(self.blue.id))
+        self.assertEqual((bucket.total_calories, bucket.total_activities), (500, 2))
+
+        aggregates.retag_activities(self.user.id)
+        self.assertEqual(self.team_totals(), expected)
+        self.client.patch(url, {'name': 'Renamed'}, format='json')
+        self.assertFalse(Job.objects.filter(status=Job.PENDING).exists())
+
+
+def failing_task(message):
+    raise RuntimeError(message)
+
+
+def counting_task(total):
+    for done in range(1, total + 1):
+        jobs.progress(done, total)
+
+
+# Statuses of the queue as seen by outliving_task after its sweep
+swept_statuses = []
+
+
+def outliving_task():
+    # Silent for longer than the timeout, then sweeps for stale jobs itself
+    time.sleep(0.5)
+    jobs.requeue_stale()
+    swept_statuses[:] = Job.objects.values_list('status', flat=True)
+
+
+@override_settings(OCTOFIT_JOB_MAX_ATTEMPTS=2, OCTOFIT_JOB_RETRY_DELAY=10, OCTOFIT_JOB_TIMEOUT=60)
+@mock.patch.dict(jobs.TASKS, {
+    'fail': ('octofit_tracker.tests.failing_task', ()),
+    'count': ('octofit_tracker.tests.counting_task', ()),
+})
+class JobQueueTest(TestCase):
+    def test_identical_pending_jobs_are_merged(self):
+        first = jobs.enqueue('retag_activities', 'a')
+        self.assertEqual(jobs.enqueue('retag_activities', 'a'), first)
+        self.assertNotEqual(jobs.enqueue('retag_activities', 'b'), first)
+        self.assertEqual(jobs.work('test', burst=True), 2)
+        # A job already run does not absorb a new one
+        self.assertNotEqual(jobs.enqueue('retag_activities', 'a'), first)
+        with self.assertRaises(ValueError):
+            jobs.enqueue('unknown')
+
+    def test_failures_are_retried_with_backoff(self):
+        job = jobs.enqueue('fail', 'boom')
+        with self.assertLogs('octofit_tracker.jobs', 'ERROR'):
+            self.assertEqual(jobs.work('test', burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (Job.PENDING, 1, 'RuntimeError: boom'))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=5))
+        # Not due yet
+        self.assertEqual(jobs.work('test', burst=True), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('octofit_tracker.jobs', 'ERROR'):
+            jobs.work('test', burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_progress_is_recorded(self):
+        job = jobs.enqueue('count', 5000)
+        jobs.work('test', burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress_done, job.progress_total), (Job.DONE, 5000, 5000))
+        jobs.progress(1, 2)  # outside a job: nothing to record
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = jobs.enqueue('count', 1)
+        self.assertEqual(jobs.claim('gone'), job)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=120))
+        jobs.requeue_stale()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.PENDING, ''))
+        self.assertEqual(jobs.claim('other').attempts, 2)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=120))
+        jobs.requeue_stale()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    @override_settings(OCTOFIT_JOB_REQUEUE_INTERVAL=0)
+    def test_workers_sweep_for_stale_jobs_while_busy(self):
+        stale = jobs.enqueue('count', 1)
+        jobs.claim('gone')
+        Job.objects.filter(pk=stale.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=120))
+        jobs.enqueue('count', 2)
+        # The queue never runs dry, yet the stale job is taken over
+        self.assertEqual(jobs.work('test', burst=True), 2)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.worker, stale.attempts), (Job.DONE, 'test', 2))
+
+
+# Committed writes, as the heartbeat comes from a thread of its own
+@override_settings(OCTOFIT_JOB_TIMEOUT=0.2)
+@mock.patch.dict(jobs.TASKS, {'outlive': ('octofit_tracker.tests.outliving_task', ())})
+class JobHeartbeatTest(TransactionTestCase):
+    def test_live_worker_keeps_its_job(self):
+        job = jobs.enqueue('outlive')
+        self.assertEqual(jobs.work('test', burst=True), 1)
+        self.assertEqual(swept_statuses, [Job.RUNNING])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+        self.assertGreater(job.heartbeat_at, job.started_at)
+
+
+@override_settings(OCTOFIT_DASHBOARD_THREADS=0)
+class DashboardTest(OctofitAPITestCase):
+    def setUp(self):
+        team_names.invalidate()
+        self.url = reverse('dashboard')
+        self.teams = [Team.objects.create(name=name) for name in ('Red', 'Blue')]
+        for index, team in enumerate(self.teams):
+            user = User.objects.create(
+                name=f'D{index}', email=f'd{index}@example.com', password='secret', team_id=str(team.id)
+            )
+            Activity.objects.create(
+                user_id=str(user.id), team_id=user.team_id, activity_type='Running', duration=30,
+                calories=100 * (index + 1),
+            )
+            Leaderboard.objects.create(team_id=str(team.id), total_calories=100 * (index + 1), rank=2 - index)
+        Workout.objects.create(
+            name='Plank', description='Core', difficulty='beginner', duration=5, calories_estimate=20, category='strength'
+        )
+
+    def test_sections_match_the_list_endpoints(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        for section, url_name in (('users', 'user-list'), ('activities', 'activity-list')):
+            self.assertEqual(data[section], self.client.get(reverse(url_name)).json()['results'])
+        for section, url_name in (('teams', 'team-list'), ('leaderboard', 'leaderboard-list'),
+                                  ('workouts', 'workout-list')):
+            self.assertEqual(data[section], self.client.get(reverse(url_name)).json())
+        self.assertEqual(data['team_names'], {str(team.id): team.name for team in self.teams})
+
+    def test_team_names_looked_up_once(self):
+        params = {'include': 'users,leaderboard', 'limit': 1}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        data = response.json()
+        self.assertEqual(len(data['users']), 1)
+        self.assertEqual(data['leaderboard'][0]['team_name'], 'Blue')
+        self.assertEqual(set(data['team_names'].values()), {'Red', 'Blue'})
+        # Collection versions, users, leaderboard, team names
+        self.assertEqual(len(queries), 4)
+        response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalid_parameters(self):
+        for params in ({'include': 'users,friends'}, {'limit': 0}, {'limit': 'all'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(OCTOFIT_DASHBOARD_THREADS=2)
+    def test_runs_calls_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def call(value):
+            # Both calls must be running at once to pass the barrier
+            barrier.wait()
+            return value
+
+        self.assertEqual(dashboard.run_concurrently([lambda: call(1), lambda: call(2)]), [1, 2])
+
+
+def parse_event(body):
+    fields = dict(line.split(': ', 1) for line in body.decode().strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+@override_settings(OCTOFIT_LIVE_INTERVAL=0.05)
+class LiveLeaderboardTest(OctofitAPITestCase):
+    def setUp(self):
+        from octofit_tracker.asgi import application
+        self.application = application
+        self.alpha, self.beta = Team.objects.create(name='Alpha'), Team.objects.create(name='Beta')
+        self.alpha_user = User.objects.create(name='A', email='a@example.com', password='x', team_id=str(self.alpha.id))
+        Leaderboard.objects.create(team_id=str(self.alpha.id), rank=1)
+        Leaderboard.objects.create(team_id=str(self.beta.id), rank=1)
+
+    def post_activities(self, count, calories):
+        data = {'user_id': str(self.alpha_user.id), 'activity_type': 'Running', 'duration': 30, 'calories': calories}
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                self.client.post(reverse('activity-list'), data, format='json')
+
+    def stream(self, method='GET'):
+        return ApplicationCommunicator(self.application, {
+            'type': 'http', 'method': method, 'path': live.LIVE_PATH, 'query_string': b'', 'headers': [],
+        })
+
+    def test_burst_of_writes_is_one_diff(self):
+        async def scenario():
+            communicator = self.stream()
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(5)
+            self.assertEqual(start['status'], 200)
+            self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+            snapshot = parse_event((await communicator.receive_output(5))['body'])
+            self.assertEqual(snapshot[0], 'snapshot')
+            self.assertEqual([entry['team_name'] for entry in snapshot[1]], ['Alpha', 'Beta'])
+
+            await sync_to_async(self.post_activities)(50, 10)
+            name, changes = parse_event((await communicator.receive_output(5))['body'])
+            self.assertEqual(name, 'diff')
+            self.assertEqual(changes['removed'], [])
+            self.assertEqual(
+                [(entry['team_name'], entry['total_calories'], entry['total_activities'], entry['rank'])
+                 for entry in changes['updated']],
+                [('Alpha', 500, 50, 1), ('Beta', 0, 0, 2)],
+            )
+            # The rest of the burst was coalesced into that diff
+            self.assertTrue(await communicator.receive_nothing(0.3))
+
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(5)
+            self.assertEqual(live.get_broker().subscriptions, set())
+
+        async_to_sync(scenario)()
+
+    def test_only_get(self):
+        async def scenario():
+            communicator = self.stream('POST')
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            return await communicator.receive_output(5)
+
+        self.assertEqual(async_to_sync(scenario)()['status'], 405)
+
+    def test_lagging_client_is_resynced(self):
+        async def scenario():
+            subscription = live.Subscription(1)
+            subscription.put(b'first')
+            subscription.put(b'second')
+            self.assertTrue(subscription.lagging)
+            subscription.drain()
+            self.assertTrue(subscription.queue.empty())
+            self.assertFalse(subscription.lagging)
+
+        asyncio.run(scenario())
+
+
+# Eight buckets of 100 calories, so scores from 700 up share the last one
+@override_settings(OCTOFIT_USER_RANK_BUCKET_WIDTH=100, OCTOFIT_USER_RANK_BUCKETS=8)
+class UserRankingTest(OctofitAPITestCase):
+    CALORIES = [0, 120, 120, 250, 99, 100, 480, 710, 710, 1500, 930, 350, 120]
+
+    def setUp(self):
+        self.users = [
+            User.objects.create(name=f'R{index}', email=f'r{index}@example.com', password='x')
+            for index in range(len(self.CALORIES))
+        ]
+        for user, calories in zip(self.users, self.CALORIES):
+            # Split over two activities, so scores move through the buckets
+            for part in (calories // 2, calories - calories // 2):
+                self.post_activity(user, part)
+
+    def post_activity(self, user, calories):
+        data = {'user_id': str(user.id), 'activity_type': 'Running', 'duration': 30, 'calories': calories}
+        response = self.client.post(reverse('activity-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def expected(self):
+        """``(user_id, calories, rank)`` of every user, by sorting everyone."""
+        totals = {}
+        for activity in Activity.objects.all():
+            totals[activity.user_id] = totals.get(activity.user_id, 0) + activity.calories
+        ordered = sorted(totals.items(), key=lambda item: (item[1], item[0]), reverse=True)
+        return [(user_id, calories, 1 + sum(other > calories for other in totals.values()))
+                for user_id, calories in ordered]
+
+    def summary(self, entries):
+        return [(entry['user_id'], entry['total_calories'], entry['rank']) for entry in entries]
+
+    def test_every_page_matches_a_full_sort(self):
+        expected = self.expected()
+        for offset in range(len(expected) + 2):
+            self.assertEqual(self.summary(user_ranking.page(offset, 3)), expected[offset:offset + 3])
+
+    def test_around_centres_on_the_user(self):
+        expected = self.expected()
+        for position, (user_id, _, _) in enumerate(expected):
+            start = max(0, position - 2)
+            self.assertEqual(self.summary(user_ranking.around(user_id, 5)), expected[start:start + 5])
+
+    def test_updates_and_deletes_move_users(self):
+        activity_id = self.post_activity(self.users[0], 2000)
+        self.assertEqual(user_ranking.page(0, 1)[0]['user_id'], str(self.users[0].id))
+        url = reverse('activity-detail', args=[activity_id])
+        self.client.patch(url, {'calories': 110}, format='json')
+        self.assertEqual(self.summary(user_ranking.page(0, len(self.users))), self.expected())
+        self.client.delete(url)
+        self.assertEqual(self.summary(user_ranking.page(0, len(self.users))), self.expected())
+
+    def test_rebuild_matches_incremental(self):
+        tree = dict(UserScoreBucket.objects.filter(users__gt=0).values_list('node', 'users'))
+        expected = user_ranking.page(0, len(self.users))
+        user_ranking.rebuild(batch_size=4)
+        self.assertEqual(dict(UserScoreBucket.objects.filter(users__gt=0).values_list('node', 'users')), tree)
+        self.assertEqual(UserScoreBucket.objects.count(), 8)
+        self.assertEqual(user_ranking.page(0, len(self.users)), expected)
+
+    def test_rebuild_merges_with_live_writes(self):
+        user_totals = pipelines.user_totals
+
+        def totals_after_live_write():
+            # Logged while the rebuild runs, before the totals are read
+            self.post_activity(self.users[-1], 500)
+            yield from user_totals()
+
+        with mock.patch.object(pipelines, 'user_totals', totals_after_live_write):
+            user_ranking.rebuild(batch_size=4)
+        self.assertEqual(self.summary(user_ranking.page(0, len(self.users))), self.expected())
+
+    def test_endpoint(self):
+        url = reverse('user-leaderboard')
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        top = self.users[self.CALORIES.index(1500)]
+        self.assertEqual(response.json()[0], {
+            'user_id': str(top.id), 'name': top.name, 'team_id': None,
+            'total_calories': 1500, 'total_activities': 2, 'rank': 1,
+        })
+        response = self.client.get(url, {'around': top.id, 'limit': 3})
+        self.assertEqual([entry['rank'] for entry in response.json()], [1, 2, 3])
+        response = self.client.get(url, {'offset': 7, 'limit': 3})
+        self.assertEqual([entry['total_calories'] for entry in response.json()], [120, 120, 120])
+        self.assertEqual({entry['rank'] for entry in response.json()}, {8})
+        for params in ({'around': 'nobody'}, {'offset': '-1'}, {'limit': 0}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# Compiles querysets as djongo does, without a MongoDB server
+DJONGO = DjongoDatabaseWrapper({'ENGINE': 'djongo', 'NAME': 'octofit_db'})
+
+
+def djongo_update(queryset, **values):
+    """The ``update_many()`` arguments djongo sends for ``queryset.update(**values)``.
+
+    Raises SQLDecodeError for updates djongo cannot translate.
+    """
+    query = queryset.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    sql, params = query.get_compiler(connection=DJONGO).as_sql()
+    db = mock.MagicMock()
+    DjongoQuery(None, db, None, sql, params)
+    return db[queryset.model._meta.db_table].update_many.call_args.kwargs
+
+
+class DjongoCompatibilityTest(TestCase):
+    """The counter updates take the native path on MongoDB, as djongo cannot translate them."""
+
+    def native(self):
+        """Run as if on djongo; returns the mocks standing in for the pymongo collections, by table."""
+        collections = defaultdict(mock.MagicMock)
+        for patcher in (mock.patch.object(pipelines, 'native', return_value=True),
+                        mock.patch.object(pipelines, 'collection', lambda model: collections[model._meta.db_table])):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return collections
+
+    def test_djongo_cannot_translate_increments(self):
+        rows = CollectionVersion.objects.filter(name='users')
+        with self.assertRaises(SQLDecodeError):
+            djongo_update(rows, version=F('version') + 1)
+        self.assertEqual(djongo_update(rows, version=3), {
+            'filter': {'name': {'$eq': 'users'}}, 'update': {'$set': {'version': 3}},
+        })
+
+    def test_versions_are_bumped_with_inc(self):
+        collections = self.native()
+        versioning.bump('users')
+        update = collections['collection_versions'].update_many.call_args.args
+        self.assertEqual(update[0], {'name': 'users'})
+        self.assertEqual(update[1]['$inc'], {'version': 1})
+        self.assertEqual(set(update[1]['$set']), {'updated_at'})
+
+    def test_leaderboard_is_incremented_with_inc(self):
+        collections = self.native()
+        leaderboard.apply_team_deltas({'3': (300, 1)})
+        self.assertEqual(collections['leaderboard'].update_many.call_args.args[:2], (
+            {'team_id': '3'}, {'$inc': {'total_calories': 300, 'total_activities': 1}},
+        ))
+
+    @override_settings(OCTOFIT_USER_RANK_BUCKET_WIDTH=100, OCTOFIT_USER_RANK_BUCKETS=8)
+    def test_user_scores_and_buckets_are_incremented_with_inc(self):
+        score = UserScore.objects.create(user_id='7', total_calories=50)
+        collections = self.native()
+        collections['user_scores'].update_many.return_value.matched_count = 1
+        collections['user_score_buckets'].update_many.return_value.matched_count = 4
+        user_ranking.apply_deltas({'7': (100, 1)})
+        self.assertEqual(collections['user_scores'].update_many.call_args.args, (
+            {'id': score.pk, 'total_calories': 50},
+            {'$inc': {'total_activities': 1}, '$set': {'total_calories': 150}},
+        ))
+        # Out of slot 8 (bucket 0) into slot 7 (bucket 1)
+        self.assertEqual([call.args for call in collections['user_score_buckets'].update_many.call_args_list], [
+            ({'node': {'$in': [8]}}, {'$inc': {'users': -1}}),
+            ({'node': {'$in': [7, 8]}}, {'$inc': {'users': 1}}),
+        ])
+
+    def test_jobs_are_claimed_with_find_one_and_update(self):
+        job = Job.objects.create(name='count', status=Job.RUNNING, attempts=1)
+        collections = self.native()
+        collections['jobs'].find_one_and_update.return_value = {'id': job.pk}
+        self.assertEqual(jobs.claim('test'), job)
+        query, update = collections['jobs'].find_one_and_update.call_args.args
+        self.assertEqual(set(query), {'status', 'run_after'})
+        self.assertEqual(update['$inc'], {'attempts': 1})
+        self.assertEqual((update['$set']['status'], update['$set']['worker']), (Job.RUNNING, 'test'))
+        collections['jobs'].find_one_and_update.return_value = None
+        self.assertIsNone(jobs.claim('test'))
+
+    def test_rebuilds_update_stored_rows_and_insert_the_rest(self):
+        collections = self.native()
+        stats = collections['user_activity_stats']
+        stats.find.return_value = [{'user_id': '7', 'activity_type': 'Running'}]
+        totals = [
+            {'user_id': user_id, 'activity_type': activity_type, 'activities': 1, 'minutes': 30, 'calories': 300,
+             'distance': 0}
+            for user_id, activity_type in (('7', 'Running'), ('8', 'Yoga'))
+        ]
+        with mock.patch.object(pipelines, 'user_type_totals', lambda: iter(totals)):
+            user_stats.rebuild()
+        updates = stats.bulk_write.call_args.args[0]
+        self.assertEqual([update._filter for update in updates], [
+            {'user_id': '7', 'activity_type': 'Running'}, {'user_id': '8', 'activity_type': 'Yoga'},
+        ])
+        self.assertEqual(updates[0]._doc['$set']['total_calories'], 300)
+        # Only the row MongoDB did not hold is inserted
+        self.assertEqual(list(UserActivityStats.objects.values_list('user_id', 'activity_type')), [('8', 'Yoga')])
+
+    def test_rollups_and_stats_are_incremented_with_inc(self):
+        collections = self.native()
+        day = datetime(2024, 3, 1).date()
+        rollups.apply_deltas({(ActivityRollup.USER, '7', day): (300, 1)})
+        user_stats.apply_deltas({('7', 'Running'): (1, 30, 300, 2.5)})
+        self.assertEqual(collections['activity_rollups'].update_many.call_args.args, (
+            {'scope': ActivityRollup.USER, 'owner_id': '7', 'day': datetime(2024, 3, 1)},
+            {'$inc': {'total_calories': 300, 'total_activities': 1}},
+        ))
+        self.assertEqual(collections['user_activity_stats'].update_many.call_args.args, (
+            {'user_id': '7', 'activity_type': 'Running'},
+            {'$inc': {'total_activities': 1, 'total_minutes': 30, 'total_calories': 300, 'total_distance': 2.5}},
+        ))
@@ -14,16 +14,21 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 import os
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
+from octofit_tracker.async_reads import offload
 from octofit_tracker.views import (
     UserViewSet,
     TeamViewSet,
     ActivityViewSet,
     LeaderboardViewSet,
     WorkoutViewSet,
+    DashboardView,
+    UserLeaderboardView,
     api_root,
+    metrics_view,
 )
 
 codespace_name = os.environ.get('CODESPACE_NAME')
@@ -40,8 +45,21 @@ router.register(r'activities', ActivityViewSet)
 router.register(r'leaderboard', LeaderboardViewSet)
 router.register(r'workouts', WorkoutViewSet)
 
+api_urls = [
+    # Ahead of the router, whose leaderboard detail route would match it
+    path('leaderboard/users/', UserLeaderboardView.as_view(), name='user-leaderboard'),
+    *router.urls,
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
+]
+if settings.OCTOFIT_ASYNC_READS:
+    # Under ASGI these list routes run as coroutines backed by a bounded thread pool
+    offload(api_urls, {
+        'leaderboard-list', 'team-list', 'workout-list', 'activity-list', 'dashboard', 'user-leaderboard',
+    })
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api_root, name='api-root'),
-    path('api/', include(router.urls)),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/', include(api_urls)),
 ]
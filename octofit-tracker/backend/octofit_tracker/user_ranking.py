@@ -0,0 +1,229 @@
+"""Users ranked by all-time calories, ``GET /api/leaderboard/users/``.
+
+``UserScore`` holds each user's totals, kept current by the activity write
+hooks in ``aggregates.py``; users enter the ranking with their first
+activity. Ranking them per request would sort the whole population, so they
+are also counted per calorie bucket (``OCTOFIT_USER_RANK_BUCKET_WIDTH``
+calories wide) in a Fenwick tree stored as ``UserScoreBucket`` rows, one per
+node. Slots count down from the top bucket, so a prefix sum is the number of
+users in higher buckets. The tree finds that count, or the bucket holding
+the n-th user, by reading one node per level, and moving a user to another
+bucket updates one node per level: about ``log2(OCTOFIT_USER_RANK_BUCKETS)``
+rows either way. Within a bucket, ``user_scores_rank_idx`` does the
+counting.
+
+Ranks use standard competition ranking like the team leaderboard; users with
+equal calories are listed by descending user id. The bucket settings shape
+the tree, so changing them needs a :func:`rebuild`.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+
+from octofit_tracker import jobs, pipelines
+from octofit_tracker.models import User, UserScore, UserScoreBucket
+from octofit_tracker.rollups import increment_or_create
+
+# Matches user_scores_rank_idx read backwards
+ORDERING = ('-total_calories', '-user_id')
+
+
+def apply_deltas(deltas):
+    """Apply ``{user_id: (calories_delta, activities_delta)}`` to the scores."""
+    for user_id, (calories, activities) in deltas.items():
+        if calories or activities:
+            _apply_delta(str(user_id), calories, activities)
+
+
+def _apply_delta(user_id, calories, activities):
+    score = _get_or_create_score(user_id)
+    # Compare-and-set on the total, retried until no other writer got in
+    # between, so the bucket move below starts from the exact value this
+    # write replaced.
+    while True:
+        old_total = score.total_calories
+        new_total = old_total + calories
+        updated = pipelines.increment(
+            UserScore, {'pk': score.pk, 'total_calories': old_total}, {'total_activities': activities},
+            total_calories=new_total,
+        )
+        if updated:
+            break
+        score.refresh_from_db(fields=['total_calories'])
+
+    old_bucket, new_bucket = _bucket(old_total), _bucket(new_total)
+    if old_bucket != new_bucket:
+        _add(_slot(old_bucket), -1)
+        _add(_slot(new_bucket), 1)
+
+
+def _get_or_create_score(user_id):
+    score = UserScore.objects.filter(user_id=user_id).first()
+    if score is not None:
+        return score
+    try:
+        with transaction.atomic():
+            score = UserScore.objects.create(user_id=user_id)
+    except IntegrityError:
+        # Another writer created it first, and counted it
+        return UserScore.objects.get(user_id=user_id)
+    _add(_slot(_bucket(0)), 1)
+    return score
+
+
+def _bucket(calories):
+    return min(max(calories, 0) // settings.OCTOFIT_USER_RANK_BUCKET_WIDTH, settings.OCTOFIT_USER_RANK_BUCKETS - 1)
+
+
+def _slot(bucket):
+    return settings.OCTOFIT_USER_RANK_BUCKETS - bucket
+
+
+def _in_bucket(scores, bucket):
+    """Restrict ``scores`` to ``bucket``; the first and last buckets are open-ended."""
+    width = settings.OCTOFIT_USER_RANK_BUCKET_WIDTH
+    if bucket:
+        scores = scores.filter(total_calories__gte=bucket * width)
+    if bucket < settings.OCTOFIT_USER_RANK_BUCKETS - 1:
+        scores = scores.filter(total_calories__lt=(bucket + 1) * width)
+    return scores
+
+
+def _add(slot, delta):
+    nodes = []
+    while slot <= settings.OCTOFIT_USER_RANK_BUCKETS:
+        nodes.append(slot)
+        slot += slot & -slot
+    if pipelines.increment(UserScoreBucket, {'node__in': nodes}, {'users': delta}) < len(nodes):
+        # Nodes are missing only before the first rebuild() wrote the tree
+        existing = set(UserScoreBucket.objects.filter(node__in=nodes).values_list('node', flat=True))
+        for node in nodes:
+            if node not in existing:
+                increment_or_create(UserScoreBucket, {'node': node}, {'users': delta})
+
+
+def _prefix(slot):
+    """Users in the first ``slot`` slots, i.e. in the buckets from the top down to that slot's."""
+    nodes = []
+    while slot > 0:
+        nodes.append(slot)
+        slot -= slot & -slot
+    return sum(UserScoreBucket.objects.filter(node__in=nodes).values_list('users', flat=True))
+
+
+def _find(position):
+    """``(bucket, users of it ranked first)`` for the user at ``position``, or None past the last user."""
+    capacity = settings.OCTOFIT_USER_RANK_BUCKETS
+    # Binary lifting: the last slot whose prefix sum is still <= position
+    slot, step = 0, 1 << (capacity.bit_length() - 1)
+    while step:
+        node = slot + step
+        if node <= capacity:
+            users = UserScoreBucket.objects.filter(node=node).values_list('users', flat=True).first() or 0
+            if users <= position:
+                slot, position = node, position - users
+        step //= 2
+    if slot == capacity:
+        return None
+    return capacity - (slot + 1), position
+
+
+def count_above(calories):
+    """Number of users with more than ``calories``; their rank is this plus one."""
+    bucket = _bucket(calories)
+    higher = _in_bucket(UserScore.objects.filter(total_calories__gt=calories), bucket).count()
+    return _prefix(_slot(bucket) - 1) + higher
+
+
+def page(position, limit):
+    """``limit`` entries from ``position`` (0-based) on, in ranking order."""
+    scores = UserScore.objects.order_by(*ORDERING)
+    skip = 0
+    if position:
+        found = _find(position)
+        if found is None:
+            return []
+        bucket, skip = found
+        # Start from the top of that bucket, so only ``skip`` rows are passed over
+        if bucket < settings.OCTOFIT_USER_RANK_BUCKETS - 1:
+            scores = scores.filter(total_calories__lt=(bucket + 1) * settings.OCTOFIT_USER_RANK_BUCKET_WIDTH)
+    rows = list(scores.values('user_id', 'total_calories', 'total_activities')[skip:skip + limit])
+    return _entries(rows, position)
+
+
+def around(user_id, limit):
+    """``limit`` entries centred on the entry of ``user_id``."""
+    score = UserScore.objects.filter(user_id=str(user_id)).values_list('user_id', 'total_calories').first()
+    if score is None:
+        raise ValidationError({'around': ['No ranked user with this id; users are ranked once they log an activity.']})
+    user_id, calories = score
+    tied_first = UserScore.objects.filter(total_calories=calories, user_id__gt=user_id).count()
+    position = count_above(calories) + tied_first
+    return page(max(0, position - (limit - 1) // 2), limit)
+
+
+def requested_offset(params):
+    value = params.get('offset')
+    if not value:
+        return 0
+    try:
+        offset = int(value)
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        raise ValidationError({'offset': ['Must be a whole number, 0 or more.']})
+    return offset
+
+
+def _entries(rows, position):
+    lookup = [row['user_id'] for row in rows if row['user_id'].isdigit()]
+    users = {
+        str(pk): (name, team_id)
+        for pk, name, team_id in User.objects.filter(id__in=lookup).values_list('id', 'name', 'team_id')
+    } if lookup else {}
+    entries = []
+    for offset, row in enumerate(rows):
+        if not entries:
+            rank = count_above(row['total_calories']) + 1 if position else 1
+        elif row['total_calories'] == entries[-1]['total_calories']:
+            rank = entries[-1]['rank']
+        else:
+            rank = position + offset + 1
+        name, team_id = users.get(row['user_id'], (None, None))
+        entries.append({
+            'user_id': row['user_id'],
+            'name': name,
+            'team_id': team_id,
+            'total_calories': row['total_calories'],
+            'total_activities': row['total_activities'],
+            'rank': rank,
+        })
+    return entries
+
+
+def rebuild(batch_size=1000):
+    """Recompute every score and the bucket tree from the activities collection.
+
+    Only needed for seeding, repair and new bucket settings; regular writes
+    go through :func:`apply_deltas`. Scores are merged into the stored ones,
+    so activity writes may go on meanwhile.
+    """
+    capacity = settings.OCTOFIT_USER_RANK_BUCKETS
+    tree = [0] * (capacity + 1)
+
+    def scores():
+        for user_id, calories, activities in pipelines.user_totals():
+            tree[_slot(_bucket(calories))] += 1
+            yield UserScore(user_id=user_id, total_calories=calories, total_activities=activities)
+
+    pipelines.merge_rows(UserScore, ['user_id'], scores(), batch_size, report=jobs.progress)
+
+    # Turn the per-slot counts into Fenwick nodes in one pass
+    for node in range(1, capacity + 1):
+        parent = node + (node & -node)
+        if parent <= capacity:
+            tree[parent] += tree[node]
+    pipelines.merge_rows(
+        UserScoreBucket, ['node'], (UserScoreBucket(node=node, users=tree[node]) for node in range(1, capacity + 1)),
+        batch_size,
+    )
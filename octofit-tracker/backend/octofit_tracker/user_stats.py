@@ -0,0 +1,58 @@
+"""Per-user totals, broken down by activity type.
+
+One row per (user, activity type) is kept current by the activity write hooks
+in ``aggregates.py``, so a user's statistics are read from a handful of rows
+regardless of how long their history is.
+"""
+from octofit_tracker import jobs, pipelines
+from octofit_tracker.models import UserActivityStats
+from octofit_tracker.rollups import increment_or_create
+
+COUNTERS = pipelines.STATS_COUNTERS
+
+
+def activity_counters(activity):
+    return (1, activity.duration, activity.calories, activity.distance or 0)
+
+
+def apply_deltas(deltas):
+    """Apply ``{(user_id, activity_type): (activities, minutes, calories, distance)}``."""
+    for (user_id, activity_type), values in deltas.items():
+        if any(values):
+            increment_or_create(
+                UserActivityStats,
+                {'user_id': str(user_id), 'activity_type': activity_type},
+                dict(zip(COUNTERS, values)),
+            )
+
+
+def user_stats(user_id):
+    """Return a user's totals and their per-activity-type breakdown."""
+    totals, rows = pipelines.user_stats_totals(user_id)
+    by_type = {}
+    for row in rows:
+        activity_type = row.pop('activity_type')
+        row['total_distance'] = round(row['total_distance'], 2)
+        by_type[activity_type] = row
+    totals['total_distance'] = round(totals['total_distance'], 2)
+    return {'user_id': str(user_id), **totals, 'by_activity_type': by_type}
+
+
+def rebuild(batch_size=1000):
+    """Recompute every row from the activities collection.
+
+    Rows are merged into the stored ones in batches, so activity writes may
+    go on meanwhile.
+    """
+    stats = (
+        UserActivityStats(
+            user_id=row['user_id'],
+            activity_type=row['activity_type'],
+            total_activities=row['activities'],
+            total_minutes=row['minutes'],
+            total_calories=row['calories'],
+            total_distance=row['distance'],
+        )
+        for row in pipelines.user_type_totals()
+    )
+    pipelines.merge_rows(UserActivityStats, ['user_id', 'activity_type'], stats, batch_size, report=jobs.progress)
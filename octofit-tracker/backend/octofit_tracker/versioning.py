@@ -0,0 +1,43 @@
+"""Per-collection write counters used as cheap validators for conditional GETs.
+
+Every write to a collection bumps its counter, so a list response can be
+identified by the counters of the collections it is built from without
+running its query.
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from octofit_tracker import pipelines
+from octofit_tracker.models import CollectionVersion
+
+COLLECTIONS = ('users', 'teams', 'activities', 'leaderboard', 'workouts')
+
+
+def bump(*names):
+    now = timezone.now()
+    for name in names:
+        if pipelines.increment(CollectionVersion, {'name': name}, {'version': 1}, updated_at=now):
+            continue
+        try:
+            with transaction.atomic():
+                CollectionVersion.objects.create(name=name, version=1, updated_at=now)
+        except IntegrityError:
+            # Another writer created the counter first
+            pipelines.increment(CollectionVersion, {'name': name}, {'version': 1}, updated_at=now)
+
+
+def current(names):
+    """Return ``(versions, last_modified)`` for the given collections in one query.
+
+    ``versions`` lists the counters in the order of ``names``; collections
+    that were never written count as version 0. ``last_modified`` is the
+    latest write time, or None if none of them was written yet.
+    """
+    rows = {
+        name: (version, updated_at)
+        for name, version, updated_at in
+        CollectionVersion.objects.filter(name__in=names).values_list('name', 'version', 'updated_at')
+    }
+    versions = tuple(rows.get(name, (0, None))[0] for name in names)
+    written = [updated_at for _, updated_at in rows.values()]
+    return versions, max(written) if written else None
@@ -1,9 +1,27 @@
+import copy
 import os
-from rest_framework import viewsets
-from rest_framework.decorators import api_view
+from collections.abc import Iterator
+from datetime import datetime, time
+from itertools import islice
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from rest_framework import status, viewsets
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.reverse import reverse
+from octofit_tracker import dashboard, exports, leaderboard, metrics, rollups, user_ranking, user_stats, versioning
+from octofit_tracker.aggregates import ActivityChanges, assign_teams, record_activity_changes, user_team
+from octofit_tracker.filters import ActivityFilter, IndexedOrderingFilter, filter_activities
+from octofit_tracker.mixins import CachedResponseMixin, FastListMixin
 from octofit_tracker.models import User, Team, Activity, Leaderboard, Workout
+from octofit_tracker.pagination import ActivityCursorPagination, UserCursorPagination
+from octofit_tracker.parsers import NDJSONParser
+from octofit_tracker.renderers import CSVRenderer, NDJSONRenderer
 from octofit_tracker.serializers import (
     UserSerializer,
     TeamSerializer,
@@ -26,45 +44,191 @@ def api_root(request, format=None):
         'activities': reverse('activity-list', request=request, format=format),
         'leaderboard': reverse('leaderboard-list', request=request, format=format),
         'workouts': reverse('workout-list', request=request, format=format),
+        'dashboard': reverse('dashboard', request=request, format=format),
+        'user_leaderboard': reverse('user-leaderboard', request=request, format=format),
         'base_url': base_url,
     })
 
 
-class UserViewSet(viewsets.ModelViewSet):
+@require_GET
+def metrics_view(request):
+    """
+    Request and database metrics of this process in the Prometheus text format
+    """
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class DashboardView(CachedResponseMixin, APIView):
+    """
+    The first items of every list endpoint and the names of the teams they
+    refer to, in one response.
+
+    ``?include=users,teams`` picks the sections and ``?limit=`` caps the
+    items per section; see ``octofit_tracker.dashboard``.
+    """
+    basename = 'dashboard'
+    version_collections = versioning.COLLECTIONS
+
+    def get(self, request, format=None):
+        sections = dashboard.requested_sections(request.query_params)
+        limit = dashboard.requested_limit(request.query_params)
+        return self.conditional_response(request, lambda: Response(dashboard.build(sections, limit)))
+
+
+class UserLeaderboardView(CachedResponseMixin, APIView):
+    """
+    Users ranked by all-time calories.
+
+    The top ``?limit=`` users, from ``?offset=`` on, or the users ranked
+    around ``?around=<user_id>``; see ``octofit_tracker.user_ranking``.
+    """
+    basename = 'user-leaderboard'
+    version_collections = ('activities', 'users')
+
+    def get(self, request, format=None):
+        limit = dashboard.requested_limit(request.query_params)
+        user_id = request.query_params.get('around')
+        if user_id:
+            return self.conditional_response(request, lambda: Response(user_ranking.around(user_id, limit)))
+        offset = user_ranking.requested_offset(request.query_params)
+        return self.conditional_response(request, lambda: Response(user_ranking.page(offset, limit)))
+
+
+class UserViewSet(CachedResponseMixin, FastListMixin, viewsets.ModelViewSet):
     """
     API endpoint for users
     """
+    version_collections = ('users',)
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = UserCursorPagination
+
+    @action(detail=True)
+    def stats(self, request, pk=None):
+        """
+        Totals and per-activity-type breakdown of the user's activities
+        """
+        user = self.get_object()
+        return Response(user_stats.user_stats(user.id))
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(CachedResponseMixin, FastListMixin, viewsets.ModelViewSet):
     """
     API endpoint for teams
     """
+    version_collections = ('teams', 'users')
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(CachedResponseMixin, FastListMixin, viewsets.ModelViewSet):
     """
     API endpoint for activities
     """
+    version_collections = ('activities',)
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
+    pagination_class = ActivityCursorPagination
+    filter_backends = [ActivityFilter, IndexedOrderingFilter]
+    ordering = ActivityCursorPagination.ordering
+
+    def perform_create(self, serializer):
+        activity = serializer.save(team_id=user_team(serializer.validated_data['user_id']))
+        record_activity_changes(added=[activity])
+
+    def perform_update(self, serializer):
+        previous = copy.copy(serializer.instance)
+        user_id = serializer.validated_data.get('user_id', previous.user_id)
+        activity = serializer.save(team_id=user_team(user_id))
+        record_activity_changes(removed=[previous], added=[activity])
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        record_activity_changes(removed=[instance])
 
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Create many activities from a JSON array or an NDJSON stream.
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
+        Rows are validated and inserted in chunks; invalid rows are reported
+        by index without aborting the rest of the batch.
+        """
+        rows = request.data
+        # A JSON array, or the rows of an NDJSON stream as they are parsed
+        if not isinstance(rows, (list, Iterator)):
+            raise ParseError('Expected a list of activities.')
+        rows = enumerate(rows)
+
+        created, errors = 0, []
+        changes = ActivityChanges()
+        while chunk := list(islice(rows, settings.OCTOFIT_BULK_CHUNK_SIZE)):
+            activities = []
+            for index, row in chunk:
+                if isinstance(row, ParseError):
+                    errors.append({'index': index, 'errors': {'non_field_errors': [row.detail]}})
+                    continue
+                serializer = self.get_serializer(data=row)
+                if serializer.is_valid():
+                    activities.append(Activity(**serializer.validated_data))
+                else:
+                    errors.append({'index': index, 'errors': serializer.errors})
+            Activity.objects.bulk_create(assign_teams(activities))
+            changes.added(activities)
+            created += len(activities)
+        changes.apply()
+
+        if not errors:
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'created': created, 'errors': errors}, status=response_status)
+
+    @action(detail=False, renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """
+        Stream activities as CSV or NDJSON (``?format=csv|ndjson``),
+        optionally filtered like the list, see ``octofit_tracker.filters``.
+        """
+        rows = exports.activity_rows(filter_activities(Activity.objects.all(), request.query_params))
+        if request.accepted_renderer.format == 'ndjson':
+            stream, filename = exports.ndjson_stream(rows), 'activities.ndjson'
+        else:
+            stream, filename = exports.csv_stream(rows), 'activities.csv'
+        response = StreamingHttpResponse(stream, content_type=request.accepted_renderer.media_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class LeaderboardViewSet(CachedResponseMixin, FastListMixin, viewsets.ModelViewSet):
     """
     API endpoint for leaderboard
     """
-    queryset = Leaderboard.objects.all()
+    version_collections = ('leaderboard', 'teams')
+    queryset = Leaderboard.objects.order_by(*leaderboard.ORDERING)
     serializer_class = LeaderboardSerializer
 
+    def list(self, request, *args, **kwargs):
+        window = request.query_params.get('window', 'all')
+        if window == 'all':
+            return super().list(request, *args, **kwargs)
+        if window not in rollups.WINDOWS:
+            raise ValidationError({'window': [f"Must be one of: all, {', '.join(rollups.WINDOWS)}."]})
+        today = timezone.localdate()
+        start = rollups.window_start(window, today)
+        return self.conditional_response(
+            request,
+            lambda: Response(self.get_serializer(rollups.window_leaderboard(window, today), many=True).data),
+            period_start=timezone.make_aware(datetime.combine(start, time.min)),
+        )
+
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+class WorkoutViewSet(CachedResponseMixin, FastListMixin, viewsets.ModelViewSet):
     """
     API endpoint for workouts
     """
+    version_collections = ('workouts',)
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
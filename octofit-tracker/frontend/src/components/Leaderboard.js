@@ -2,6 +2,18 @@ import React, { useState, useEffect } from 'react';
 
 const RANK_LABELS = { 1: '🥇', 2: '🥈', 3: '🥉' };
 
+const byRank = (a, b) => a.rank - b.rank || a.id - b.id;
+
+// Apply a diff event of the live stream to the current entries
+const applyDiff = (entries, { updated, removed }) => {
+  const changed = new Map(updated.map((entry) => [entry.id, entry]));
+  const kept = entries
+    .filter((entry) => !removed.includes(entry.id))
+    .map((entry) => changed.get(entry.id) || entry);
+  const added = updated.filter((entry) => !entries.some((old) => old.id === entry.id));
+  return [...kept, ...added].sort(byRank);
+};
+
 function Leaderboard() {
   const [entries, setEntries] = useState([]);
   const [error, setError] = useState(null);
@@ -11,6 +23,8 @@ function Leaderboard() {
   const apiUrl = codespaceName
     ? `https://${codespaceName}-8000.app.github.dev/api/leaderboard/`
     : 'http://localhost:8000/api/leaderboard/';
+  // Pushes rank changes; only served when the backend runs under ASGI
+  const liveUrl = `${apiUrl}live/`;
 
   useEffect(() => {
     console.log('Leaderboard component: fetching from', apiUrl);
@@ -29,7 +43,14 @@ function Leaderboard() {
         setError(err.message);
         setLoading(false);
       });
-  }, [apiUrl]);
+
+    // Under runserver the stream answers 404 and the browser gives up on
+    // it; the fetched entries then simply stay as they are.
+    const source = new EventSource(liveUrl);
+    source.addEventListener('snapshot', (event) => setEntries(JSON.parse(event.data)));
+    source.addEventListener('diff', (event) => setEntries((current) => applyDiff(current, JSON.parse(event.data))));
+    return () => source.close();
+  }, [apiUrl, liveUrl]);
 
   if (loading) {
     return (
@@ -2,7 +2,8 @@ import React, { useState, useEffect } from 'react';
 
 function Users() {
   const [users, setUsers] = useState([]);
-  const [teams, setTeams] = useState([]);
+  const [teamNames, setTeamNames] = useState({});
+  const [teams, setTeams] = useState(null);
   const [error, setError] = useState(null);
   const [loading, setLoading] = useState(true);
   const [editingUser, setEditingUser] = useState(null);
@@ -14,18 +15,24 @@ function Users() {
   const apiUrl = codespaceName
     ? `https://${codespaceName}-8000.app.github.dev/api/users/`
     : 'http://localhost:8000/api/users/';
+  // Users with the names of their teams in one round-trip
+  const dashboardUrl = codespaceName
+    ? `https://${codespaceName}-8000.app.github.dev/api/dashboard/?include=users`
+    : 'http://localhost:8000/api/dashboard/?include=users';
+  // Every team for the edit form, not only the first page the dashboard shows
   const teamsUrl = codespaceName
-    ? `https://${codespaceName}-8000.app.github.dev/api/teams/`
-    : 'http://localhost:8000/api/teams/';
+    ? `https://${codespaceName}-8000.app.github.dev/api/teams/?fields=id,name`
+    : 'http://localhost:8000/api/teams/?fields=id,name';
 
   const fetchUsers = () => {
-    fetch(apiUrl)
+    fetch(dashboardUrl)
       .then((response) => {
         if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
         return response.json();
       })
       .then((data) => {
-        setUsers(Array.isArray(data) ? data : data.results || []);
+        setUsers(data.users || []);
+        setTeamNames(data.team_names || {});
         setLoading(false);
       })
       .catch((err) => {
@@ -34,12 +41,18 @@ function Users() {
       });
   };
 
+  const fetchTeams = () => {
+    fetch(teamsUrl)
+      .then((response) => {
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        return response.json();
+      })
+      .then((data) => setTeams(data.results || data))
+      .catch((err) => setSaveError(`Could not load teams: ${err.message}`));
+  };
+
   useEffect(() => {
     fetchUsers();
-    fetch(teamsUrl)
-      .then((r) => r.json())
-      .then((data) => setTeams(Array.isArray(data) ? data : data.results || []))
-      .catch(() => setTeams([]));
   // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
@@ -52,6 +65,8 @@ function Users() {
       team_id: user.team_id || '',
     });
     setSaveError(null);
+    // Loaded once, when first needed
+    if (teams === null) fetchTeams();
   };
 
   const closeEdit = () => {
@@ -107,10 +122,7 @@ function Users() {
     );
   }
 
-  const teamName = (id) => {
-    const t = teams.find((t) => String(t.id) === String(id));
-    return t ? t.name : id;
-  };
+  const teamName = (id) => teamNames[String(id)] || id;
 
   return (
     <div className="container mt-4 mb-4">
@@ -224,7 +236,7 @@ function Users() {
                     onChange={handleChange}
                   >
                     <option value="">— No team —</option>
-                    {teams.map((t) => (
+                    {(teams || []).map((t) => (
                       <option key={t.id} value={t.id}>{t.name}</option>
                     ))}
                   </select>